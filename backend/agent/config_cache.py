@@ -0,0 +1,138 @@
+"""
+Shared cache of resolved agent configurations.
+
+Starting a run used to resolve the agent from scratch every time: the agents
+row, then `VersionService.get_version` (an access check plus the version row),
+then `extract_agent_config`. Only the agents row can change without the
+version changing, so the resolved config is cached in Redis under
+(agent_id, current_version_id) and shared by every API and worker process:
+
+- each entry records the agents row's `updated_at`, and is treated as a miss
+  when the row has been modified since, so renames and icon changes made
+  through any code path are picked up immediately;
+- `invalidate_agent_config` drops every entry of an agent and is called when
+  the agent is updated or deleted and when its current version changes
+  (new version, activation, rollback) or is renamed;
+- concurrent misses for the same entry within a process share one load.
+
+Callers must have checked that the user may use the agent; the cache skips
+the version service's access check on hits.
+"""
+
+import asyncio
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException
+
+from services import redis
+from utils.cache import Cache
+from utils.logger import logger
+from .config_helper import extract_agent_config
+
+AGENT_CONFIG_TTL = 60 * 60
+
+_pending: Dict[str, asyncio.Task] = {}
+_suna_fingerprint: Optional[str] = None
+
+
+def _cache_key(agent_id: str, version_id: Optional[str]) -> str:
+    return f"agent_config:{agent_id}:{version_id or 'none'}"
+
+
+def _code_fingerprint() -> str:
+    """Suna agents take most of their config from SUNA_CONFIG, so entries built by another release are stale."""
+    global _suna_fingerprint
+    if _suna_fingerprint is None:
+        from agent.suna_config import SUNA_CONFIG
+        encoded = json.dumps(SUNA_CONFIG, sort_keys=True, default=str).encode()
+        _suna_fingerprint = hashlib.sha256(encoded).hexdigest()[:16]
+    return _suna_fingerprint
+
+
+async def get_agent_config(agent_data: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+    """Resolved config (the output of `extract_agent_config`) for an agents row at its current version."""
+    key = _cache_key(agent_data['agent_id'], agent_data.get('current_version_id'))
+    try:
+        cached = await Cache.get(key)
+    except Exception as e:
+        logger.warning(f"Failed to read cached agent config {key}: {e}")
+        cached = None
+
+    if (
+        cached
+        and cached.get('updated_at') == agent_data.get('updated_at')
+        and cached.get('fingerprint') == _code_fingerprint()
+    ):
+        logger.debug(f"Using cached config for agent {agent_data['agent_id']}")
+        return cached['config']
+
+    task = _pending.get(key)
+    if task is None:
+        task = asyncio.create_task(_load(key, agent_data, user_id))
+        _pending[key] = task
+        task.add_done_callback(lambda _: _pending.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def _load(key: str, agent_data: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+    agent_id = agent_data['agent_id']
+    version_id = agent_data.get('current_version_id')
+
+    version_data = None
+    if version_id:
+        try:
+            from .utils import _get_version_service
+            version_service = await _get_version_service()
+            version_obj = await version_service.get_version(
+                agent_id=agent_id,
+                version_id=version_id,
+                user_id=user_id
+            )
+            version_data = version_obj.to_dict()
+            logger.debug(f"Got version data for agent {agent_id}: {version_data.get('version_name')}")
+        except Exception as e:
+            logger.warning(f"Failed to get version data for agent {agent_id}: {e}")
+
+    agent_config = extract_agent_config(agent_data, version_data)
+
+    # Don't cache the version-less fallback of a transient version lookup failure
+    if version_data is not None or not version_id:
+        try:
+            await Cache.set(key, {
+                'updated_at': agent_data.get('updated_at'),
+                'fingerprint': _code_fingerprint(),
+                'config': agent_config,
+            }, ttl=AGENT_CONFIG_TTL)
+        except Exception as e:
+            logger.warning(f"Failed to cache agent config {key}: {e}")
+
+    return agent_config
+
+
+async def resolve_agent_config(client, account_id: str, user_id: str, agent_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Config of the account's agent (404 if it doesn't exist), or of its default agent when agent_id is None."""
+    if agent_id:
+        agent_result = await client.table('agents').select('*').eq('agent_id', agent_id).eq('account_id', account_id).execute()
+        if not agent_result.data:
+            raise HTTPException(status_code=404, detail="Agent not found or access denied")
+    else:
+        agent_result = await client.table('agents').select('*').eq('account_id', account_id).eq('is_default', True).execute()
+        if not agent_result.data:
+            logger.warning(f"No default agent found for account {account_id}")
+            return None
+
+    agent_config = await get_agent_config(agent_result.data[0], user_id)
+    logger.debug(f"Using {'agent' if agent_id else 'default agent'} {agent_config['name']} ({agent_config['agent_id']}) version {agent_config.get('version_name', 'v1')}")
+    return agent_config
+
+
+async def invalidate_agent_config(agent_id: str) -> None:
+    """Drop every cached config of the agent, whatever its version."""
+    try:
+        keys = await redis.keys(f"cache:{_cache_key(agent_id, '*')}")
+        for key in keys:
+            await redis.delete(key)
+    except Exception as e:
+        logger.warning(f"Failed to invalidate cached config for agent {agent_id}: {e}")
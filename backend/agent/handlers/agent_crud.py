@@ -14,6 +14,7 @@ from ..models import (
 from .. import utils
 from ..utils import _get_version_service, merge_custom_mcps
 from ..config_helper import build_unified_config
+from ..config_cache import invalidate_agent_config
 
 router = APIRouter()
 
@@ -320,6 +321,8 @@ async def update_agent(
                     print(f"[DEBUG] update_agent DB UPDATE ERROR: {str(e)}")
                 raise HTTPException(status_code=500, detail=f"Failed to update agent: {str(e)}")
         
+        await invalidate_agent_config(agent_id)
+        
         updated_agent = await client.table('agents').select('*').eq("agent_id", agent_id).eq("account_id", user_id).maybe_single().execute()
         
         if not updated_agent.data:
@@ -485,6 +488,8 @@ async def delete_agent(agent_id: str, user_id: str = Depends(verify_and_get_user
             logger.warning(f"No agent was deleted for agent_id: {agent_id}, user_id: {user_id}")
             raise HTTPException(status_code=403, detail="Unable to delete agent - permission denied or agent not found")
         
+        await invalidate_agent_config(agent_id)
+        
         try:
             from utils.cache import Cache
             await Cache.invalidate(f"agent_count_limit:{user_id}")
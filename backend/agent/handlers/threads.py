@@ -7,6 +7,8 @@ from fastapi import APIRouter, HTTPException, Depends, Form, Query
 
 from utils.auth_utils import verify_and_get_user_id_from_jwt, verify_and_authorize_thread_access, require_thread_access, AuthorizedThreadAccess
 from utils.logger import logger
+from utils.pagination import PaginationService, PaginationParams
+from agentpress.message_cache import thread_message_cache
 from sandbox.sandbox import create_sandbox, delete_sandbox
 
 from ..models import CreateThreadResponse, MessageCreateRequest
@@ -18,67 +20,40 @@ router = APIRouter()
 async def get_user_threads(
     user_id: str = Depends(verify_and_get_user_id_from_jwt),
     page: Optional[int] = Query(1, ge=1, description="Page number (1-based)"),
-    limit: Optional[int] = Query(1000, ge=1, le=1000, description="Number of items per page (max 1000)")
+    limit: Optional[int] = Query(1000, ge=1, le=1000, description="Number of items per page (max 1000)"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from pagination.next_cursor; takes precedence over page")
 ):
-    """Get all threads for the current user with associated project data."""
-    logger.debug(f"Fetching threads with project data for user: {user_id} (page={page}, limit={limit})")
+    """Get threads for the current user with associated project data, one page at a time."""
+    logger.debug(f"Fetching threads with project data for user: {user_id} (page={page}, limit={limit}, cursor={bool(cursor)})")
     client = await utils.db.client
     try:
-        offset = (page - 1) * limit
-        
-        # First, get threads for the user
-        threads_result = await client.table('threads').select('*').eq('account_id', user_id).order('created_at', desc=True).execute()
-        
-        if not threads_result.data:
-            logger.debug(f"No threads found for user: {user_id}")
-            return {
-                "threads": [],
-                "pagination": {
-                    "page": page,
-                    "limit": limit,
-                    "total": 0,
-                    "pages": 0
-                }
-            }
-        
-        total_count = len(threads_result.data)
-        
-        # Apply pagination to threads
-        paginated_threads = threads_result.data[offset:offset + limit]
-        
-        # Extract unique project IDs from threads that have them
-        project_ids = [
-            thread['project_id'] for thread in paginated_threads 
-            if thread.get('project_id')
-        ]
-        unique_project_ids = list(set(project_ids)) if project_ids else []
-        
-        # Fetch projects if we have project IDs
-        projects_by_id = {}
-        if unique_project_ids:
-            from utils.query_utils import batch_query_in
-            
-            projects_data = await batch_query_in(
-                client=client,
-                table_name='projects',
-                select_fields='*',
-                in_field='project_id',
-                in_values=unique_project_ids
+        pagination_params = PaginationParams(page=page, page_size=limit, cursor=cursor, max_page_size=1000)
+
+        # Only the page is fetched, with its project embedded through the project_id foreign key
+        base_query = client.table('threads').select(
+            'thread_id, project_id, metadata, is_public, created_at, updated_at, '
+            'project:projects(project_id, name, description, sandbox, is_public, created_at, updated_at)'
+        ).eq('account_id', user_id)
+        count_query = client.table('threads').select('thread_id', count='exact').eq('account_id', user_id).limit(1)
+
+        try:
+            paginated = await PaginationService.paginate_keyset_query(
+                base_query=base_query,
+                params=pagination_params,
+                sort_field='created_at',
+                id_field='thread_id',
+                desc=True,
+                count_query=count_query
             )
-            
-            logger.debug(f"[API] Retrieved {len(projects_data)} projects")
-            # Create a lookup map of projects by ID
-            projects_by_id = {
-                project['project_id']: project 
-                for project in projects_data
-            }
-        
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
         # Map threads with their associated projects
         mapped_threads = []
-        for thread in paginated_threads:
+        for thread in paginated.data:
+            project = thread.get('project')
             project_data = None
-            if thread.get('project_id') and thread['project_id'] in projects_by_id:
-                project = projects_by_id[thread['project_id']]
+            if project:
                 project_data = {
                     "project_id": project['project_id'],
                     "name": project.get('name', ''),
@@ -100,20 +75,23 @@ async def get_user_threads(
             }
             mapped_threads.append(mapped_thread)
         
-        total_pages = (total_count + limit - 1) // limit if total_count else 0
-        
-        logger.debug(f"[API] Mapped threads for frontend: {len(mapped_threads)} threads, {len(projects_by_id)} unique projects")
+        pagination = paginated.pagination
+        logger.debug(f"[API] Mapped threads for frontend: {len(mapped_threads)} threads of {pagination.total_items}")
         
         return {
             "threads": mapped_threads,
             "pagination": {
                 "page": page,
-                "limit": limit,
-                "total": total_count,
-                "pages": total_pages
+                "limit": pagination.page_size,
+                "total": pagination.total_items,
+                "pages": pagination.total_pages,
+                "has_next": pagination.has_next,
+                "next_cursor": pagination.next_cursor
             }
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching threads for user {user_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch threads: {str(e)}")
@@ -409,6 +387,9 @@ async def create_message(
         if not message_result.data:
             raise HTTPException(status_code=500, detail="Failed to create message")
         
+        # created_at comes from the API clock, so it may not sort after cached rows
+        await thread_message_cache.invalidate(thread_id)
+
         logger.debug(f"Created message: {message_result.data[0]['message_id']}")
         return message_result.data[0]
         
@@ -431,6 +412,7 @@ async def delete_message(
     try:
         # Don't allow users to delete the "status" messages
         await client.table('messages').delete().eq('message_id', message_id).eq('is_llm_message', True).eq('thread_id', thread_id).execute()
+        await thread_message_cache.invalidate(thread_id)
         return {"message": "Message deleted successfully"}
     except Exception as e:
         logger.error(f"Error deleting message {message_id} from thread {thread_id}: {str(e)}")
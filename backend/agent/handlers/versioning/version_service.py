@@ -6,6 +6,7 @@ from uuid import uuid4, UUID
 from enum import Enum
 
 from services.supabase import DBConnection
+from agent.config_cache import invalidate_agent_config
 from utils.logger import logger
 
 
@@ -137,6 +138,8 @@ class VersionService:
         
         if not result.data:
             raise Exception("Failed to update agent current version")
+        
+        await invalidate_agent_config(agent_id)
     
     def _version_from_db_row(self, row: Dict[str, Any]) -> AgentVersion:
         config = row.get('config', {})
@@ -512,6 +515,8 @@ class VersionService:
         if not result.data:
             raise Exception("Failed to update version")
         
+        await invalidate_agent_config(agent_id)
+        
         return self._version_from_db_row(result.data[0])
 
 
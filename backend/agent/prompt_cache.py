@@ -0,0 +1,194 @@
+"""
+Cached segments of the agent system prompt.
+
+The system prompt is rebuilt for every run. Most of it never changes between
+runs of the same agent, but building it used to re-read the sample response
+from disk, call the `get_agent_knowledge_base_context` RPC and re-render the
+MCP tool listing each time, and it ended with the current time to the second,
+so no two prompts shared a byte-identical prefix and provider prompt caching
+never hit.
+
+Segments are now cached by what they depend on:
+
+- the default prompt and the sample response are assembled once per process;
+- the knowledge base section is cached in Redis per agent (shared by the API,
+  which invalidates it on KB edits, and the workers, which read it); large
+  knowledge bases are searched per query instead (knowledge_base.retrieval),
+  so the section comes after the other cached segments;
+- the MCP section is cached per hash of the registered MCP tool schemas;
+- the date/time section is at hour granularity and always appended last, so
+  everything before it stays byte-stable.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+
+from agent.prompts.prompt import get_system_prompt
+from agentpress.tool import SchemaType
+from knowledge_base.retrieval import kb_indexes, KB_CONTEXT_TOKEN_BUDGET
+from utils.cache import Cache
+from utils.logger import logger
+
+KB_CONTEXT_TTL = 60 * 60
+MAX_MCP_SECTIONS = 256
+
+_mcp_sections: "OrderedDict[str, str]" = OrderedDict()
+
+
+def _kb_cache_key(agent_id: str) -> str:
+    return f"agent_kb_context:{agent_id}"
+
+
+@lru_cache(maxsize=1)
+def get_sample_response() -> str:
+    sample_response_path = os.path.join(os.path.dirname(__file__), 'prompts/samples/1.txt')
+    with open(sample_response_path, 'r') as file:
+        return file.read()
+
+
+@lru_cache(maxsize=2)
+def get_default_system_content(include_sample: bool) -> str:
+    """The default system prompt, with the sample response appended for non-Anthropic models."""
+    default_system_content = get_system_prompt()
+    if include_sample:
+        default_system_content = default_system_content + "\n\n <sample_assistant_response>" + get_sample_response() + "</sample_assistant_response>"
+    return default_system_content
+
+
+def _format_kb_section(kb_context: str) -> str:
+    return f"""
+
+                    === AGENT KNOWLEDGE BASE ===
+                    NOTICE: The following is your specialized knowledge base. This information should be considered authoritative for your responses and should take precedence over general knowledge when relevant.
+
+                    {kb_context}
+
+                    === END AGENT KNOWLEDGE BASE ===
+
+                    IMPORTANT: Always reference and utilize the knowledge base information above when it's relevant to user queries. This knowledge is specific to your role and capabilities."""
+
+
+async def get_kb_section(client, agent_id: str, query: Optional[str] = None) -> str:
+    """Knowledge base section of the agent's prompt ('' if it has none).
+
+    Knowledge bases within KB_CONTEXT_TOKEN_BUDGET are injected whole and the
+    section is cached. Larger ones are only marked as such in the cache, and
+    the chunks most relevant to the query are retrieved for every run.
+    """
+    key = _kb_cache_key(agent_id)
+    try:
+        cached = await Cache.get(key)
+        if cached is not None and not cached.get('retrieval'):
+            return cached['section']
+    except Exception as e:
+        logger.warning(f"Failed to read cached knowledge base context for agent {agent_id}: {e}")
+        cached = None
+
+    logger.debug(f"Retrieving agent knowledge base context for agent {agent_id}")
+    index = await kb_indexes.get(client, agent_id)
+    retrieval = index.total_tokens > KB_CONTEXT_TOKEN_BUDGET
+    if retrieval:
+        kb_context = await index.retrieved_context(query or "")
+    else:
+        kb_context = index.full_context()
+
+    if kb_context:
+        logger.debug(f"Found agent knowledge base context (length: {len(kb_context)} chars, retrieval: {retrieval})")
+        section = _format_kb_section(kb_context)
+    else:
+        logger.debug("No knowledge base context found for this agent")
+        section = ""
+
+    if cached is None or cached.get('retrieval') != retrieval:
+        try:
+            await Cache.set(key, {'retrieval': True} if retrieval else {'section': section}, ttl=KB_CONTEXT_TTL)
+        except Exception as e:
+            logger.warning(f"Failed to cache knowledge base context for agent {agent_id}: {e}")
+    return section
+
+
+async def invalidate_kb_section(agent_id: str) -> None:
+    """Call after any change to the agent's knowledge base entries."""
+    try:
+        await Cache.invalidate(_kb_cache_key(agent_id))
+    except Exception as e:
+        logger.warning(f"Failed to invalidate knowledge base context for agent {agent_id}: {e}")
+
+
+def _render_mcp_section(tools: list) -> str:
+    mcp_info = "\n\n--- MCP Tools Available ---\n"
+    mcp_info += "You have access to external MCP (Model Context Protocol) server tools.\n"
+    mcp_info += "MCP tools can be called directly using their native function names in the standard function calling format:\n"
+    mcp_info += '<function_calls>\n'
+    mcp_info += '<invoke name="{tool_name}">\n'
+    mcp_info += '<parameter name="param1">value1</parameter>\n'
+    mcp_info += '<parameter name="param2">value2</parameter>\n'
+    mcp_info += '</invoke>\n'
+    mcp_info += '</function_calls>\n\n'
+
+    mcp_info += "Available MCP tools:\n"
+    if tools is None:
+        mcp_info += "- Error loading MCP tool list\n"
+    else:
+        for method_name, description, param_names in tools:
+            mcp_info += f"- **{method_name}**: {description}\n"
+            if param_names:
+                mcp_info += f"  Parameters: {', '.join(param_names)}\n"
+
+    mcp_info += "\n🚨 CRITICAL MCP TOOL RESULT INSTRUCTIONS 🚨\n"
+    mcp_info += "When you use ANY MCP (Model Context Protocol) tools:\n"
+    mcp_info += "1. ALWAYS read and use the EXACT results returned by the MCP tool\n"
+    mcp_info += "2. For search tools: ONLY cite URLs, sources, and information from the actual search results\n"
+    mcp_info += "3. For any tool: Base your response entirely on the tool's output - do NOT add external information\n"
+    mcp_info += "4. DO NOT fabricate, invent, hallucinate, or make up any sources, URLs, or data\n"
+    mcp_info += "5. If you need more information, call the MCP tool again with different parameters\n"
+    mcp_info += "6. When writing reports/summaries: Reference ONLY the data from MCP tool results\n"
+    mcp_info += "7. If the MCP tool doesn't return enough information, explicitly state this limitation\n"
+    mcp_info += "8. Always double-check that every fact, URL, and reference comes from the MCP tool output\n"
+    mcp_info += "\nIMPORTANT: MCP tool results are your PRIMARY and ONLY source of truth for external data!\n"
+    mcp_info += "NEVER supplement MCP results with your training data or make assumptions beyond what the tools provide.\n"
+    return mcp_info
+
+
+def get_mcp_section(mcp_wrapper_instance) -> str:
+    """MCP tool listing for the wrapper's registered schemas, rendered once per distinct set of schemas."""
+    try:
+        tools = []
+        for method_name, schema_list in mcp_wrapper_instance.get_schemas().items():
+            for schema in schema_list:
+                if schema.schema_type == SchemaType.OPENAPI:
+                    func_info = schema.schema.get('function', {})
+                    description = func_info.get('description', 'No description available')
+                    param_names = list(func_info.get('parameters', {}).get('properties', {}).keys())
+                    tools.append((method_name, description, param_names))
+    except Exception as e:
+        logger.error(f"Error listing MCP tools: {e}")
+        tools = None
+
+    key = hashlib.sha256(json.dumps(tools, default=str).encode()).hexdigest()
+    section = _mcp_sections.get(key)
+    if section is None:
+        section = _render_mcp_section(tools)
+        _mcp_sections[key] = section
+        while len(_mcp_sections) > MAX_MCP_SECTIONS:
+            _mcp_sections.popitem(last=False)
+    _mcp_sections.move_to_end(key)
+    return section
+
+
+def get_datetime_section(now: Optional[datetime.datetime] = None) -> str:
+    """Current date and hour. Must stay the last segment of the prompt."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    datetime_info = f"\n\n=== CURRENT DATE/TIME INFORMATION ===\n"
+    datetime_info += f"Today's date: {now.strftime('%A, %B %d, %Y')}\n"
+    datetime_info += f"Current UTC time: {now.strftime('%H:00 UTC')} (to the hour)\n"
+    datetime_info += f"Current year: {now.strftime('%Y')}\n"
+    datetime_info += f"Current month: {now.strftime('%B')}\n"
+    datetime_info += f"Current day: {now.strftime('%A')}\n"
+    datetime_info += "Use this information for any time-sensitive tasks, research, or when current date/time context is needed.\n"
+    return datetime_info
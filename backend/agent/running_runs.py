@@ -0,0 +1,118 @@
+"""
+Per-account registry of running agent runs, kept in Redis.
+
+The parallel-run limit used to be checked by loading every thread of the
+account and querying agent_runs in batches of thread ids. Runs are now
+registered in a Redis hash per account (agent_run_id -> thread and start time)
+when they are created and removed when the worker finishes, so admission only
+reads one small hash. The hash is reconciled against the database every
+RECONCILE_INTERVAL_SECONDS per account, which clears entries left behind by
+workers that died without cleaning up.
+"""
+
+import json
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, List
+
+from services import redis
+from utils.logger import logger
+
+RECONCILE_INTERVAL_SECONDS = 300
+# Runs older than this do not count towards the limit
+RUNNING_WINDOW = timedelta(hours=24)
+
+
+def _runs_key(account_id: str) -> str:
+    return f"account_running_runs:{account_id}"
+
+
+def _reconciled_key(account_id: str) -> str:
+    return f"account_running_runs_reconciled:{account_id}"
+
+
+def _run_account_key(agent_run_id: str) -> str:
+    return f"agent_run_account:{agent_run_id}"
+
+
+async def register_running_run(account_id: str, agent_run_id: str, thread_id: str) -> None:
+    """Count a newly created run against the account's parallel run limit."""
+    try:
+        redis_client = await redis.get_client()
+        entry = json.dumps({"thread_id": thread_id, "started_at": datetime.now(timezone.utc).isoformat()})
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(_runs_key(account_id), agent_run_id, entry)
+            pipe.expire(_runs_key(account_id), redis.REDIS_KEY_TTL)
+            pipe.set(_run_account_key(agent_run_id), account_id, ex=redis.REDIS_KEY_TTL)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to register running agent run {agent_run_id} for account {account_id}: {e}")
+
+
+async def unregister_running_run(agent_run_id: str) -> None:
+    """Stop counting a run. Safe to call more than once."""
+    try:
+        redis_client = await redis.get_client()
+        account_id = await redis_client.get(_run_account_key(agent_run_id))
+        if not account_id:
+            return
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.hdel(_runs_key(account_id), agent_run_id)
+            pipe.delete(_run_account_key(agent_run_id))
+            await pipe.execute()
+        logger.debug(f"Unregistered running agent run {agent_run_id} for account {account_id}")
+    except Exception as e:
+        logger.warning(f"Failed to unregister running agent run {agent_run_id}: {e}")
+
+
+async def get_running_runs(client, account_id: str) -> List[Dict[str, Any]]:
+    """Running runs of the account started within the running window.
+
+    Each item has 'id', 'thread_id' and 'started_at'. Reconciles with the
+    database first if the account was not reconciled recently.
+    """
+    redis_client = await redis.get_client()
+    if not await redis_client.exists(_reconciled_key(account_id)):
+        await reconcile_running_runs(client, account_id)
+
+    entries = await redis_client.hgetall(_runs_key(account_id))
+    cutoff = datetime.now(timezone.utc) - RUNNING_WINDOW
+    runs = []
+    for agent_run_id, raw in entries.items():
+        entry = json.loads(raw)
+        if datetime.fromisoformat(entry['started_at']) >= cutoff:
+            runs.append({"id": agent_run_id, **entry})
+    return runs
+
+
+async def reconcile_running_runs(client, account_id: str) -> None:
+    """Rebuild the account's hash from the agent_runs table.
+
+    Entries registered after the reconciliation started are kept even if the
+    database read missed them.
+    """
+    started = datetime.now(timezone.utc)
+    cutoff = (started - RUNNING_WINDOW).isoformat()
+    result = await client.table('agent_runs').select(
+        'id, thread_id, started_at, threads!inner(account_id)'
+    ).eq('threads.account_id', account_id).eq('status', 'running').gte('started_at', cutoff).execute()
+    db_runs = {run['id']: run for run in result.data or []}
+
+    redis_client = await redis.get_client()
+    key = _runs_key(account_id)
+    current = await redis_client.hgetall(key)
+    stale = [
+        agent_run_id for agent_run_id, raw in current.items()
+        if agent_run_id not in db_runs and datetime.fromisoformat(json.loads(raw)['started_at']) < started
+    ]
+
+    async with redis_client.pipeline(transaction=True) as pipe:
+        if stale:
+            pipe.hdel(key, *stale)
+        for agent_run_id, run in db_runs.items():
+            pipe.hset(key, agent_run_id, json.dumps({"thread_id": run['thread_id'], "started_at": run['started_at']}))
+            pipe.set(_run_account_key(agent_run_id), account_id, ex=redis.REDIS_KEY_TTL)
+        pipe.expire(key, redis.REDIS_KEY_TTL)
+        pipe.set(_reconciled_key(account_id), started.isoformat(), ex=RECONCILE_INTERVAL_SECONDS)
+        await pipe.execute()
+
+    logger.debug(f"Reconciled running agent runs for account {account_id}: {len(db_runs)} running, {len(stale)} stale removed")
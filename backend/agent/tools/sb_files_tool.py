@@ -1,5 +1,6 @@
 from agentpress.tool import ToolResult, openapi_schema, usage_example
 from sandbox.tool_base import SandboxToolsBase
+from sandbox.workspace_snapshot import get_workspace_snapshotter
 from utils.files_utils import should_exclude_file, clean_path
 from agentpress.thread_manager import ThreadManager
 from utils.logger import logger
@@ -36,33 +37,28 @@ class SandboxFilesTool(SandboxToolsBase):
             return False
 
     async def get_workspace_state(self) -> dict:
-        """Get the current workspace state by reading all files"""
+        """Get the current workspace state by reading all text files.
+
+        Uses a bulk snapshot whose manifest is kept between calls, so only files
+        changed since the previous call are transferred. Files above the
+        snapshot size limit and binary files are left out.
+        """
         files_state = {}
         try:
             # Ensure sandbox is initialized
             await self._ensure_sandbox()
             
-            files = await self.sandbox.fs.list_files(self.workspace_path)
-            for file_info in files:
-                rel_path = file_info.name
-                
-                # Skip excluded files and directories
-                if self._should_exclude_file(rel_path) or file_info.is_dir:
+            manifest = await get_workspace_snapshotter(self.sandbox, self.workspace_path).snapshot()
+            for rel_path, entry in manifest.items():
+                if entry.content is None:
                     continue
-
-                try:
-                    full_path = f"{self.workspace_path}/{rel_path}"
-                    content = (await self.sandbox.fs.download_file(full_path)).decode()
-                    files_state[rel_path] = {
-                        "content": content,
-                        "is_dir": file_info.is_dir,
-                        "size": file_info.size,
-                        "modified": file_info.mod_time
-                    }
-                except Exception as e:
-                    print(f"Error reading file {rel_path}: {e}")
-                except UnicodeDecodeError:
-                    print(f"Skipping binary file: {rel_path}")
+                files_state[rel_path] = {
+                    "content": entry.content,
+                    "is_dir": False,
+                    "size": entry.size,
+                    "modified": entry.mtime,
+                    "sha256": entry.sha256
+                }
 
             return files_state
         
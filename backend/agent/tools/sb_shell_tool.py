@@ -1,12 +1,24 @@
-import asyncio
+import re
 from typing import Optional, Dict, Any
-import time
-import asyncio
 from uuid import uuid4
 from agentpress.tool import ToolResult, openapi_schema, usage_example
 from sandbox.tool_base import SandboxToolsBase
 from agentpress.thread_manager import ThreadManager
 
+# Pane output of every tmux session is appended to a log file in this directory,
+# so output can be read incrementally instead of dumping the whole scrollback
+SESSION_LOG_DIR = "/tmp/sb_shell_logs"
+# Maximum bytes of output returned by a single call
+MAX_OUTPUT_BYTES = 64 * 1024
+# Reading a session log larger than this starts it over, after returning its tail
+SESSION_LOG_ROTATE_BYTES = 4 * MAX_OUTPUT_BYTES
+# Hard cap on a session log, for sessions whose output is never read (e.g. dev servers);
+# output past it is only in the pane scrollback until the next read starts the log over
+SESSION_LOG_MAX_BYTES = 16 * MAX_OUTPUT_BYTES
+
+_ANSI_ESCAPE = re.compile(r'\x1b\[[0-?]*[ -/]*[@-~]|\x1b\][^\x07]*\x07|\x1b[()][A-Za-z0-9]')
+
+
 class SandboxShellTool(SandboxToolsBase):
     """Tool for executing tasks in a Daytona sandbox with browser-use capabilities. 
     Uses sessions for maintaining state between commands and provides comprehensive process management."""
@@ -14,6 +26,7 @@ class SandboxShellTool(SandboxToolsBase):
     def __init__(self, project_id: str, thread_manager: ThreadManager):
         super().__init__(project_id, thread_manager)
         self._sessions: Dict[str, str] = {}  # Maps session names to session IDs
+        self._output_offsets: Dict[str, int] = {}  # Maps tmux session names to bytes of output already returned
         self.workspace_path = "/workspace"  # Ensure we're always operating in /workspace
 
     async def _ensure_session(self, session_name: str = "default") -> str:
@@ -121,61 +134,51 @@ class SandboxShellTool(SandboxToolsBase):
             if not session_name:
                 session_name = f"session_{str(uuid4())[:8]}"
             
-            # Check if tmux session already exists
-            check_session = await self._execute_raw_command(f"tmux has-session -t {session_name} 2>/dev/null || echo 'not_exists'")
-            session_exists = "not_exists" not in check_session.get("output", "")
-            
-            if not session_exists:
-                # Create a new tmux session with the specified working directory
-                await self._execute_raw_command(f"tmux new-session -d -s {session_name} -c {cwd}")
+            # Create the tmux session with the specified working directory if it does not exist yet
+            await self._ensure_tmux_session(session_name, cwd)
             
             # Escape double quotes for the command
             wrapped_command = command.replace('"', '\\"')
             
             if blocking:
-                # For blocking execution, use a more reliable approach
-                # Add a unique marker to detect command completion
+                # Signal a tmux wait-for channel when the command exits and wait on
+                # that channel, instead of polling the pane for a completion marker
                 marker = f"COMMAND_DONE_{str(uuid4())[:8]}"
-                completion_command = self._format_completion_command(command, marker)
+                exit_code_file = f"{SESSION_LOG_DIR}/{marker}.exit"
+                completion_command = self._format_completion_command(command, marker, exit_code_file)
                 wrapped_completion_command = completion_command.replace('"', '\\"')
                 
-                # Send the command with completion marker
+                # Send the command with completion signal
                 await self._execute_raw_command(f'tmux send-keys -t {session_name} "{wrapped_completion_command}" Enter')
                 
-                start_time = time.time()
-                final_output = ""
+                wait_result = await self._execute_raw_command(
+                    f"if timeout {timeout} tmux wait-for {marker}; then echo \"{marker} $(cat {exit_code_file} 2>/dev/null)\"; fi; "
+                    f"rm -f {exit_code_file}",
+                    timeout=timeout + 10
+                )
+                # The marker is only echoed when the command signalled completion in time
+                _, signalled, exit_code = (wait_result.get("output") or "").partition(marker)
+                completed = bool(signalled)
+                exit_code = exit_code.strip()
                 
-                while (time.time() - start_time) < timeout:
-                    # Wait a shorter interval for more responsive checking
-                    await asyncio.sleep(0.5)
-                    
-                    # Check if session still exists (command might have exited)
-                    check_result = await self._execute_raw_command(f"tmux has-session -t {session_name} 2>/dev/null || echo 'ended'")
-                    if "ended" in check_result.get("output", ""):
-                        break
-                        
-                    # Get current output and check for our completion marker
-                    output_result = await self._execute_raw_command(f"tmux capture-pane -t {session_name} -p -S - -E -")
-                    current_output = output_result.get("output", "")
-
-                    if self._is_command_completed(current_output, marker):
-                        final_output = current_output
-                        break
-                
-                # If we didn't get the marker, capture whatever output we have
-                if not final_output:
-                    output_result = await self._execute_raw_command(f"tmux capture-pane -t {session_name} -p -S - -E -")
-                    final_output = output_result.get("output", "")
+                output, truncated = await self._read_session_output(session_name, tail=True)
                 
                 # Kill the session after capture
-                await self._execute_raw_command(f"tmux kill-session -t {session_name}")
+                await self._kill_tmux_session(session_name)
                 
-                return self.success_response({
-                    "output": final_output,
+                response = {
+                    "output": output,
                     "session_name": session_name,
                     "cwd": cwd,
-                    "completed": True
-                })
+                    "completed": completed
+                }
+                if exit_code.isdigit():
+                    response["exit_code"] = int(exit_code)
+                if not completed:
+                    response["message"] = f"Command did not finish within {timeout} seconds and was terminated."
+                if truncated:
+                    response["truncated"] = True
+                return self.success_response(response)
             else:
                 # Send command to tmux session for non-blocking execution
                 await self._execute_raw_command(f'tmux send-keys -t {session_name} "{wrapped_command}" Enter')
@@ -192,12 +195,12 @@ class SandboxShellTool(SandboxToolsBase):
             # Attempt to clean up session in case of error
             if session_name:
                 try:
-                    await self._execute_raw_command(f"tmux kill-session -t {session_name}")
+                    await self._kill_tmux_session(session_name)
                 except:
                     pass
             return self.fail_response(f"Error executing command: {str(e)}")
 
-    async def _execute_raw_command(self, command: str) -> Dict[str, Any]:
+    async def _execute_raw_command(self, command: str, timeout: int = 30) -> Dict[str, Any]:
         """Execute a raw command directly in the sandbox."""
         # Ensure session exists for raw commands
         session_id = await self._ensure_session("raw_commands")
@@ -213,7 +216,7 @@ class SandboxShellTool(SandboxToolsBase):
         response = await self.sandbox.process.execute_session_command(
             session_id=session_id,
             req=req,
-            timeout=30  # Short timeout for utility commands
+            timeout=timeout  # Short timeout for utility commands unless waiting on a command
         )
         
         logs = await self.sandbox.process.get_session_command_logs(
@@ -226,11 +229,80 @@ class SandboxShellTool(SandboxToolsBase):
             "exit_code": response.exit_code
         }
 
+    def _session_log_file(self, session_name: str) -> str:
+        return f"{SESSION_LOG_DIR}/{session_name}.log"
+
+    def _pipe_pane_command(self, session_name: str) -> str:
+        # Unbuffered, so output reaches the log as it is produced; tmux stops piping once head exits
+        return f"tmux pipe-pane -t {session_name} -o 'stdbuf -o0 head -c {SESSION_LOG_MAX_BYTES} >> {self._session_log_file(session_name)}'"
+
+    async def _ensure_tmux_session(self, session_name: str, cwd: str) -> None:
+        """Create the tmux session if needed, with its pane output piped to the session log file."""
+        log_file = self._session_log_file(session_name)
+        await self._execute_raw_command(
+            f"tmux has-session -t {session_name} 2>/dev/null || "
+            f"(mkdir -p {SESSION_LOG_DIR} && rm -f {log_file} && "
+            f"tmux new-session -d -s {session_name} -c {cwd} && "
+            f"{self._pipe_pane_command(session_name)})"
+        )
+
+    async def _kill_tmux_session(self, session_name: str) -> None:
+        self._output_offsets.pop(session_name, None)
+        await self._execute_raw_command(
+            f"tmux kill-session -t {session_name} 2>/dev/null; rm -f {self._session_log_file(session_name)}"
+        )
+
+    async def _read_session_output(self, session_name: str, tail: bool = False) -> tuple[str, bool]:
+        """Read session output in a single sandbox call.
+
+        By default only output produced since the previous read is transferred;
+        with tail=True the output is read from the start. At most
+        MAX_OUTPUT_BYTES are returned, keeping the most recent output. Sessions
+        without a log file (created elsewhere) fall back to the pane scrollback.
+
+        A log over SESSION_LOG_ROTATE_BYTES is emptied after it is read, with
+        the pane pipe paused meanwhile, so the log of a long-running session
+        stays bounded. If it reached SESSION_LOG_MAX_BYTES its newest output
+        was never logged, and the tail of the pane scrollback is returned.
+
+        Returns the output and whether it was truncated.
+        """
+        log_file = self._session_log_file(session_name)
+        offset = 0 if tail else self._output_offsets.get(session_name, 0)
+        result = await self._execute_raw_command(
+            f"if [ -f {log_file} ]; then "
+            f"rotate=0; [ $(wc -c < {log_file}) -ge {SESSION_LOG_ROTATE_BYTES} ] && rotate=1 && tmux pipe-pane -t {session_name}; "
+            f"size=$(wc -c < {log_file}); start=$(( size - {MAX_OUTPUT_BYTES} )); "
+            f"[ $start -lt {offset} ] && start={offset}; [ $start -gt $size ] && start=$size; "
+            f"echo \"$size $start $rotate\"; "
+            f"if [ $size -ge {SESSION_LOG_MAX_BYTES} ]; then tmux capture-pane -t {session_name} -p -S - -E - | tail -c {MAX_OUTPUT_BYTES}; "
+            f"else tail -c +$(( start + 1 )) {log_file} | head -c $(( size - start )); fi; "
+            f"if [ $rotate = 1 ]; then : > {log_file}; {self._pipe_pane_command(session_name)}; fi; "
+            f"else echo '-1 0 0'; tmux capture-pane -t {session_name} -p -S - -E - | tail -c {MAX_OUTPUT_BYTES}; fi"
+        )
+        header, _, output = (result.get("output") or "").partition("\n")
+        try:
+            size, start, rotated = (int(value) for value in header.split())
+        except ValueError:
+            return result.get("output") or "", False
+        if size < 0:
+            return output, False
+
+        # Offsets count bytes of the current log, which starts over when rotated
+        self._output_offsets[session_name] = 0 if rotated else size
+        return self._clean_terminal_output(output), start > offset or size >= SESSION_LOG_MAX_BYTES
+
+    @staticmethod
+    def _clean_terminal_output(output: str) -> str:
+        """Strip terminal control sequences from raw pane output."""
+        output = _ANSI_ESCAPE.sub('', output)
+        return output.replace('\r\n', '\n').replace('\r', '\n')
+
     @openapi_schema({
         "type": "function",
         "function": {
             "name": "check_command_output",
-            "description": "Check the output of a previously executed command in a tmux session. Use this to monitor the progress or results of non-blocking commands.",
+            "description": "Check the output of a previously executed command in a tmux session. Use this to monitor the progress or results of non-blocking commands. Returns only the output produced since the previous check unless tail is set; long output is truncated to the most recent part.",
             "parameters": {
                 "type": "object",
                 "properties": {
@@ -242,6 +314,11 @@ class SandboxShellTool(SandboxToolsBase):
                         "type": "boolean",
                         "description": "Whether to terminate the tmux session after checking. Set to true when you're done with the command.",
                         "default": False
+                    },
+                    "tail": {
+                        "type": "boolean",
+                        "description": "Return the most recent output from the start of the session instead of only the output produced since the previous check.",
+                        "default": False
                     }
                 },
                 "required": ["session_name"]
@@ -266,7 +343,8 @@ class SandboxShellTool(SandboxToolsBase):
     async def check_command_output(
         self,
         session_name: str,
-        kill_session: bool = False
+        kill_session: bool = False,
+        tail: bool = False
     ) -> ToolResult:
         try:
             # Ensure sandbox is initialized
@@ -277,22 +355,24 @@ class SandboxShellTool(SandboxToolsBase):
             if "not_exists" in check_result.get("output", ""):
                 return self.fail_response(f"Tmux session '{session_name}' does not exist.")
             
-            # Get output from tmux pane
-            output_result = await self._execute_raw_command(f"tmux capture-pane -t {session_name} -p -S - -E -")
-            output = output_result.get("output", "")
+            # Get output produced since the previous check
+            output, truncated = await self._read_session_output(session_name, tail=tail)
             
             # Kill session if requested
             if kill_session:
-                await self._execute_raw_command(f"tmux kill-session -t {session_name}")
+                await self._kill_tmux_session(session_name)
                 termination_status = "Session terminated."
             else:
                 termination_status = "Session still running."
             
-            return self.success_response({
+            response = {
                 "output": output,
                 "session_name": session_name,
                 "status": termination_status
-            })
+            }
+            if truncated:
+                response["truncated"] = True
+            return self.success_response(response)
                 
         except Exception as e:
             return self.fail_response(f"Error checking command output: {str(e)}")
@@ -335,7 +415,7 @@ class SandboxShellTool(SandboxToolsBase):
                 return self.fail_response(f"Tmux session '{session_name}' does not exist.")
             
             # Kill the session
-            await self._execute_raw_command(f"tmux kill-session -t {session_name}")
+            await self._kill_tmux_session(session_name)
             
             return self.success_response({
                 "message": f"Tmux session '{session_name}' terminated successfully."
@@ -393,97 +473,22 @@ class SandboxShellTool(SandboxToolsBase):
         except Exception as e:
             return self.fail_response(f"Error listing commands: {str(e)}")
 
-    def _format_completion_command(self, command: str, marker: str) -> str:
-        """Format command with completion marker, handling heredocs properly."""
-        import re
-        
+    def _format_completion_command(self, command: str, marker: str, exit_code_file: str) -> str:
+        """Format command to record its exit code and signal the marker channel, handling heredocs properly."""
+        # $ is escaped because the command is sent through a double-quoted tmux send-keys argument
+        completion = f"echo \\$? > {exit_code_file}; tmux wait-for -S {marker}"
+
         # Check if command contains heredoc syntax
         # Look for patterns like: << EOF, << 'EOF', << "EOF", <<EOF
         heredoc_pattern = r'<<\s*[\'"]?\w+[\'"]?'
         
         if re.search(heredoc_pattern, command):
-            # For heredoc commands, add the completion marker on a new line
+            # For heredoc commands, add the completion signal on a new line
             # This ensures it executes after the heredoc completes
-            return f"{command}\necho {marker}"
+            return f"{command}\n{completion}"
         else:
             # For regular commands, use semicolon separator
-            return f"{command} ; echo {marker}"
-
-    def _is_command_completed(self, current_output: str, marker: str) -> bool:
-        """
-        Check if command execution is completed by comparing marker from end to start.
-        
-        Args:
-            current_output: Current output content
-            marker: Completion marker
-            
-        Returns:
-            bool: True if command completed, False otherwise
-        """
-        if not current_output or not marker:
-            return False
-
-        # Find the last complete marker match position to start comparison
-        # Avoid terminal prompt output at the end
-        marker_end_pos = -1
-        for i in range(len(current_output) - len(marker), -1, -1):
-            if current_output[i:i+len(marker)] == marker:
-                marker_end_pos = i + len(marker) - 1
-                break
-        
-        # Start comparison from found marker position or end of output
-        if marker_end_pos != -1:
-            output_idx = marker_end_pos
-            marker_idx = len(marker) - 1
-        else:
-            output_idx = len(current_output) - 1
-            marker_idx = len(marker) - 1
-        
-        # Compare characters from end to start
-        while marker_idx >= 0 and output_idx >= 0:
-            # Skip newlines in current_output
-            if current_output[output_idx] == '\n':
-                output_idx -= 1
-                continue
-                
-            # Compare characters
-            if current_output[output_idx] != marker[marker_idx]:
-                return False
-                
-            # Continue comparison
-            output_idx -= 1
-            marker_idx -= 1
-        
-        # If marker not fully matched
-        if marker_idx >= 0:
-            return False
-            
-        # Check if preceded by "echo " (command just started)
-        check_count = 0
-        echo_chars = "echo "
-        echo_idx = len(echo_chars) - 1
-        
-        while output_idx >= 0 and check_count < 5:
-            # Skip newlines
-            if current_output[output_idx] == '\n':
-                output_idx -= 1
-                continue
-                
-            check_count += 1
-            
-            # Check for "echo " pattern
-            if echo_idx >= 0 and current_output[output_idx] == echo_chars[echo_idx]:
-                echo_idx -= 1
-            else:
-                echo_idx = len(echo_chars) - 1
-                
-            output_idx -= 1
-            
-        # If "echo " found, command just started
-        if echo_idx < 0:
-            return False
-            
-        return True
+            return f"{command} ; {completion}"
 
     async def cleanup(self):
         """Clean up all sessions."""
@@ -493,6 +498,6 @@ class SandboxShellTool(SandboxToolsBase):
         # Also clean up any tmux sessions
         try:
             await self._ensure_sandbox()
-            await self._execute_raw_command("tmux kill-server 2>/dev/null || true")
+            await self._execute_raw_command(f"tmux kill-server 2>/dev/null || true; rm -rf {SESSION_LOG_DIR}")
         except:
             pass
\ No newline at end of file
@@ -1,12 +1,7 @@
 import json
-import asyncio
 from typing import Dict, Any
 from agentpress.tool import ToolResult
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.sse import sse_client
-from mcp.client.stdio import stdio_client
-from mcp.client.streamable_http import streamablehttp_client
-from mcp_module import mcp_service
+from mcp_module import mcp_service, mcp_session_pool, MCPServerSpec
 from utils.logger import logger
 
 
@@ -114,12 +109,10 @@ class MCPToolExecutor:
             
             url = "https://remote.mcp.pipedream.net"
             
-            async with asyncio.timeout(30):
-                async with streamablehttp_client(url, headers=headers) as (read_stream, write_stream, _):
-                    async with ClientSession(read_stream, write_stream) as session:
-                        await session.initialize()
-                        result = await session.call_tool(original_tool_name, arguments)
-                        return self._create_success_result(self._extract_content(result))
+            result = await mcp_session_pool.call_tool(
+                MCPServerSpec.http(url, headers), original_tool_name, arguments, timeout=30
+            )
+            return self._create_success_result(self._extract_content(result))
                         
         except Exception as e:
             logger.error(f"Error executing Pipedream MCP tool: {str(e)}")
@@ -132,23 +125,10 @@ class MCPToolExecutor:
         url = custom_config['url']
         headers = custom_config.get('headers', {})
         
-        async with asyncio.timeout(30):
-            try:
-                async with sse_client(url, headers=headers) as (read, write):
-                    async with ClientSession(read, write) as session:
-                        await session.initialize()
-                        result = await session.call_tool(original_tool_name, arguments)
-                        return self._create_success_result(self._extract_content(result))
-                        
-            except TypeError as e:
-                if "unexpected keyword argument" in str(e):
-                    async with sse_client(url) as (read, write):
-                        async with ClientSession(read, write) as session:
-                            await session.initialize()
-                            result = await session.call_tool(original_tool_name, arguments)
-                            return self._create_success_result(self._extract_content(result))
-                else:
-                    raise
+        result = await mcp_session_pool.call_tool(
+            MCPServerSpec.sse(url, headers), original_tool_name, arguments, timeout=30
+        )
+        return self._create_success_result(self._extract_content(result))
     
     async def _execute_http_tool(self, tool_name: str, arguments: Dict[str, Any], tool_info: Dict[str, Any]) -> ToolResult:
         custom_config = tool_info['custom_config']
@@ -157,12 +137,10 @@ class MCPToolExecutor:
         url = custom_config['url']
         
         try:
-            async with asyncio.timeout(30):
-                async with streamablehttp_client(url) as (read, write, _):
-                    async with ClientSession(read, write) as session:
-                        await session.initialize()
-                        result = await session.call_tool(original_tool_name, arguments)
-                        return self._create_success_result(self._extract_content(result))
+            result = await mcp_session_pool.call_tool(
+                MCPServerSpec.http(url), original_tool_name, arguments, timeout=30
+            )
+            return self._create_success_result(self._extract_content(result))
                         
         except Exception as e:
             logger.error(f"Error executing HTTP MCP tool: {str(e)}")
@@ -172,18 +150,14 @@ class MCPToolExecutor:
         custom_config = tool_info['custom_config']
         original_tool_name = tool_info['original_name']
         
-        server_params = StdioServerParameters(
+        server_spec = MCPServerSpec.stdio(
             command=custom_config["command"],
             args=custom_config.get("args", []),
             env=custom_config.get("env", {})
         )
         
-        async with asyncio.timeout(30):
-            async with stdio_client(server_params) as (read, write):
-                async with ClientSession(read, write) as session:
-                    await session.initialize()
-                    result = await session.call_tool(original_tool_name, arguments)
-                    return self._create_success_result(self._extract_content(result))
+        result = await mcp_session_pool.call_tool(server_spec, original_tool_name, arguments, timeout=30)
+        return self._create_success_result(self._extract_content(result))
     
     async def _resolve_external_user_id(self, custom_config: Dict[str, Any]) -> str:
         profile_id = custom_config.get('profile_id')
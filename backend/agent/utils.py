@@ -1,8 +1,6 @@
-import json
 import traceback
 import uuid
 from typing import Optional, List, Dict, Any
-from datetime import datetime, timezone, timedelta
 from fastapi import HTTPException
 from utils.cache import Cache
 from utils.logger import logger
@@ -10,6 +8,8 @@ from utils.config import config
 from utils.auth_utils import verify_and_authorize_thread_access
 from services import redis
 from services.supabase import DBConnection
+from services.agent_run_stream import open_response_transport
+from agent.running_runs import get_running_runs, unregister_running_run
 from services.llm import make_llm_api_call
 from run_agent_background import update_agent_run_status, _cleanup_redis_response_list
 
@@ -56,17 +56,6 @@ async def stop_agent_run_with_helpers(agent_run_id: str, error_message: Optional
     client = await db.client
     final_status = "failed" if error_message else "stopped"
 
-    # Attempt to fetch final responses from Redis
-    response_list_key = f"agent_run:{agent_run_id}:responses"
-    all_responses = []
-    try:
-        all_responses_json = await redis.lrange(response_list_key, 0, -1)
-        all_responses = [json.loads(r) for r in all_responses_json]
-        logger.debug(f"Fetched {len(all_responses)} responses from Redis for DB update on stop/fail: {agent_run_id}")
-    except Exception as e:
-        logger.error(f"Failed to fetch responses from Redis for {agent_run_id} during stop/fail: {e}")
-        # Try fetching from DB as a fallback? Or proceed without responses? Proceeding without for now.
-
     # Update the agent run status in the database
     update_success = await update_agent_run_status(
         client, agent_run_id, final_status, error=error_message
@@ -76,13 +65,15 @@ async def stop_agent_run_with_helpers(agent_run_id: str, error_message: Optional
         logger.error(f"Failed to update database status for stopped/failed run {agent_run_id}")
         raise HTTPException(status_code=500, detail="Failed to update agent run status in database")
 
-    # Send STOP signal to the global control channel
-    global_control_channel = f"agent_run:{agent_run_id}:control"
+    await unregister_running_run(agent_run_id)
+
+    # Send STOP signal to the global control channel and to stream listeners
+    response_transport = await open_response_transport(agent_run_id)
     try:
-        await redis.publish(global_control_channel, "STOP")
-        logger.debug(f"Published STOP signal to global channel {global_control_channel}")
+        await response_transport.signal("STOP")
+        logger.debug(f"Published STOP signal to global channel {response_transport.control_channel}")
     except Exception as e:
-        logger.error(f"Failed to publish STOP signal to global channel {global_control_channel}: {str(e)}")
+        logger.error(f"Failed to publish STOP signal to global channel {response_transport.control_channel}: {str(e)}")
 
     # Find all instances handling this agent run and send STOP to instance-specific channels
     try:
@@ -211,8 +202,8 @@ def initialize(
 
 async def _cleanup_redis_response_list(agent_run_id: str):
     try:
-        response_list_key = f"agent_run:{agent_run_id}:responses"
-        await redis.delete(response_list_key)
+        response_transport = await open_response_transport(agent_run_id)
+        await response_transport.discard()
         logger.debug(f"Cleaned up Redis response list for agent run {agent_run_id}")
     except Exception as e:
         logger.warning(f"Failed to clean up Redis response list for {agent_run_id}: {str(e)}")
@@ -244,11 +235,10 @@ async def stop_agent_run(db, agent_run_id: str, error_message: Optional[str] = N
     client = await db.client
     final_status = "failed" if error_message else "stopped"
 
-    response_list_key = f"agent_run:{agent_run_id}:responses"
+    response_transport = await open_response_transport(agent_run_id)
     all_responses = []
     try:
-        all_responses_json = await redis.lrange(response_list_key, 0, -1)
-        all_responses = [json.loads(r) for r in all_responses_json]
+        all_responses = await response_transport.read_all()
         logger.debug(f"Fetched {len(all_responses)} responses from Redis for DB update on stop/fail: {agent_run_id}")
     except Exception as e:
         logger.error(f"Failed to fetch responses from Redis for {agent_run_id} during stop/fail: {e}")
@@ -260,12 +250,13 @@ async def stop_agent_run(db, agent_run_id: str, error_message: Optional[str] = N
     if not update_success:
         logger.error(f"Failed to update database status for stopped/failed run {agent_run_id}")
 
-    global_control_channel = f"agent_run:{agent_run_id}:control"
+    await unregister_running_run(agent_run_id)
+
     try:
-        await redis.publish(global_control_channel, "STOP")
-        logger.debug(f"Published STOP signal to global channel {global_control_channel}")
+        await response_transport.signal("STOP")
+        logger.debug(f"Published STOP signal to global channel {response_transport.control_channel}")
     except Exception as e:
-        logger.error(f"Failed to publish STOP signal to global channel {global_control_channel}: {str(e)}")
+        logger.error(f"Failed to publish STOP signal to global channel {response_transport.control_channel}: {str(e)}")
 
     try:
         instance_keys = await redis.keys(f"active_run:*:{agent_run_id}")
@@ -300,57 +291,19 @@ async def check_agent_run_limit(client, account_id: str) -> Dict[str, Any]:
         Dict with 'can_start' (bool), 'running_count' (int), 'running_thread_ids' (list)
     """
     try:
-        result = await Cache.get(f"agent_run_limit:{account_id}")
-        if result:
-            return result
+        # Running runs are tracked per account in Redis and reconciled with the database periodically
+        running_runs = await get_running_runs(client, account_id)
 
-        # Calculate 24 hours ago
-        twenty_four_hours_ago = datetime.now(timezone.utc) - timedelta(hours=24)
-        twenty_four_hours_ago_iso = twenty_four_hours_ago.isoformat()
-        
-        logger.debug(f"Checking agent run limit for account {account_id} since {twenty_four_hours_ago_iso}")
-        
-        # Get all threads for this account
-        threads_result = await client.table('threads').select('thread_id').eq('account_id', account_id).execute()
-        
-        if not threads_result.data:
-            logger.debug(f"No threads found for account {account_id}")
-            return {
-                'can_start': True,
-                'running_count': 0,
-                'running_thread_ids': []
-            }
-        
-        thread_ids = [thread['thread_id'] for thread in threads_result.data]
-        logger.debug(f"Found {len(thread_ids)} threads for account {account_id}")
-        
-        # Query for running agent runs within the past 24 hours for these threads
-        from utils.query_utils import batch_query_in
-        
-        running_runs = await batch_query_in(
-            client=client,
-            table_name='agent_runs',
-            select_fields='id, thread_id, started_at',
-            in_field='thread_id',
-            in_values=thread_ids,
-            additional_filters={
-                'status': 'running',
-                'started_at_gte': twenty_four_hours_ago_iso
-            }
-        )
-        
         running_count = len(running_runs)
         running_thread_ids = [run['thread_id'] for run in running_runs]
         
         logger.debug(f"Account {account_id} has {running_count} running agent runs in the past 24 hours")
         
-        result = {
+        return {
             'can_start': running_count < config.MAX_PARALLEL_AGENT_RUNS,
             'running_count': running_count,
             'running_thread_ids': running_thread_ids
         }
-        await Cache.set(f"agent_run_limit:{account_id}", result)
-        return result
 
     except Exception as e:
         logger.error(f"Error checking agent run limit for account {account_id}: {str(e)}")
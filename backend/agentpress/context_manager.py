@@ -8,7 +8,7 @@ reaching the context window limitations of LLM models.
 import json
 from typing import List, Dict, Any, Optional, Union
 
-from litellm.utils import token_counter
+from agentpress.token_cache import TokenTally, token_count_cache
 from services.supabase import DBConnection
 from utils.logger import logger
 from models import model_manager
@@ -108,20 +108,21 @@ class ContextManager:
             else:
                 return msg_content
   
-    def compress_tool_result_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000) -> List[Dict[str, Any]]:
+    def compress_tool_result_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000, tally: Optional[TokenTally] = None) -> List[Dict[str, Any]]:
         """Compress the tool result messages except the most recent one."""
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
+        tally = tally or TokenTally(llm_model, messages)
         max_tokens_value = max_tokens or (100 * 1000)
 
-        if uncompressed_total_token_count > max_tokens_value:
+        if tally.total > max_tokens_value:
             _i = 0  # Count the number of ToolResult messages
             for msg in reversed(messages):  # Start from the end and work backwards
                 if not isinstance(msg, dict):
                     continue  # Skip non-dict messages
                 if self.is_tool_result_message(msg):  # Only compress ToolResult messages
                     _i += 1  # Count the number of ToolResult messages
-                    msg_token_count = token_counter(messages=[msg])  # Count the number of tokens in the message
+                    msg_token_count = token_count_cache.count_message(None, msg)  # Count the number of tokens in the message
                     if msg_token_count > token_threshold:  # If the message is too long
+                        tally.discard(msg)  # Content is about to change
                         if _i > 1:  # If this is not the most recent ToolResult message
                             message_id = msg.get('message_id')  # Get the message_id
                             if message_id:
@@ -130,22 +131,24 @@ class ContextManager:
                                 logger.warning(f"UNEXPECTED: Message has no message_id {str(msg)[:100]}")
                         else:
                             msg["content"] = self.safe_truncate(msg["content"], int(max_tokens_value * 2))
+                        tally.add(msg)
         return messages
 
-    def compress_user_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000) -> List[Dict[str, Any]]:
+    def compress_user_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000, tally: Optional[TokenTally] = None) -> List[Dict[str, Any]]:
         """Compress the user messages except the most recent one."""
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
+        tally = tally or TokenTally(llm_model, messages)
         max_tokens_value = max_tokens or (100 * 1000)
 
-        if uncompressed_total_token_count > max_tokens_value:
+        if tally.total > max_tokens_value:
             _i = 0  # Count the number of User messages
             for msg in reversed(messages):  # Start from the end and work backwards
                 if not isinstance(msg, dict):
                     continue  # Skip non-dict messages
                 if msg.get('role') == 'user':  # Only compress User messages
                     _i += 1  # Count the number of User messages
-                    msg_token_count = token_counter(messages=[msg])  # Count the number of tokens in the message
+                    msg_token_count = token_count_cache.count_message(None, msg)  # Count the number of tokens in the message
                     if msg_token_count > token_threshold:  # If the message is too long
+                        tally.discard(msg)  # Content is about to change
                         if _i > 1:  # If this is not the most recent User message
                             message_id = msg.get('message_id')  # Get the message_id
                             if message_id:
@@ -154,22 +157,24 @@ class ContextManager:
                                 logger.warning(f"UNEXPECTED: Message has no message_id {str(msg)[:100]}")
                         else:
                             msg["content"] = self.safe_truncate(msg["content"], int(max_tokens_value * 2))
+                        tally.add(msg)
         return messages
 
-    def compress_assistant_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000) -> List[Dict[str, Any]]:
+    def compress_assistant_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000, tally: Optional[TokenTally] = None) -> List[Dict[str, Any]]:
         """Compress the assistant messages except the most recent one."""
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
+        tally = tally or TokenTally(llm_model, messages)
         max_tokens_value = max_tokens or (100 * 1000)
         
-        if uncompressed_total_token_count > max_tokens_value:
+        if tally.total > max_tokens_value:
             _i = 0  # Count the number of Assistant messages
             for msg in reversed(messages):  # Start from the end and work backwards
                 if not isinstance(msg, dict):
                     continue  # Skip non-dict messages
                 if msg.get('role') == 'assistant':  # Only compress Assistant messages
                     _i += 1  # Count the number of Assistant messages
-                    msg_token_count = token_counter(messages=[msg])  # Count the number of tokens in the message
+                    msg_token_count = token_count_cache.count_message(None, msg)  # Count the number of tokens in the message
                     if msg_token_count > token_threshold:  # If the message is too long
+                        tally.discard(msg)  # Content is about to change
                         if _i > 1:  # If this is not the most recent Assistant message
                             message_id = msg.get('message_id')  # Get the message_id
                             if message_id:
@@ -178,6 +183,7 @@ class ContextManager:
                                 logger.warning(f"UNEXPECTED: Message has no message_id {str(msg)[:100]}")
                         else:
                             msg["content"] = self.safe_truncate(msg["content"], int(max_tokens_value * 2))
+                        tally.add(msg)
                             
         return messages
 
@@ -238,13 +244,15 @@ class ContextManager:
         result = messages
         result = self.remove_meta_messages(result)
 
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=result)
+        # Running total shared by the helpers; only compressed messages get re-tokenized
+        tally = TokenTally(llm_model, result)
+        uncompressed_total_token_count = tally.total
 
-        result = self.compress_tool_result_messages(result, llm_model, max_tokens, token_threshold)
-        result = self.compress_user_messages(result, llm_model, max_tokens, token_threshold)
-        result = self.compress_assistant_messages(result, llm_model, max_tokens, token_threshold)
+        result = self.compress_tool_result_messages(result, llm_model, max_tokens, token_threshold, tally)
+        result = self.compress_user_messages(result, llm_model, max_tokens, token_threshold, tally)
+        result = self.compress_assistant_messages(result, llm_model, max_tokens, token_threshold, tally)
 
-        compressed_token_count = token_counter(model=llm_model, messages=result)
+        compressed_token_count = tally.total
 
         logger.debug(f"compress_messages: {uncompressed_total_token_count} -> {compressed_token_count}")  # Log the token compression for debugging later
 
@@ -283,7 +291,8 @@ class ContextManager:
         result = self.remove_meta_messages(result)
 
         # Early exit if no compression needed
-        initial_token_count = token_counter(model=llm_model, messages=result)
+        tally = TokenTally(llm_model, result)
+        initial_token_count = tally.total
         max_allowed_tokens = max_tokens or (100 * 1000)
         
         if initial_token_count <= max_allowed_tokens:
@@ -308,23 +317,26 @@ class ContextManager:
                 # Remove from middle, keeping recent and early context
                 middle_start = len(conversation_messages) // 2 - (removal_batch_size // 2)
                 middle_end = middle_start + removal_batch_size
+                for msg in conversation_messages[middle_start:middle_end]:
+                    tally.discard(msg)
                 conversation_messages = conversation_messages[:middle_start] + conversation_messages[middle_end:]
             else:
                 # Remove from earlier messages, preserving recent context
                 messages_to_remove = min(removal_batch_size, len(conversation_messages) // 2)
                 if messages_to_remove > 0:
+                    for msg in conversation_messages[:messages_to_remove]:
+                        tally.discard(msg)
                     conversation_messages = conversation_messages[messages_to_remove:]
                 else:
                     # Can't remove any more messages
                     break
 
             # Recalculate token count
-            messages_to_count = ([system_message] + conversation_messages) if system_message else conversation_messages
-            current_token_count = token_counter(model=llm_model, messages=messages_to_count)
+            current_token_count = tally.total
 
         # Prepare final result
         final_messages = ([system_message] + conversation_messages) if system_message else conversation_messages
-        final_token_count = token_counter(model=llm_model, messages=final_messages)
+        final_token_count = tally.total
         
         logger.debug(f"compress_messages_by_omitting_messages: {initial_token_count} -> {final_token_count} tokens ({len(messages)} -> {len(final_messages)} messages)")
             
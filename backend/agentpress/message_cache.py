@@ -0,0 +1,242 @@
+"""
+Thread message cache for AgentPress.
+
+ThreadManager.get_llm_messages is called on every iteration of the agent loop
+and every auto-continue. Instead of re-reading and re-parsing the whole thread
+each time, this cache keeps the parsed LLM messages per thread together with a
+created_at watermark and only fetches rows from the watermark on. The delta
+query overlaps the watermark by a few seconds so rows committed slightly out of
+timestamp order are still seen; if one of them sorts before cached rows the
+thread is reloaded so ordering stays exact.
+
+Invalidation works across processes through a per-thread epoch token in Redis:
+writers that can change existing rows (deletions, API-side inserts with their
+own timestamps) call ``invalidate``, and readers drop entries whose epoch no
+longer matches. An optional Redis snapshot tier lets a worker that has not seen
+the thread yet start from a snapshot plus a delta instead of a full fetch.
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+
+from services import redis
+from utils.config import config
+from utils.logger import logger
+
+FETCH_BATCH_SIZE = 1000
+MAX_CACHED_THREADS = 256
+# Local entries are dropped after this long, well inside the epoch key TTL
+ENTRY_MAX_AGE_SECONDS = 3600
+# Rewrite the Redis snapshot once this many messages were appended since the last one
+SNAPSHOT_REWRITE_THRESHOLD = 100
+# Delta fetches start this far before the watermark to catch late commits
+WATERMARK_OVERLAP = timedelta(seconds=5)
+
+
+def _epoch_key(thread_id: str) -> str:
+    return f"thread:{thread_id}:llm_messages_epoch"
+
+
+def _snapshot_key(thread_id: str) -> str:
+    return f"thread:{thread_id}:llm_messages_snapshot"
+
+
+@dataclass
+class _ThreadEntry:
+    epoch: str
+    messages: List[Dict[str, Any]]
+    watermark: Optional[str] = None
+    known_ids: Set[str] = field(default_factory=set)
+    created: float = field(default_factory=time.monotonic)
+    appended_since_snapshot: int = 0
+
+
+def _parse_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Parse message rows the way get_llm_messages always has."""
+    messages = []
+    for item in rows:
+        if isinstance(item['content'], str):
+            try:
+                parsed_item = json.loads(item['content'])
+                parsed_item['message_id'] = item['message_id']
+                messages.append(parsed_item)
+            except json.JSONDecodeError:
+                logger.error(f"Failed to parse message: {item['content']}")
+        else:
+            content = item['content']
+            content['message_id'] = item['message_id']
+            messages.append(content)
+    return messages
+
+
+def _parse_timestamp(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def _copy_message(msg: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy a cached message deep enough that callers can annotate it.
+
+    Provider adapters rewrite content in place (e.g. adding cache_control to
+    text blocks), so the message dict and list content are copied. Strings are
+    shared, which keeps their cached hashes warm for the token count cache.
+    """
+    copied = dict(msg)
+    content = copied.get('content')
+    if isinstance(content, list):
+        copied['content'] = [dict(item) if isinstance(item, dict) else item for item in content]
+    return copied
+
+
+class ThreadMessageCache:
+    """Per-thread cache of parsed LLM messages with delta fetches."""
+
+    def __init__(self, max_threads: int = MAX_CACHED_THREADS, use_redis_snapshots: Optional[bool] = None):
+        self._entries: "OrderedDict[str, _ThreadEntry]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._max_threads = max_threads
+        self._use_redis_snapshots = (
+            config.THREAD_MESSAGE_CACHE_REDIS if use_redis_snapshots is None else use_redis_snapshots
+        )
+
+    async def get_messages(self, client, thread_id: str) -> List[Dict[str, Any]]:
+        """Get all LLM messages for a thread, fetching only rows added since the last call."""
+        epoch = await self._get_epoch(thread_id)
+        if epoch is None:
+            # Without Redis we cannot see invalidations from other processes
+            rows = await self._fetch_rows(client, thread_id)
+            return _parse_rows(rows)
+
+        lock = self._locks.setdefault(thread_id, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(thread_id)
+            if entry and (entry.epoch != epoch or time.monotonic() - entry.created > ENTRY_MAX_AGE_SECONDS):
+                entry = None
+
+            if entry is None and self._use_redis_snapshots:
+                entry = await self._load_snapshot(thread_id, epoch)
+
+            if entry is None:
+                entry = await self._load_full(client, thread_id, epoch)
+            else:
+                rows = await self._fetch_rows(client, thread_id, since=self._overlap_start(entry.watermark))
+                new_rows = [row for row in rows if row['message_id'] not in entry.known_ids]
+                if entry.watermark and any(
+                    _parse_timestamp(row['created_at']) < _parse_timestamp(entry.watermark) for row in new_rows
+                ):
+                    # A late commit sorts before cached rows, reload to keep order exact
+                    logger.debug(f"Out of order message in thread {thread_id}, reloading cache entry")
+                    entry = await self._load_full(client, thread_id, epoch)
+                elif new_rows:
+                    entry.messages.extend(_parse_rows(new_rows))
+                    self._track_rows(entry, new_rows)
+                    entry.appended_since_snapshot += len(new_rows)
+                    if self._use_redis_snapshots and entry.appended_since_snapshot >= SNAPSHOT_REWRITE_THRESHOLD:
+                        await self._save_snapshot(thread_id, entry)
+                    logger.debug(f"Fetched {len(new_rows)} new messages for cached thread {thread_id}")
+
+            self._entries[thread_id] = entry
+            self._entries.move_to_end(thread_id)
+            while len(self._entries) > self._max_threads:
+                evicted_id, _ = self._entries.popitem(last=False)
+                self._locks.pop(evicted_id, None)
+
+            return [_copy_message(msg) for msg in entry.messages]
+
+    async def invalidate(self, thread_id: str) -> None:
+        """Invalidate the cached messages of a thread in every process."""
+        self._entries.pop(thread_id, None)
+        try:
+            redis_client = await redis.get_client()
+            await redis_client.set(_epoch_key(thread_id), uuid.uuid4().hex, ex=redis.REDIS_KEY_TTL)
+            await redis_client.delete(_snapshot_key(thread_id))
+        except Exception as e:
+            logger.warning(f"Failed to invalidate message cache for thread {thread_id}: {e}")
+
+    async def _get_epoch(self, thread_id: str) -> Optional[str]:
+        try:
+            redis_client = await redis.get_client()
+            return await redis_client.get(_epoch_key(thread_id)) or "0"
+        except Exception as e:
+            logger.warning(f"Message cache disabled for thread {thread_id}, Redis unavailable: {e}")
+            return None
+
+    async def _fetch_rows(self, client, thread_id: str, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        # Fetch messages in batches of 1000 to avoid overloading the database
+        all_rows = []
+        offset = 0
+        while True:
+            query = client.table('messages').select('message_id, content, created_at').eq('thread_id', thread_id).eq('is_llm_message', True)
+            if since:
+                query = query.gte('created_at', since)
+            result = await query.order('created_at').range(offset, offset + FETCH_BATCH_SIZE - 1).execute()
+
+            if not result.data:
+                break
+            all_rows.extend(result.data)
+
+            # If we got fewer than batch_size records, we've reached the end
+            if len(result.data) < FETCH_BATCH_SIZE:
+                break
+            offset += FETCH_BATCH_SIZE
+        return all_rows
+
+    async def _load_full(self, client, thread_id: str, epoch: str) -> _ThreadEntry:
+        rows = await self._fetch_rows(client, thread_id)
+        entry = _ThreadEntry(epoch=epoch, messages=_parse_rows(rows))
+        self._track_rows(entry, rows)
+        if self._use_redis_snapshots:
+            await self._save_snapshot(thread_id, entry)
+        logger.debug(f"Loaded {len(entry.messages)} messages for thread {thread_id} into cache")
+        return entry
+
+    def _overlap_start(self, watermark: Optional[str]) -> Optional[str]:
+        if not watermark:
+            return None
+        return (_parse_timestamp(watermark) - WATERMARK_OVERLAP).isoformat()
+
+    def _track_rows(self, entry: _ThreadEntry, rows: List[Dict[str, Any]]) -> None:
+        entry.known_ids.update(row['message_id'] for row in rows)
+        if rows:
+            entry.watermark = rows[-1]['created_at']
+
+    async def _load_snapshot(self, thread_id: str, epoch: str) -> Optional[_ThreadEntry]:
+        try:
+            redis_client = await redis.get_client()
+            raw = await redis_client.get(_snapshot_key(thread_id))
+            if not raw:
+                return None
+            snapshot = json.loads(raw)
+            if snapshot.get('epoch') != epoch:
+                return None
+            return _ThreadEntry(
+                epoch=epoch,
+                messages=snapshot['messages'],
+                watermark=snapshot.get('watermark'),
+                known_ids=set(snapshot.get('known_ids', [])),
+            )
+        except Exception as e:
+            logger.warning(f"Failed to load message snapshot for thread {thread_id}: {e}")
+            return None
+
+    async def _save_snapshot(self, thread_id: str, entry: _ThreadEntry) -> None:
+        try:
+            redis_client = await redis.get_client()
+            snapshot = {
+                'epoch': entry.epoch,
+                'watermark': entry.watermark,
+                'known_ids': list(entry.known_ids),
+                'messages': entry.messages,
+            }
+            await redis_client.set(_snapshot_key(thread_id), json.dumps(snapshot), ex=ENTRY_MAX_AGE_SECONDS)
+            entry.appended_since_snapshot = 0
+        except Exception as e:
+            logger.warning(f"Failed to save message snapshot for thread {thread_id}: {e}")
+
+
+thread_message_cache = ThreadMessageCache()
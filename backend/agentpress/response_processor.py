@@ -19,6 +19,7 @@ from utils.logger import logger
 from agentpress.tool import ToolResult
 from agentpress.tool_registry import ToolRegistry
 from agentpress.xml_tool_parser import XMLToolParser
+from agentpress.xml_stream_scanner import XMLChunkScanner
 from langfuse.client import StatefulTraceClient
 from services.langfuse import langfuse
 from utils.json_helpers import (
@@ -26,6 +27,8 @@ from utils.json_helpers import (
     to_json_string, format_for_yield
 )
 from litellm.utils import token_counter
+from agentpress.token_cache import count_tokens
+from services.prompt_caching import cache_usage
 
 # Type alias for XML result adding strategy
 XmlAddingStrategy = Literal["user_message", "assistant_message", "inline_edit"]
@@ -113,6 +116,18 @@ class ResponseProcessor:
             return format_for_yield(message_obj)
         return None
 
+    def _response_end_metadata(self, thread_run_id: str, usage: Any) -> Dict[str, Any]:
+        """Metadata of an assistant_response_end message, with prompt cache hits and writes when reported."""
+        metadata = {"thread_run_id": thread_run_id}
+        prompt_cache = cache_usage(usage)
+        if prompt_cache:
+            metadata["prompt_cache"] = {
+                "read_tokens": prompt_cache.get("cache_read_input_tokens", 0),
+                "write_tokens": prompt_cache.get("cache_creation_input_tokens", 0),
+            }
+            logger.debug(f"Prompt cache: {metadata['prompt_cache']['read_tokens']} tokens read, {metadata['prompt_cache']['write_tokens']} written")
+        return metadata
+
     def _serialize_model_response(self, model_response) -> Dict[str, Any]:
         """Convert a LiteLLM ModelResponse object to a JSON-serializable dictionary.
         
@@ -216,8 +231,10 @@ class ResponseProcessor:
         continuous_state = continuous_state or {}
         accumulated_content = continuous_state.get('accumulated_content', "")
         tool_calls_buffer = {}
-        current_xml_content = accumulated_content   # equal to accumulated_content if auto-continuing, else blank
+        # Incremental scanner over the XML content, seeded with accumulated_content if auto-continuing
+        xml_scanner = XMLChunkScanner(self.tool_registry.get_legacy_tag_automaton(), accumulated_content)
         xml_chunks_buffer = []
+        deferred_xml_chunks = [] # Complete chunks left unprocessed when the XML tool call limit is hit
         pending_tool_executions = []
         yielded_tool_indices = set() # Stores indices of tools whose *status* has been yielded
         tool_index = 0
@@ -291,6 +308,7 @@ class ResponseProcessor:
                         streaming_metadata["usage"]["completion_tokens"] = chunk.usage.completion_tokens
                     if hasattr(chunk.usage, 'total_tokens') and chunk.usage.total_tokens is not None:
                         streaming_metadata["usage"]["total_tokens"] = chunk.usage.total_tokens
+                    streaming_metadata["usage"].update(cache_usage(chunk.usage))
 
                 if hasattr(chunk, 'choices') and chunk.choices and hasattr(chunk.choices[0], 'finish_reason') and chunk.choices[0].finish_reason:
                     finish_reason = chunk.choices[0].finish_reason
@@ -313,7 +331,8 @@ class ResponseProcessor:
                         chunk_content = delta.content
                         # print(chunk_content, end='', flush=True)
                         accumulated_content += chunk_content
-                        current_xml_content += chunk_content
+                        if config.xml_tool_calling:
+                            xml_scanner.append(chunk_content)
 
                         if not (config.max_xml_tool_calls > 0 and xml_tool_call_count >= config.max_xml_tool_calls):
                             # Yield ONLY content chunk (don't save)
@@ -333,9 +352,8 @@ class ResponseProcessor:
 
                         # --- Process XML Tool Calls (if enabled and limit not reached) ---
                         if config.xml_tool_calling and not (config.max_xml_tool_calls > 0 and xml_tool_call_count >= config.max_xml_tool_calls):
-                            xml_chunks = self._extract_xml_chunks(current_xml_content)
-                            for xml_chunk in xml_chunks:
-                                current_xml_content = current_xml_content.replace(xml_chunk, "", 1)
+                            xml_chunks = xml_scanner.extract()
+                            for chunk_idx, xml_chunk in enumerate(xml_chunks):
                                 xml_chunks_buffer.append(xml_chunk)
                                 result = self._parse_xml_tool_call(xml_chunk)
                                 if result:
@@ -362,6 +380,7 @@ class ResponseProcessor:
                                     if config.max_xml_tool_calls > 0 and xml_tool_call_count >= config.max_xml_tool_calls:
                                         logger.debug(f"Reached XML tool call limit ({config.max_xml_tool_calls})")
                                         finish_reason = "xml_tool_limit_reached"
+                                        deferred_xml_chunks.extend(xml_chunks[chunk_idx + 1:])
                                         break # Stop processing more XML chunks in this delta
 
                     # --- Process Native Tool Call Chunks ---
@@ -445,10 +464,7 @@ class ResponseProcessor:
                 
                 try:
                     # prompt side
-                    prompt_tokens = token_counter(
-                        model=llm_model,
-                        messages=prompt_messages               # chat or plain; token_counter handles both
-                    )
+                    prompt_tokens = count_tokens(llm_model, prompt_messages)  # per-message counts are cached from run_thread
 
                     # completion side
                     completion_tokens = token_counter(
@@ -621,8 +637,8 @@ class ResponseProcessor:
                  # Gather XML tool calls from buffer (up to limit)
                 parsed_xml_data = []
                 if config.xml_tool_calling:
-                    # Reparse remaining content just in case (should be empty if processed correctly)
-                    xml_chunks = self._extract_xml_chunks(current_xml_content)
+                    # Collect chunks not yet handled in the stream loop (should be empty if processed correctly)
+                    xml_chunks = deferred_xml_chunks + xml_scanner.extract()
                     xml_chunks_buffer.extend(xml_chunks)
                     # Process only chunks not already handled in the stream loop
                     remaining_limit = config.max_xml_tool_calls - xml_tool_call_count if config.max_xml_tool_calls > 0 else len(xml_chunks_buffer)
@@ -798,7 +814,7 @@ class ResponseProcessor:
                             type="assistant_response_end",
                             content=assistant_end_content,
                             is_llm_message=False,
-                            metadata={"thread_run_id": thread_run_id}
+                            metadata=self._response_end_metadata(thread_run_id, streaming_metadata["usage"])
                         )
                         logger.debug("Assistant response end saved for stream (before termination)")
                     except Exception as e:
@@ -852,7 +868,7 @@ class ResponseProcessor:
                             type="assistant_response_end",
                             content=assistant_end_content,
                             is_llm_message=False,
-                            metadata={"thread_run_id": thread_run_id}
+                            metadata=self._response_end_metadata(thread_run_id, streaming_metadata["usage"])
                         )
                         logger.debug("Assistant response end saved for stream")
                     except Exception as e:
@@ -1065,7 +1081,7 @@ class ResponseProcessor:
                         type="assistant_response_end",
                         content=response_dict,
                         is_llm_message=False,
-                        metadata={"thread_run_id": thread_run_id}
+                        metadata=self._response_end_metadata(thread_run_id, response_dict.get("usage"))
                     )
                     logger.debug("Assistant response end saved for non-stream")
                 except Exception as e:
@@ -24,8 +24,9 @@ from services.supabase import DBConnection
 from utils.logger import logger
 from langfuse.client import StatefulGenerationClient, StatefulTraceClient
 from services.langfuse import langfuse
-from litellm.utils import token_counter
-from services.billing import calculate_token_cost, handle_usage_with_credits
+from agentpress.token_cache import count_tokens
+from agentpress.message_cache import thread_message_cache
+from services.billing import calculate_token_cost, handle_usage_with_credits, record_monthly_usage
 import re
 from datetime import datetime, timezone, timedelta
 import aiofiles
@@ -184,6 +185,13 @@ class ThreadManager:
                         thread_row = await client.table('threads').select('account_id').eq('thread_id', thread_id).limit(1).execute()
                         user_id = thread_row.data[0]['account_id'] if thread_row.data and len(thread_row.data) > 0 else None
                         if user_id and token_cost > 0:
+                            # Add the cost to the account's running monthly total
+                            current_usage = None
+                            try:
+                                current_usage = await record_monthly_usage(client, user_id, token_cost) - token_cost
+                            except Exception as usage_e:
+                                # handle_usage_with_credits computes the usage itself when it isn't passed
+                                logger.warning(f"Failed to record monthly usage for {user_id}: {str(usage_e)}")
                             # Deduct credits if applicable and record usage against this message
                             await handle_usage_with_credits(
                                 client,
@@ -191,7 +199,8 @@ class ThreadManager:
                                 token_cost,
                                 thread_id=thread_id,
                                 message_id=saved_message['message_id'],
-                                model=model or "unknown"
+                                model=model or "unknown",
+                                current_usage=current_usage
                             )
                     except Exception as billing_e:
                         logger.error(f"Error handling credit usage for message {saved_message.get('message_id')}: {str(billing_e)}", exc_info=True)
@@ -220,49 +229,10 @@ class ThreadManager:
 
         try:
             # result = await client.rpc('get_llm_formatted_messages', {'p_thread_id': thread_id}).execute()
-            
-            # Fetch messages in batches of 1000 to avoid overloading the database
-            all_messages = []
-            batch_size = 1000
-            offset = 0
-            
-            while True:
-                result = await client.table('messages').select('message_id, content').eq('thread_id', thread_id).eq('is_llm_message', True).order('created_at').range(offset, offset + batch_size - 1).execute()
-                
-                if not result.data or len(result.data) == 0:
-                    break
-                    
-                all_messages.extend(result.data)
-                
-                # If we got fewer than batch_size records, we've reached the end
-                if len(result.data) < batch_size:
-                    break
-                    
-                offset += batch_size
-            
-            # Use all_messages instead of result.data in the rest of the method
-            result_data = all_messages
 
-            # Parse the returned data which might be stringified JSON
-            if not result_data:
-                return []
-
-            # Return properly parsed JSON objects
-            messages = []
-            for item in result_data:
-                if isinstance(item['content'], str):
-                    try:
-                        parsed_item = json.loads(item['content'])
-                        parsed_item['message_id'] = item['message_id']
-                        messages.append(parsed_item)
-                    except json.JSONDecodeError:
-                        logger.error(f"Failed to parse message: {item['content']}")
-                else:
-                    content = item['content']
-                    content['message_id'] = item['message_id']
-                    messages.append(content)
-
-            return messages
+            # Parsed messages are cached per thread; only rows newer than the
+            # cached watermark are fetched from the database
+            return await thread_message_cache.get_messages(client, thread_id)
 
         except Exception as e:
             logger.error(f"Failed to get messages for thread {thread_id}: {str(e)}", exc_info=True)
@@ -332,55 +302,9 @@ class ThreadManager:
 
         # Add XML tool calling instructions to system prompt if requested
         if include_xml_examples and config.xml_tool_calling:
-            openapi_schemas = self.tool_registry.get_openapi_schemas()
-            usage_examples = self.tool_registry.get_usage_examples()
+            examples_content = self.tool_registry.get_bundle().xml_examples
             
-            if openapi_schemas:
-                # Convert schemas to JSON string
-                schemas_json = json.dumps(openapi_schemas, indent=2)
-                
-                # Build usage examples section if any exist
-                usage_examples_section = ""
-                if usage_examples:
-                    usage_examples_section = "\n\nUsage Examples:\n"
-                    for func_name, example in usage_examples.items():
-                        usage_examples_section += f"\n{func_name}:\n{example}\n"
-                
-                examples_content = f"""
-In this environment you have access to a set of tools you can use to answer the user's question.
-
-You can invoke functions by writing a <function_calls> block like the following as part of your reply to the user:
-
-<function_calls>
-<invoke name="function_name">
-<parameter name="param_name">param_value</parameter>
-...
-</invoke>
-</function_calls>
-
-String and scalar parameters should be specified as-is, while lists and objects should use JSON format.
-
-Here are the functions available in JSON Schema format:
-
-```json
-{schemas_json}
-```
-
-When using the tools:
-- Use the exact function names from the JSON schema above
-- Include all required parameters as specified in the schema
-- Format complex data (objects, arrays) as JSON strings within the parameter tags
-- Boolean values should be "true" or "false" (lowercase)
-{usage_examples_section}"""
-
-                # # Save examples content to a file
-                # try:
-                #     with open('xml_examples.txt', 'w') as f:
-                #         f.write(examples_content)
-                #     logger.debug("Saved XML examples to xml_examples.txt")
-                # except Exception as e:
-                #     logger.error(f"Failed to save XML examples to file: {e}")
-
+            if examples_content:
                 system_content = working_system_prompt.get('content')
 
                 if isinstance(system_content, str):
@@ -423,7 +347,7 @@ When using the tools:
                 token_count = 0
                 try:
                     # Use the potentially modified working_system_prompt for token counting
-                    token_count = token_counter(model=llm_model, messages=[working_system_prompt] + messages)
+                    token_count = count_tokens(llm_model, [working_system_prompt] + messages)
                     token_threshold = self.context_manager.token_threshold
                     logger.debug(f"Thread {thread_id} token count: {token_count}/{token_threshold} ({(token_count/token_threshold)*100:.1f}%)")
 
@@ -0,0 +1,159 @@
+"""
+Token counting cache for AgentPress.
+
+Counting tokens with litellm means running the tokenizer over every message,
+and the context manager and thread manager used to do that for the whole
+thread several times per LLM call. This module caches per-message counts in a
+bounded LRU keyed by tokenizer family and message fingerprint, and derives
+list totals from them, so only new or modified messages are tokenized.
+"""
+
+import json
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from litellm.utils import token_counter
+from utils.logger import logger
+
+DEFAULT_CACHE_SIZE = 20000
+
+_PROBE_MESSAGE = {"role": "user", "content": "token overhead probe"}
+
+
+def tokenizer_family(model: Optional[str]) -> str:
+    """Map a model name to the tokenizer litellm uses to count it."""
+    if not model:
+        return "default"
+    name = model.lower()
+    if "claude" in name or "anthropic" in name:
+        return "anthropic"
+    if "command" in name or "cohere" in name:
+        return "cohere"
+    if "llama-3" in name or "llama3" in name:
+        return "llama3"
+    if "llama-2" in name or "llama2" in name:
+        return "llama2"
+    return "default"
+
+
+def _fingerprint(msg: Dict[str, Any]) -> Tuple[Any, ...]:
+    """Cheap identity of everything in a message that contributes tokens.
+
+    str hashes are cached on the string object, so messages that are reused
+    across turns fingerprint in O(1).
+    """
+    content = msg.get("content")
+    if isinstance(content, str):
+        content_key = (len(content), hash(content))
+    else:
+        serialized = json.dumps(content, sort_keys=True, default=str)
+        content_key = (len(serialized), hash(serialized))
+    extras = {k: v for k, v in msg.items() if k not in ("content", "message_id")}
+    extras_key = hash(json.dumps(extras, sort_keys=True, default=str)) if extras else None
+    return (msg.get("message_id"), content_key, extras_key)
+
+
+class TokenCountCache:
+    """Bounded LRU of per-message token counts."""
+
+    def __init__(self, maxsize: int = DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._counts: "OrderedDict[Tuple[Any, ...], int]" = OrderedDict()
+        self._list_overhead: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def count_message(self, model: Optional[str], msg: Dict[str, Any]) -> int:
+        """Token count of a single message, as token_counter(messages=[msg])."""
+        family = tokenizer_family(model)
+        try:
+            key = (family, _fingerprint(msg))
+        except (TypeError, ValueError):
+            return token_counter(model=model, messages=[msg]) if model else token_counter(messages=[msg])
+
+        count = self._counts.get(key)
+        if count is not None:
+            self._counts.move_to_end(key)
+            self.hits += 1
+            return count
+
+        self.misses += 1
+        count = token_counter(model=model, messages=[msg]) if model else token_counter(messages=[msg])
+        self._counts[key] = count
+        if len(self._counts) > self.maxsize:
+            self._counts.popitem(last=False)
+        return count
+
+    def list_overhead(self, model: Optional[str]) -> int:
+        """Tokens counted once per call rather than per message (e.g. reply priming).
+
+        Measured once per tokenizer family so that list totals derived from
+        per-message counts match token_counter over the whole list.
+        """
+        family = tokenizer_family(model)
+        overhead = self._list_overhead.get(family)
+        if overhead is None:
+            try:
+                single = token_counter(model=model, messages=[_PROBE_MESSAGE]) if model else token_counter(messages=[_PROBE_MESSAGE])
+                double = token_counter(model=model, messages=[_PROBE_MESSAGE, _PROBE_MESSAGE]) if model else token_counter(messages=[_PROBE_MESSAGE, _PROBE_MESSAGE])
+                overhead = max(0, 2 * single - double)
+            except Exception as e:
+                logger.warning(f"Could not measure token list overhead for {family}: {e}")
+                overhead = 0
+            self._list_overhead[family] = overhead
+        return overhead
+
+    def count_messages(self, model: Optional[str], messages: Iterable[Dict[str, Any]]) -> int:
+        """Token count of a message list, as token_counter(model, messages)."""
+        total = 0
+        n = 0
+        for msg in messages:
+            total += self.count_message(model, msg)
+            n += 1
+        if n > 1:
+            total -= self.list_overhead(model) * (n - 1)
+        return total
+
+    def clear(self) -> None:
+        self._counts.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+token_count_cache = TokenCountCache()
+
+
+def count_tokens(model: Optional[str], messages: List[Dict[str, Any]]) -> int:
+    """Cached drop-in for litellm token_counter(model=..., messages=...)."""
+    return token_count_cache.count_messages(model, messages)
+
+
+class TokenTally:
+    """Running token total of a message list.
+
+    Messages are added or discarded as the list changes, so the total is
+    maintained in O(changed messages) instead of recounting the whole list.
+    Discard a message before mutating it and add it back afterwards.
+    """
+
+    def __init__(self, model: Optional[str], messages: Optional[Iterable[Dict[str, Any]]] = None, cache: TokenCountCache = token_count_cache):
+        self.model = model
+        self._cache = cache
+        self._sum = 0
+        self._count = 0
+        for msg in messages or []:
+            self.add(msg)
+
+    @property
+    def total(self) -> int:
+        if self._count > 1:
+            return self._sum - self._cache.list_overhead(self.model) * (self._count - 1)
+        return self._sum
+
+    def add(self, msg: Dict[str, Any]) -> None:
+        self._sum += self._cache.count_message(self.model, msg)
+        self._count += 1
+
+    def discard(self, msg: Dict[str, Any]) -> None:
+        self._sum -= self._cache.count_message(self.model, msg)
+        self._count -= 1
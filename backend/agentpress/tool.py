@@ -57,6 +57,26 @@ class Tool(ABC):
         fail_response: Create a failed result
     """
     
+    _class_schemas: Dict[str, List[ToolSchema]] = {}
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._class_schemas = cls._collect_class_schemas()
+
+    @classmethod
+    def _collect_class_schemas(cls) -> Dict[str, List[ToolSchema]]:
+        """Collect schemas from the decorated methods of the class (and its bases).
+
+        Runs once per class when the class is defined, so creating tool
+        instances does not reflect over their members again.
+        """
+        schemas = {}
+        for name, function in inspect.getmembers(cls, predicate=inspect.isfunction):
+            if hasattr(function, 'tool_schemas'):
+                schemas[name] = function.tool_schemas
+                logger.debug(f"Collected schemas for method '{name}' in {cls.__name__}")
+        return schemas
+
     def __init__(self):
         """Initialize tool with empty schema registry."""
         self._schemas: Dict[str, List[ToolSchema]] = {}
@@ -65,10 +85,7 @@ class Tool(ABC):
 
     def _register_schemas(self):
         """Register schemas from all decorated methods."""
-        for name, method in inspect.getmembers(self, predicate=inspect.ismethod):
-            if hasattr(method, 'tool_schemas'):
-                self._schemas[name] = method.tool_schemas
-                logger.debug(f"Registered schemas for method '{name}' in {self.__class__.__name__}")
+        self._schemas.update(type(self)._class_schemas)
 
     def get_schemas(self) -> Dict[str, List[ToolSchema]]:
         """Get all registered tool schemas.
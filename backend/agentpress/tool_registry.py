@@ -1,8 +1,92 @@
-from typing import Dict, Type, Any, List, Optional, Callable
-from agentpress.tool import Tool, SchemaType
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Type, Any, List, Optional, Callable, Tuple
+from agentpress.tool import Tool, SchemaType, ToolSchema
+from agentpress.xml_stream_scanner import LegacyTagAutomaton, build_legacy_tag_automaton
 from utils.logger import logger
 import json
 
+MAX_TOOL_BUNDLES = 64
+
+
+@dataclass
+class ToolBundle:
+    """Everything derived from a set of registered tool schemas.
+
+    Built once per distinct tool set and shared by every registry that
+    registers the same tools, so runs skip re-serializing schemas and
+    re-rendering the XML examples, and the text is byte-identical between
+    runs. Treat the contents as read-only.
+
+    Attributes:
+        openapi_schemas: OpenAPI schemas for function calling
+        usage_examples: Function name -> usage example
+        xml_examples: XML tool calling instructions for the system prompt ('' without tools)
+        tag_map: Function name -> legacy XML tag name
+        legacy_tag_automaton: Compiled matcher for the legacy XML tags
+    """
+    openapi_schemas: List[Dict[str, Any]]
+    usage_examples: Dict[str, str]
+    xml_examples: str
+    tag_map: Dict[str, str]
+    legacy_tag_automaton: Optional[LegacyTagAutomaton]
+    # Keeps the schemas in the bundle's key alive, so their ids cannot be reused
+    schema_refs: Tuple[ToolSchema, ...] = ()
+    _token_count: Optional[int] = field(default=None, repr=False)
+
+    @property
+    def token_count(self) -> int:
+        """Token count of the XML examples text, computed on first use."""
+        if self._token_count is None:
+            from agentpress.token_cache import count_tokens
+            self._token_count = count_tokens(None, [{"role": "system", "content": self.xml_examples}]) if self.xml_examples else 0
+        return self._token_count
+
+
+_tool_bundles: "OrderedDict[tuple, ToolBundle]" = OrderedDict()
+
+
+def _render_xml_examples(openapi_schemas: List[Dict[str, Any]], usage_examples: Dict[str, str]) -> str:
+    if not openapi_schemas:
+        return ""
+
+    # Convert schemas to JSON string
+    schemas_json = json.dumps(openapi_schemas, indent=2)
+    
+    # Build usage examples section if any exist
+    usage_examples_section = ""
+    if usage_examples:
+        usage_examples_section = "\n\nUsage Examples:\n"
+        for func_name, example in usage_examples.items():
+            usage_examples_section += f"\n{func_name}:\n{example}\n"
+    
+    return f"""
+In this environment you have access to a set of tools you can use to answer the user's question.
+
+You can invoke functions by writing a <function_calls> block like the following as part of your reply to the user:
+
+<function_calls>
+<invoke name="function_name">
+<parameter name="param_name">param_value</parameter>
+...
+</invoke>
+</function_calls>
+
+String and scalar parameters should be specified as-is, while lists and objects should use JSON format.
+
+Here are the functions available in JSON Schema format:
+
+```json
+{schemas_json}
+```
+
+When using the tools:
+- Use the exact function names from the JSON schema above
+- Include all required parameters as specified in the schema
+- Format complex data (objects, arrays) as JSON strings within the parameter tags
+- Boolean values should be "true" or "false" (lowercase)
+{usage_examples_section}"""
+
 
 class ToolRegistry:
     """Registry for managing and accessing tools.
@@ -75,6 +159,53 @@ class ToolRegistry:
         logger.debug(f"Retrieved {len(available_functions)} available functions")
         return available_functions
 
+    def get_bundle(self) -> ToolBundle:
+        """Get the tool bundle for the registered functions.
+
+        Bundles are memoized process-wide by the registered function names and
+        the identity of their schemas. Schemas come from the tool classes, so
+        registries with the same tools (the same disabled-tools config) share a
+        bundle; tools added directly to ``self.tools`` (e.g. MCP tools) get a
+        new one whenever their schemas change.
+
+        Returns:
+            ToolBundle for the current registrations
+        """
+        key = tuple((name, id(info['schema'])) for name, info in self.tools.items())
+        bundle = _tool_bundles.get(key)
+        if bundle is not None:
+            _tool_bundles.move_to_end(key)
+            return bundle
+
+        openapi_schemas = [
+            tool_info['schema'].schema 
+            for tool_info in self.tools.values()
+            if tool_info['schema'].schema_type == SchemaType.OPENAPI
+        ]
+        usage_examples = self._collect_usage_examples()
+        tag_map = {name: name.replace('_', '-') for name in self.tools}
+        bundle = ToolBundle(
+            openapi_schemas=openapi_schemas,
+            usage_examples=usage_examples,
+            xml_examples=_render_xml_examples(openapi_schemas, usage_examples),
+            tag_map=tag_map,
+            legacy_tag_automaton=build_legacy_tag_automaton(self.tools.keys()),
+            schema_refs=tuple(info['schema'] for info in self.tools.values()),
+        )
+        _tool_bundles[key] = bundle
+        while len(_tool_bundles) > MAX_TOOL_BUNDLES:
+            _tool_bundles.popitem(last=False)
+        logger.debug(f"Built tool bundle for {len(self.tools)} functions")
+        return bundle
+
+    def get_legacy_tag_automaton(self) -> Optional[LegacyTagAutomaton]:
+        """Get the compiled legacy XML tag matcher for the registered functions.
+
+        Returns:
+            LegacyTagAutomaton, or None if no functions are registered
+        """
+        return self.get_bundle().legacy_tag_automaton
+
     def get_tool(self, tool_name: str) -> Dict[str, Any]:
         """Get a specific tool by name.
         
@@ -95,11 +226,7 @@ class ToolRegistry:
         Returns:
             List of OpenAPI-compatible schema definitions
         """
-        schemas = [
-            tool_info['schema'].schema 
-            for tool_info in self.tools.values()
-            if tool_info['schema'].schema_type == SchemaType.OPENAPI
-        ]
+        schemas = self.get_bundle().openapi_schemas
         logger.debug(f"Retrieved {len(schemas)} OpenAPI schemas")
         return schemas
 
@@ -109,6 +236,9 @@ class ToolRegistry:
         Returns:
             Dict mapping function names to their usage examples
         """
+        return self.get_bundle().usage_examples
+
+    def _collect_usage_examples(self) -> Dict[str, str]:
         examples = {}
         
         # Get all registered tools and their schemas
@@ -126,4 +256,3 @@ class ToolRegistry:
         
         logger.debug(f"Retrieved {len(examples)} usage examples")
         return examples
-
@@ -0,0 +1,193 @@
+"""
+Incremental XML tool-call scanner for streaming responses.
+
+The streaming response loop used to re-run a full extraction over the whole
+accumulated buffer on every content delta. This module provides a resumable
+scanner that keeps its search cursors between calls, so each delta only
+examines the newly arrived text (plus a few bytes of overlap for tags that
+straddle chunk boundaries).
+
+Two block formats are recognised, mirroring ResponseProcessor._extract_xml_chunks:
+
+- ``<function_calls> ... </function_calls>`` blocks (current format)
+- legacy ``<tool-name ...> ... </tool-name>`` blocks for registered functions,
+  which are only considered until the first ``<function_calls>`` opener is seen
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Pattern
+
+FUNCTION_CALLS_OPEN = '<function_calls>'
+FUNCTION_CALLS_CLOSE = '</function_calls>'
+
+
+@dataclass(frozen=True)
+class LegacyTagAutomaton:
+    """Precompiled matcher for legacy tool tags of a registry.
+
+    Attributes:
+        pattern: Alternation of ``<tag-name`` openers, in registry order so that
+            ties at the same position resolve like the original linear search
+        max_opener_len: Length of the longest opener, used as the overlap kept
+            between scans so a tag split across deltas is still found
+    """
+    pattern: Pattern
+    max_opener_len: int
+
+
+def build_legacy_tag_automaton(function_names: Iterable[str]) -> Optional[LegacyTagAutomaton]:
+    """Compile the legacy tag matcher for the given function names.
+
+    Args:
+        function_names: Registered function names (underscores become dashes)
+
+    Returns:
+        LegacyTagAutomaton, or None if there are no functions
+    """
+    tags = []
+    for func_name in function_names:
+        tag_name = func_name.replace('_', '-')
+        if tag_name not in tags:
+            tags.append(tag_name)
+    if not tags:
+        return None
+    pattern = re.compile('<(' + '|'.join(re.escape(tag) for tag in tags) + ')')
+    return LegacyTagAutomaton(pattern=pattern, max_opener_len=max(len(tag) for tag in tags) + 1)
+
+
+class XMLChunkScanner:
+    """Resumable scanner that emits complete XML tool-call blocks.
+
+    Text is appended with ``append`` and completed blocks are collected with
+    ``extract``; ``feed`` does both. Each completed block is returned exactly
+    once, and text that can no longer be part of a block is dropped from the
+    internal buffer.
+    """
+
+    def __init__(self, legacy_automaton: Optional[LegacyTagAutomaton] = None, initial_content: str = ""):
+        """Initialize the scanner.
+
+        Args:
+            legacy_automaton: Matcher for legacy tool tags, or None to only
+                recognise ``<function_calls>`` blocks
+            initial_content: Content already accumulated (e.g. when auto-continuing)
+        """
+        self._buffer = initial_content
+        self._legacy = legacy_automaton
+
+        # <function_calls> state: start of the open block (or None) and the
+        # position from which the next opener/closer search resumes.
+        self._fc_start: Optional[int] = None
+        self._fc_cursor = 0
+
+        # Legacy state, only used until the first <function_calls> opener.
+        self._legacy_enabled = legacy_automaton is not None
+        self._lg_cursor = 0
+        self._lg_start: Optional[int] = None
+        self._lg_tag: Optional[str] = None
+        self._lg_pos = 0
+        self._lg_depth = 0
+        self._lg_end_hint = 0
+
+    def append(self, text: str) -> None:
+        """Append newly streamed text without scanning it."""
+        if text:
+            self._buffer += text
+
+    def feed(self, text: str) -> List[str]:
+        """Append text and return any blocks completed by it."""
+        self.append(text)
+        return self.extract()
+
+    def extract(self) -> List[str]:
+        """Return blocks completed since the last call, in stream order."""
+        chunks = self._scan_function_calls()
+        if self._legacy_enabled:
+            chunks.extend(self._scan_legacy())
+        self._compact()
+        return chunks
+
+    def _scan_function_calls(self) -> List[str]:
+        buffer = self._buffer
+        chunks = []
+        while True:
+            if self._fc_start is None:
+                start = buffer.find(FUNCTION_CALLS_OPEN, self._fc_cursor)
+                if start == -1:
+                    self._fc_cursor = max(self._fc_cursor, len(buffer) - len(FUNCTION_CALLS_OPEN) + 1)
+                    return chunks
+                self._fc_start = start
+                self._fc_cursor = start + len(FUNCTION_CALLS_OPEN)
+                # The new format takes over; legacy tags inside or after a
+                # <function_calls> block are never treated as tool calls.
+                self._legacy_enabled = False
+
+            end = buffer.find(FUNCTION_CALLS_CLOSE, self._fc_cursor)
+            if end == -1:
+                self._fc_cursor = max(self._fc_cursor, len(buffer) - len(FUNCTION_CALLS_CLOSE) + 1)
+                return chunks
+
+            chunk_end = end + len(FUNCTION_CALLS_CLOSE)
+            chunks.append(buffer[self._fc_start:chunk_end])
+            self._fc_start = None
+            self._fc_cursor = chunk_end
+
+    def _scan_legacy(self) -> List[str]:
+        buffer = self._buffer
+        chunks = []
+        while True:
+            if self._lg_start is None:
+                match = self._legacy.pattern.search(buffer, self._lg_cursor)
+                if not match:
+                    self._lg_cursor = max(self._lg_cursor, len(buffer) - self._legacy.max_opener_len + 1)
+                    return chunks
+                self._lg_start = match.start()
+                self._lg_tag = match.group(1)
+                self._lg_pos = match.start()
+                self._lg_depth = 0
+                self._lg_end_hint = match.start()
+
+            opener = f'<{self._lg_tag}'
+            closer = f'</{self._lg_tag}>'
+            while True:
+                next_end = buffer.find(closer, max(self._lg_pos, self._lg_end_hint))
+                if next_end == -1:
+                    self._lg_end_hint = max(self._lg_end_hint, len(buffer) - len(closer) + 1)
+                    return chunks
+
+                next_start = buffer.find(opener, self._lg_pos + 1, next_end)
+                if next_start != -1:
+                    # Nested opener of the same tag before the closer
+                    self._lg_depth += 1
+                    self._lg_pos = next_start + 1
+                elif self._lg_depth:
+                    self._lg_depth -= 1
+                    self._lg_pos = next_end + 1
+                else:
+                    chunk_end = next_end + len(closer)
+                    chunks.append(buffer[self._lg_start:chunk_end])
+                    self._lg_start = None
+                    self._lg_tag = None
+                    self._lg_cursor = chunk_end
+                    break
+
+    def _compact(self) -> None:
+        """Drop the buffer prefix that no open block or cursor still needs."""
+        cut = self._fc_start if self._fc_start is not None else self._fc_cursor
+        if self._legacy_enabled:
+            cut = min(cut, self._lg_start if self._lg_start is not None else self._lg_cursor)
+        cut = min(cut, len(self._buffer))
+        if cut <= 0:
+            return
+
+        self._buffer = self._buffer[cut:]
+        self._fc_cursor -= cut
+        if self._fc_start is not None:
+            self._fc_start -= cut
+        if self._legacy_enabled:
+            self._lg_cursor = max(0, self._lg_cursor - cut)
+            if self._lg_start is not None:
+                self._lg_start -= cut
+                self._lg_pos -= cut
+                self._lg_end_hint -= cut
@@ -69,6 +69,8 @@ async def lifespan(app: FastAPI):
         
         # Start background tasks
         # asyncio.create_task(agent_api.restore_running_agent_runs())
+        from utils.auth_cache import listen_for_api_key_revocations
+        api_key_revocation_listener = asyncio.create_task(listen_for_api_key_revocations())
         
         triggers_api.initialize(db)
         pipedream_api.initialize(db)
@@ -78,10 +80,26 @@ async def lifespan(app: FastAPI):
         
         yield
         
+        # Wait for the listener to let go of its pubsub connection before Redis is closed below
+        api_key_revocation_listener.cancel()
+        try:
+            await api_key_revocation_listener
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.warning(f"Error stopping API key revocation listener: {e}")
+        
         # Clean up agent resources
         logger.debug("Cleaning up agent resources")
         await agent_api.cleanup()
         
+        # Close pooled MCP sessions
+        try:
+            from mcp_module import mcp_session_pool
+            await mcp_session_pool.close_all()
+        except Exception as e:
+            logger.error(f"Error closing MCP sessions: {e}")
+        
         # Clean up Redis connection
         try:
             logger.debug("Closing Redis connection")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-turn ContextManager.compress_messages time on a synthetic
+500-message thread, with the token count cache cold (every message is
+re-tokenized each turn, as before the cache) and warm.
+
+Usage:
+    python benchmark_context_manager.py [--messages 500] [--turns 10] [--model gpt-4]
+"""
+
+import sys
+import os
+import copy
+import time
+import random
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from agentpress.context_manager import ContextManager
+from agentpress.token_cache import token_count_cache
+
+
+def build_thread(num_messages: int, seed: int = 7):
+    """Build a synthetic thread alternating user, assistant and tool result messages."""
+    rng = random.Random(seed)
+    words = ["analysis", "dataset", "result", "function", "deploy", "config", "server", "report", "value", "error"]
+    messages = [{"role": "system", "content": "You are a helpful AI assistant.", "message_id": "msg_system"}]
+    for i in range(num_messages):
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(50, 600)))
+        kind = i % 3
+        if kind == 0:
+            messages.append({"role": "user", "content": text, "message_id": f"msg_{i}"})
+        elif kind == 1:
+            messages.append({"role": "assistant", "content": text, "message_id": f"msg_{i}"})
+        else:
+            messages.append({"role": "user", "content": f"ToolResult(success=True, output='{text}')", "message_id": f"msg_{i}"})
+    return messages
+
+
+def run_turns(cm: ContextManager, thread, model: str, turns: int, cold: bool):
+    timings = []
+    thread = list(thread)
+    for turn in range(turns):
+        thread.append({"role": "user", "content": f"Follow-up question number {turn}", "message_id": f"msg_turn_{turn}"})
+        messages = copy.deepcopy(thread)
+        if cold:
+            token_count_cache.clear()
+        start = time.perf_counter()
+        cm.compress_messages(messages, model)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark context compression per turn")
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--model", default="gpt-4")
+    args = parser.parse_args()
+
+    cm = ContextManager()
+    thread = build_thread(args.messages)
+    print(f"Thread: {len(thread)} messages, model {args.model}")
+
+    for label, cold in (("cold cache", True), ("warm cache", False)):
+        token_count_cache.clear()
+        timings = run_turns(cm, thread, args.model, args.turns, cold)
+        steady = timings[1:] or timings
+        print(f"{label:>10}: first turn {timings[0] * 1000:8.1f} ms, "
+              f"mean of later turns {sum(steady) / len(steady) * 1000:8.1f} ms")
+    print(f"cache: {token_count_cache.hits} hits, {token_count_cache.misses} misses")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark comparing full-buffer XML chunk extraction with the
+incremental XMLChunkScanner on synthetic streaming responses.
+
+Usage:
+    python benchmark_xml_stream_scanner.py [--tokens 20000] [--tools 60] [--runs 3]
+"""
+
+import sys
+import os
+import time
+import random
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from agentpress.response_processor import ResponseProcessor
+from agentpress.xml_stream_scanner import XMLChunkScanner, build_legacy_tag_automaton
+
+
+class _StubRegistry:
+    """Minimal registry exposing only what _extract_xml_chunks needs."""
+
+    def __init__(self, function_names):
+        self.function_names = function_names
+
+    def get_available_functions(self):
+        return {name: None for name in self.function_names}
+
+
+class _StubTrace:
+    def event(self, **kwargs):
+        pass
+
+
+def build_stream(num_tokens: int, seed: int = 42):
+    """Build a list of content deltas with a tool call every ~500 tokens."""
+    rng = random.Random(seed)
+    words = ["the", "data", "analysis", "shows", "that", "we", "should", "next", "file", "result"]
+    deltas = []
+    for i in range(num_tokens):
+        deltas.append(rng.choice(words) + " ")
+        if i and i % 500 == 0:
+            block = (
+                '<function_calls>\n<invoke name="create_file">\n'
+                '<parameter name="file_path">src/app.py</parameter>\n'
+                '<parameter name="file_contents">print("hello")</parameter>\n'
+                '</invoke>\n</function_calls>'
+            )
+            # Split the block into token-sized pieces like a real stream would
+            deltas.extend(block[j:j + 4] for j in range(0, len(block), 4))
+    return deltas
+
+
+def run_full_rescan(processor, deltas):
+    current_xml_content = ""
+    found = []
+    for delta in deltas:
+        current_xml_content += delta
+        for xml_chunk in processor._extract_xml_chunks(current_xml_content):
+            current_xml_content = current_xml_content.replace(xml_chunk, "", 1)
+            found.append(xml_chunk)
+    return found
+
+
+def run_incremental(automaton, deltas):
+    scanner = XMLChunkScanner(automaton)
+    found = []
+    for delta in deltas:
+        found.extend(scanner.feed(delta))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streaming XML chunk extraction")
+    parser.add_argument("--tokens", type=int, default=20000)
+    parser.add_argument("--tools", type=int, default=60)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    function_names = [f"tool_function_{i}" for i in range(args.tools - 1)] + ["create_file"]
+    processor = ResponseProcessor.__new__(ResponseProcessor)
+    processor.tool_registry = _StubRegistry(function_names)
+    processor.trace = _StubTrace()
+    automaton = build_legacy_tag_automaton(function_names)
+
+    deltas = build_stream(args.tokens)
+    print(f"Stream: {len(deltas)} deltas, {sum(len(d) for d in deltas):,} chars, {args.tools} registered functions")
+
+    for name, fn in (
+        ("full rescan", lambda: run_full_rescan(processor, deltas)),
+        ("incremental", lambda: run_incremental(automaton, deltas)),
+    ):
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            found = fn()
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        print(f"{name:>12}: best {best * 1000:8.1f} ms "
+              f"({best * 1e6 / len(deltas):6.2f} us/delta), {len(found)} blocks")
+
+
+if __name__ == "__main__":
+    main()
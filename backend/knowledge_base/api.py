@@ -5,6 +5,7 @@ from pydantic import BaseModel, Field, HttpUrl
 from utils.auth_utils import verify_and_get_user_id_from_jwt, verify_and_get_agent_authorization, require_agent_access, AuthorizedAgentAccess
 from services.supabase import DBConnection
 from knowledge_base.file_processor import FileProcessor
+from agent.prompt_cache import invalidate_kb_section
 from utils.logger import logger
 
 router = APIRouter(prefix="/knowledge-base", tags=["knowledge-base"])
@@ -149,6 +150,7 @@ async def create_agent_knowledge_base_entry(
             raise HTTPException(status_code=500, detail="Failed to create agent knowledge base entry")
         
         created_entry = result.data[0]
+        await invalidate_kb_section(agent_id)
         
         return KnowledgeBaseEntryResponse(
             entry_id=created_entry['entry_id'],
@@ -267,6 +269,7 @@ async def update_knowledge_base_entry(
             raise HTTPException(status_code=500, detail="Failed to update knowledge base entry")
         
         updated_entry = result.data[0]
+        await invalidate_kb_section(agent_id)
         
         logger.debug(f"Updated agent knowledge base entry {entry_id} for agent {agent_id}")
         
@@ -316,6 +319,8 @@ async def delete_knowledge_base_entry(
         
         result = await client.table('agent_knowledge_base_entries').delete().eq('entry_id', entry_id).execute()
         
+        await invalidate_kb_section(agent_id)
+        
         logger.debug(f"Deleted agent knowledge base entry {entry_id} for agent {agent_id}")
         
         return {"message": "Knowledge base entry deleted successfully"}
@@ -438,6 +443,8 @@ async def process_file_background(
             agent_id, account_id, file_content, filename, mime_type
         )
         
+        await invalidate_kb_section(agent_id)
+        
         if result['success']:
             await client.rpc('update_agent_kb_job_status', {
                 'p_job_id': job_id,
@@ -0,0 +1,198 @@
+"""
+Document text extraction off the event loop.
+
+PDF, DOCX and text decoding are CPU-bound and used to run inside the API's
+event loop, so a large upload or a cloned repository stalled every request
+served by that worker. Extraction now runs in a pool of separate processes:
+
+- each file gets EXTRACTION_TIMEOUT_SECONDS; a worker stuck past that is
+  killed and the pool is replaced, so one pathological document cannot wedge
+  later uploads. Files that were extracting in the same pool at the time are
+  retried once on the new pool;
+- workers cap their address space at WORKER_MEMORY_LIMIT_BYTES, so a
+  decompression bomb fails its own extraction instead of the API process;
+- parsers stop reading pages or paragraphs once max_chars of text have been
+  collected, instead of building the whole document's text and truncating it.
+
+This module only depends on the parsing libraries so the spawned workers stay
+light; keep application imports out of it.
+"""
+
+import asyncio
+import io
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Optional
+
+import chardet
+
+EXTRACTION_WORKERS = int(os.getenv("KB_EXTRACTION_WORKERS", "2"))
+EXTRACTION_TIMEOUT_SECONDS = 60
+WORKER_MEMORY_LIMIT_BYTES = int(os.getenv("KB_EXTRACTION_MEMORY_LIMIT_BYTES", str(1024 * 1024 * 1024)))
+# Encoding detection is slow on large inputs and a sample is as good
+ENCODING_SAMPLE_BYTES = 64 * 1024
+
+TEXT_EXTENSIONS = {'.txt'}
+
+
+class ExtractionError(Exception):
+    pass
+
+
+def sanitize_content(content: str) -> str:
+    if not content:
+        return content
+
+    sanitized = ''.join(char for char in content if ord(char) >= 32 or char in '\n\r\t')
+
+    sanitized = sanitized.replace('\x00', '')
+    sanitized = sanitized.replace('\u0000', '')
+
+    sanitized = sanitized.replace('\ufeff', '')
+
+    sanitized = sanitized.replace('\r\n', '\n').replace('\r', '\n')
+
+    sanitized = re.sub(r'\n{4,}', '\n\n\n', sanitized)
+
+    return sanitized.strip()
+
+
+def _extract_text(file_content: bytes, max_chars: int) -> str:
+    detected = chardet.detect(file_content[:ENCODING_SAMPLE_BYTES])
+    encoding = detected.get('encoding') or 'utf-8'
+
+    # No encoding needs more than 4 bytes per character
+    data = file_content[:max_chars * 4]
+    try:
+        raw_text = data.decode(encoding)
+    except UnicodeDecodeError:
+        raw_text = data.decode('utf-8', errors='replace')
+    except LookupError:
+        raw_text = data.decode('utf-8', errors='replace')
+    return raw_text[:max_chars]
+
+
+def _extract_pdf(file_content: bytes, max_chars: int) -> str:
+    import PyPDF2
+
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
+    text_content = []
+    length = 0
+    for page in pdf_reader.pages:
+        text = page.extract_text() or ''
+        text_content.append(text)
+        length += len(text) + 2
+        if length >= max_chars:
+            break
+    return '\n\n'.join(text_content)
+
+
+def _extract_docx(file_content: bytes, max_chars: int) -> str:
+    import docx
+
+    doc = docx.Document(io.BytesIO(file_content))
+    text_content = []
+    length = 0
+    for paragraph in doc.paragraphs:
+        text_content.append(paragraph.text)
+        length += len(paragraph.text) + 1
+        if length >= max_chars:
+            break
+    return '\n'.join(text_content)
+
+
+def extract_content(file_content: bytes, filename: str, mime_type: str, max_chars: int) -> str:
+    """Sanitized text of the file, at most about max_chars characters. Runs in a pool worker."""
+    file_extension = Path(filename).suffix.lower()
+
+    if file_extension in TEXT_EXTENSIONS or mime_type.startswith('text/'):
+        raw_text = _extract_text(file_content, max_chars)
+    elif file_extension == '.pdf':
+        raw_text = _extract_pdf(file_content, max_chars)
+    elif file_extension == '.docx':
+        raw_text = _extract_docx(file_content, max_chars)
+    else:
+        raise ValueError(f"Unsupported file format: {file_extension}. Only .txt, .pdf, and .docx files are supported.")
+
+    return sanitize_content(raw_text)[:max_chars]
+
+
+def _init_worker(memory_limit: int) -> None:
+    try:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+class ExtractionPool:
+    def __init__(self, workers: int = EXTRACTION_WORKERS, timeout: float = EXTRACTION_TIMEOUT_SECONDS):
+        self.workers = workers
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Bumped whenever the executor is reset, so jobs can tell whose failure broke their pool
+        self._generation = 0
+        # At most one job per worker is submitted, so the timeout never counts time spent queued
+        self._slots = asyncio.Semaphore(workers)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn rather than fork: the API process runs threads and an event loop
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(WORKER_MEMORY_LIMIT_BYTES,),
+            )
+        return self._executor
+
+    def _reset(self, executor: ProcessPoolExecutor) -> None:
+        """Kill the executor's workers and start a fresh pool on next use."""
+        if self._executor is executor:
+            self._executor = None
+            self._generation += 1
+        for process in list(getattr(executor, '_processes', {}).values()):
+            try:
+                process.kill()
+            except Exception:
+                pass
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def extract(self, file_content: bytes, filename: str, mime_type: str, max_chars: int) -> str:
+        async with self._slots:
+            return await self._extract(file_content, filename, mime_type, max_chars)
+
+    async def _extract(
+        self, file_content: bytes, filename: str, mime_type: str, max_chars: int, retry: bool = True
+    ) -> str:
+        executor = self._get_executor()
+        generation = self._generation
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(executor, extract_content, file_content, filename, mime_type, max_chars),
+                timeout=self.timeout,
+            )
+        except asyncio.TimeoutError:
+            self._reset(executor)
+            raise ExtractionError(f"Extraction timed out after {self.timeout}s")
+        except BrokenProcessPool:
+            if retry and self._generation != generation:
+                # Killed along with another job that timed out or crashed, not because of this file
+                return await self._extract(file_content, filename, mime_type, max_chars, retry=False)
+            self._reset(executor)
+            raise ExtractionError("Extraction worker crashed")
+        except MemoryError:
+            raise ExtractionError(f"Extraction exceeded the {WORKER_MEMORY_LIMIT_BYTES // (1024 * 1024)} MB memory limit")
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+extraction_pool = ExtractionPool()
@@ -5,17 +5,13 @@ import tempfile
 import shutil
 import asyncio
 import subprocess
-import re
 from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 import mimetypes
-import chardet
-
-import PyPDF2
-import docx
 
 from utils.logger import logger
 from services.supabase import DBConnection
+from knowledge_base.extraction import extraction_pool
 
 class FileProcessor:
     SUPPORTED_TEXT_EXTENSIONS = {
@@ -29,6 +25,8 @@ class FileProcessor:
     MAX_FILE_SIZE = 50 * 1024 * 1024
     MAX_ZIP_ENTRIES = 1000
     MAX_CONTENT_LENGTH = 100000
+    # Files extracted concurrently and entries inserted per request
+    BATCH_SIZE = 50
     
     def __init__(self):
         self.db = DBConnection()
@@ -133,67 +131,83 @@ class FileProcessor:
             extracted_files = []
             failed_files = []
             
+            async def extract(file_path: str, file_content) -> Optional[Dict[str, Any]]:
+                if isinstance(file_content, Exception):
+                    raise file_content
+                filename = os.path.basename(file_path)
+                mime_type, _ = mimetypes.guess_type(filename)
+                if not mime_type:
+                    mime_type = 'application/octet-stream'
+                
+                # Errors are reported in failed_files rather than stored as the entry's content
+                content = await extraction_pool.extract(file_content, filename, mime_type, self.MAX_CONTENT_LENGTH)
+                if not content or not content.strip():
+                    return None
+                
+                return {
+                    'agent_id': agent_id,
+                    'account_id': account_id,
+                    'name': f"📄 {filename}",
+                    'description': f"Extracted from {zip_filename}: {file_path}",
+                    'content': content[:self.MAX_CONTENT_LENGTH],
+                    'source_type': 'zip_extracted',
+                    'source_metadata': {
+                        'filename': filename,
+                        'original_path': file_path,
+                        'zip_filename': zip_filename,
+                        'mime_type': mime_type,
+                        'file_size': len(file_content),
+                        'extraction_method': self._get_extraction_method(Path(filename).suffix.lower(), mime_type)
+                    },
+                    'file_size': len(file_content),
+                    'file_mime_type': mime_type,
+                    'extracted_from_zip_id': zip_entry_id,
+                    'usage_context': 'always',
+                    'is_active': True
+                }
+            
             with zipfile.ZipFile(io.BytesIO(zip_content), 'r') as zip_ref:
                 file_list = zip_ref.namelist()
                 
                 if len(file_list) > self.MAX_ZIP_ENTRIES:
                     raise ValueError(f"ZIP contains too many files: {len(file_list)} (max: {self.MAX_ZIP_ENTRIES})")
                 
-                for file_path in file_list:
-                    if file_path.endswith('/'):
-                        continue
+                file_paths = [path for path in file_list if not path.endswith('/') and os.path.basename(path)]
+                
+                for i in range(0, len(file_paths), self.BATCH_SIZE):
+                    batch_paths = file_paths[i:i + self.BATCH_SIZE]
+                    file_contents = await asyncio.to_thread(self._read_zip_members, zip_ref, batch_paths)
                     
-                    try:
-                        file_content = zip_ref.read(file_path)
-                        filename = os.path.basename(file_path)
-                        
-                        if not filename:
-                            continue
-                        
-                        mime_type, _ = mimetypes.guess_type(filename)
-                        if not mime_type:
-                            mime_type = 'application/octet-stream'
-                        
-                        content = await self._extract_file_content(file_content, filename, mime_type)
-                        
-                        if content and content.strip():
-                            extracted_entry_data = {
-                                'agent_id': agent_id,
-                                'account_id': account_id,
-                                'name': f"📄 {filename}",
-                                'description': f"Extracted from {zip_filename}: {file_path}",
-                                'content': content[:self.MAX_CONTENT_LENGTH],
-                                'source_type': 'zip_extracted',
-                                'source_metadata': {
-                                    'filename': filename,
-                                    'original_path': file_path,
-                                    'zip_filename': zip_filename,
-                                    'mime_type': mime_type,
-                                    'file_size': len(file_content),
-                                    'extraction_method': self._get_extraction_method(Path(filename).suffix.lower(), mime_type)
-                                },
-                                'file_size': len(file_content),
-                                'file_mime_type': mime_type,
-                                'extracted_from_zip_id': zip_entry_id,
-                                'usage_context': 'always',
-                                'is_active': True
-                            }
-                            
-                            extracted_result = await client.table('agent_knowledge_base_entries').insert(extracted_entry_data).execute()
-                            
-                            extracted_files.append({
-                                'filename': filename,
+                    results = await asyncio.gather(
+                        *(extract(path, content) for path, content in zip(batch_paths, file_contents)),
+                        return_exceptions=True
+                    )
+                    
+                    entries = []
+                    for file_path, result in zip(batch_paths, results):
+                        if isinstance(result, Exception):
+                            logger.error(f"Error extracting {file_path} from ZIP: {str(result)}")
+                            failed_files.append({
+                                'filename': os.path.basename(file_path),
                                 'path': file_path,
-                                'entry_id': extracted_result.data[0]['entry_id'],
-                                'content_length': len(content)
+                                'error': str(result)
                             })
-                        
-                    except Exception as e:
-                        logger.error(f"Error extracting {file_path} from ZIP: {str(e)}")
-                        failed_files.append({
-                            'filename': os.path.basename(file_path),
-                            'path': file_path,
-                            'error': str(e)
+                        elif result:
+                            entries.append(result)
+                    
+                    for entry, row in zip(entries, await self._insert_entries(client, entries)):
+                        if isinstance(row, Exception):
+                            failed_files.append({
+                                'filename': entry['source_metadata']['filename'],
+                                'path': entry['source_metadata']['original_path'],
+                                'error': str(row)
+                            })
+                            continue
+                        extracted_files.append({
+                            'filename': entry['source_metadata']['filename'],
+                            'path': entry['source_metadata']['original_path'],
+                            'entry_id': row['entry_id'],
+                            'content_length': len(entry['content'])
                         })
             
             return {
@@ -270,71 +284,79 @@ class FileProcessor:
             processed_files = []
             failed_files = []
             
-            for root, dirs, files in os.walk(temp_dir):
-                if '.git' in dirs:
-                    dirs.remove('.git')
+            relative_paths = await asyncio.to_thread(
+                self._list_repository_files, temp_dir, include_patterns, exclude_patterns
+            )
+            
+            async def extract(relative_path: str) -> Optional[Dict[str, Any]]:
+                file = os.path.basename(relative_path)
+                file_path = os.path.join(temp_dir, relative_path)
+                if os.path.getsize(file_path) > self.MAX_FILE_SIZE:
+                    return None
+                file_content = await asyncio.to_thread(Path(file_path).read_bytes)
                 
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(file_path, temp_dir)
-                    
-                    if not self._should_include_file(relative_path, include_patterns, exclude_patterns):
-                        continue
-                    
-                    try:
-                        with open(file_path, 'rb') as f:
-                            file_content = f.read()
-                        
-                        if len(file_content) > self.MAX_FILE_SIZE:
-                            continue
-                        
-                        mime_type, _ = mimetypes.guess_type(file)
-                        if not mime_type:
-                            mime_type = 'application/octet-stream'
-                        
-                        content = await self._extract_file_content(file_content, file, mime_type)
-                        
-                        if content and content.strip():
-                            file_entry_data = {
-                                'agent_id': agent_id,
-                                'account_id': account_id,
-                                'name': f"📄 {file}",
-                                'description': f"From {repo_name}: {relative_path}",
-                                'content': content[:self.MAX_CONTENT_LENGTH],
-                                'source_type': 'git_repo',
-                                'source_metadata': {
-                                    'filename': file,
-                                    'relative_path': relative_path,
-                                    'git_url': git_url,
-                                    'branch': branch,
-                                    'repo_name': repo_name,
-                                    'mime_type': mime_type,
-                                    'file_size': len(file_content),
-                                    'extraction_method': self._get_extraction_method(Path(file).suffix.lower(), mime_type)
-                                },
-                                'file_size': len(file_content),
-                                'file_mime_type': mime_type,
-                                'extracted_from_zip_id': repo_entry_id,
-                                'usage_context': 'always',
-                                'is_active': True
-                            }
-                            
-                            file_result = await client.table('agent_knowledge_base_entries').insert(file_entry_data).execute()
-                            
-                            processed_files.append({
-                                'filename': file,
-                                'relative_path': relative_path,
-                                'entry_id': file_result.data[0]['entry_id'],
-                                'content_length': len(content)
-                            })
-                    
-                    except Exception as e:
-                        logger.error(f"Error processing {relative_path} from git repo: {str(e)}")
+                mime_type, _ = mimetypes.guess_type(file)
+                if not mime_type:
+                    mime_type = 'application/octet-stream'
+                
+                content = await extraction_pool.extract(file_content, file, mime_type, self.MAX_CONTENT_LENGTH)
+                if not content or not content.strip():
+                    return None
+                
+                return {
+                    'agent_id': agent_id,
+                    'account_id': account_id,
+                    'name': f"📄 {file}",
+                    'description': f"From {repo_name}: {relative_path}",
+                    'content': content[:self.MAX_CONTENT_LENGTH],
+                    'source_type': 'git_repo',
+                    'source_metadata': {
+                        'filename': file,
+                        'relative_path': relative_path,
+                        'git_url': git_url,
+                        'branch': branch,
+                        'repo_name': repo_name,
+                        'mime_type': mime_type,
+                        'file_size': len(file_content),
+                        'extraction_method': self._get_extraction_method(Path(file).suffix.lower(), mime_type)
+                    },
+                    'file_size': len(file_content),
+                    'file_mime_type': mime_type,
+                    'extracted_from_zip_id': repo_entry_id,
+                    'usage_context': 'always',
+                    'is_active': True
+                }
+            
+            for i in range(0, len(relative_paths), self.BATCH_SIZE):
+                batch_paths = relative_paths[i:i + self.BATCH_SIZE]
+                results = await asyncio.gather(*(extract(path) for path in batch_paths), return_exceptions=True)
+                
+                entries = []
+                for relative_path, result in zip(batch_paths, results):
+                    if isinstance(result, Exception):
+                        logger.error(f"Error processing {relative_path} from git repo: {str(result)}")
                         failed_files.append({
-                            'filename': file,
+                            'filename': os.path.basename(relative_path),
                             'relative_path': relative_path,
-                            'error': str(e)
+                            'error': str(result)
                         })
+                    elif result:
+                        entries.append(result)
+                
+                for entry, row in zip(entries, await self._insert_entries(client, entries)):
+                    if isinstance(row, Exception):
+                        failed_files.append({
+                            'filename': entry['source_metadata']['filename'],
+                            'relative_path': entry['source_metadata']['relative_path'],
+                            'error': str(row)
+                        })
+                        continue
+                    processed_files.append({
+                        'filename': entry['source_metadata']['filename'],
+                        'relative_path': entry['source_metadata']['relative_path'],
+                        'entry_id': row['entry_id'],
+                        'content_length': len(entry['content'])
+                    })
             
             return {
                 'success': True,
@@ -361,74 +383,62 @@ class FileProcessor:
                 shutil.rmtree(temp_dir, ignore_errors=True)
     
     async def _extract_file_content(self, file_content: bytes, filename: str, mime_type: str) -> str:
-        file_extension = Path(filename).suffix.lower()
-        
         try:
-            if file_extension in self.SUPPORTED_TEXT_EXTENSIONS or mime_type.startswith('text/'):
-                return self._extract_text_content(file_content)
-            
-            elif file_extension == '.pdf':
-                return self._extract_pdf_content(file_content)
-            
-            elif file_extension == '.docx':
-                return self._extract_docx_content(file_content)
-            
-            else:
-                raise ValueError(f"Unsupported file format: {file_extension}. Only .txt, .pdf, and .docx files are supported.")
-        
+            return await extraction_pool.extract(file_content, filename, mime_type, self.MAX_CONTENT_LENGTH)
         except Exception as e:
             logger.error(f"Error extracting content from {filename}: {str(e)}")
             return f"Error extracting content: {str(e)}"
     
-    def _extract_text_content(self, file_content: bytes) -> str:
-        detected = chardet.detect(file_content)
-        encoding = detected.get('encoding', 'utf-8')
-        
+    async def _insert_entries(self, client, entries: List[Dict[str, Any]]) -> List[Any]:
+        """Inserted row of each entry, or the exception raised inserting it.
+
+        Entries are inserted in one request; if that fails they are retried one
+        by one, so a single bad entry doesn't fail the rest of its batch.
+        """
+        if not entries:
+            return []
         try:
-            raw_text = file_content.decode(encoding)
-        except UnicodeDecodeError:
-            raw_text = file_content.decode('utf-8', errors='replace')
-        
-        return self._sanitize_content(raw_text)
-    
-    def _extract_pdf_content(self, file_content: bytes) -> str:
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-        text_content = []
-        
-        for page in pdf_reader.pages:
-            text_content.append(page.extract_text())
+            result = await client.table('agent_knowledge_base_entries').insert(entries).execute()
+            if not result.data or len(result.data) != len(entries):
+                raise Exception(f"Failed to create {len(entries)} knowledge base entries")
+            return result.data
+        except Exception as e:
+            logger.warning(f"Batch insert of {len(entries)} knowledge base entries failed, inserting individually: {str(e)}")
         
-        raw_text = '\n\n'.join(text_content)
-        return self._sanitize_content(raw_text)
+        rows = []
+        for entry in entries:
+            try:
+                result = await client.table('agent_knowledge_base_entries').insert(entry).execute()
+                if not result.data:
+                    raise Exception("Failed to create knowledge base entry")
+                rows.append(result.data[0])
+            except Exception as e:
+                logger.error(f"Error inserting knowledge base entry {entry['name']}: {str(e)}")
+                rows.append(e)
+        return rows
     
-    def _extract_docx_content(self, file_content: bytes) -> str:
-        doc = docx.Document(io.BytesIO(file_content))
-        text_content = []
-        
-        for paragraph in doc.paragraphs:
-            text_content.append(paragraph.text)
-        
-        raw_text = '\n'.join(text_content)
-        return self._sanitize_content(raw_text)
+    def _read_zip_members(self, zip_ref: zipfile.ZipFile, file_paths: List[str]) -> List[Any]:
+        """Contents of the members, or the exception raised reading each one."""
+        contents = []
+        for file_path in file_paths:
+            try:
+                contents.append(zip_ref.read(file_path))
+            except Exception as e:
+                contents.append(e)
+        return contents
     
+    def _list_repository_files(self, repo_dir: str, include_patterns: List[str], exclude_patterns: List[str]) -> List[str]:
+        relative_paths = []
+        for root, dirs, files in os.walk(repo_dir):
+            if '.git' in dirs:
+                dirs.remove('.git')
+            
+            for file in files:
+                relative_path = os.path.relpath(os.path.join(root, file), repo_dir)
+                if self._should_include_file(relative_path, include_patterns, exclude_patterns):
+                    relative_paths.append(relative_path)
+        return relative_paths
     
-    def _sanitize_content(self, content: str) -> str:
-        if not content:
-            return content
-
-        sanitized = ''.join(char for char in content if ord(char) >= 32 or char in '\n\r\t')
-
-        sanitized = sanitized.replace('\x00', '')
-        sanitized = sanitized.replace('\u0000', '')
-        
-        sanitized = sanitized.replace('\ufeff', '')
-        
-        sanitized = sanitized.replace('\r\n', '\n').replace('\r', '\n')
-
-        sanitized = re.sub(r'\n{4,}', '\n\n\n', sanitized)
-
-        return sanitized.strip()
-
     def _get_extraction_method(self, file_extension: str, mime_type: str) -> str:
         if file_extension == '.pdf':
             return 'PyPDF2'
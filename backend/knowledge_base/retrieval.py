@@ -0,0 +1,307 @@
+"""
+Lexical retrieval over agent knowledge bases.
+
+The whole knowledge base used to be pasted into the system prompt of every
+run, so an agent with a few uploaded documents or a cloned repository spent
+tens of thousands of prompt tokens per LLM call on it. Knowledge bases that fit
+in KB_CONTEXT_TOKEN_BUDGET are still injected whole; larger ones are split into
+overlapping chunks and indexed with BM25, and only the chunks most relevant to
+the latest user message are injected, up to the same budget.
+
+Indexes live in the worker process, one per agent. Each run lists the agent's
+entries with their `updated_at` (a cheap query) and only fetches and re-chunks
+entries that were created or changed since the index was last refreshed.
+
+Memory is bounded by the indexed tokens rather than the number of agents: the
+registry evicts the least recently used indexes once all of them hold more than
+MAX_INDEXED_TOKENS, and indexes of knowledge bases over the budget only keep
+their chunks, not the full content of their entries, which only full_context()
+needs. Ranking a large index runs in a thread to keep the event loop free.
+"""
+
+import asyncio
+import math
+import re
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+from utils.logger import logger
+
+KB_CONTEXT_TOKEN_BUDGET = 4000
+TOP_K = 8
+CHUNK_WORDS = 220
+CHUNK_OVERLAP_WORDS = 40
+MAX_INDEXES = 256
+# About 40 MB of indexed text per worker, not counting the term frequencies
+MAX_INDEXED_TOKENS = 10_000_000
+# Rank indexes with more chunks than this in a thread
+SEARCH_THREAD_MIN_CHUNKS = 2000
+FETCH_BATCH_SIZE = 50
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+KB_HEADER = "# AGENT KNOWLEDGE BASE\n\nThe following is your specialized knowledge base. Use this information as context when responding:"
+KB_RETRIEVAL_HEADER = "# AGENT KNOWLEDGE BASE\n\nThe following excerpts from your specialized knowledge base are the most relevant to the current request. Use this information as context when responding:"
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset("""
+a an and are as at be but by for from has have how i if in into is it its of on or so that the their then there
+these this to was were what when where which who why will with you your
+""".split())
+
+
+def estimate_tokens(text: str) -> int:
+    # Same estimate the database uses for content_tokens
+    return len(text) // 4
+
+
+def tokenize(text: str) -> List[str]:
+    return [word for word in _WORD.findall(text.lower()) if len(word) > 1 and word not in _STOPWORDS]
+
+
+def chunk_text(text: str, chunk_words: int = CHUNK_WORDS, overlap_words: int = CHUNK_OVERLAP_WORDS) -> List[str]:
+    """Split text into chunks of at most chunk_words words, packing whole paragraphs where possible.
+
+    Paragraphs longer than a chunk are cut into windows overlapping by overlap_words.
+    """
+    pieces: List[List[str]] = []
+    step = chunk_words - overlap_words
+    for paragraph in re.split(r"\n\s*\n", text):
+        words = paragraph.split()
+        if len(words) <= chunk_words:
+            if words:
+                pieces.append(words)
+            continue
+        for start in range(0, len(words) - overlap_words, step):
+            pieces.append(words[start:start + chunk_words])
+
+    chunks: List[str] = []
+    current: List[str] = []
+    current_words = 0
+    for words in pieces:
+        if current and current_words + len(words) > chunk_words:
+            chunks.append("\n\n".join(current))
+            current, current_words = [], 0
+        current.append(" ".join(words))
+        current_words += len(words)
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+@dataclass
+class Chunk:
+    entry_id: str
+    name: str
+    text: str
+    term_freqs: Counter
+    length: int
+
+
+@dataclass
+class IndexedEntry:
+    entry_id: str
+    name: str
+    description: Optional[str]
+    # Dropped once the knowledge base is over KB_CONTEXT_TOKEN_BUDGET; only full_context() uses it
+    content: Optional[str]
+    created_at: str
+    updated_at: str
+    tokens: int = 0
+    chunks: List[Chunk] = field(default_factory=list)
+
+
+class KnowledgeBaseIndex:
+    """BM25 index over the chunks of one agent's active knowledge base entries."""
+
+    def __init__(self, agent_id: str):
+        self.agent_id = agent_id
+        self.entries: Dict[str, IndexedEntry] = {}
+        self._doc_freqs: Counter = Counter()
+        self._chunk_count = 0
+        self._total_length = 0
+        self.total_tokens = 0
+
+    def _add(self, row: dict) -> None:
+        entry = IndexedEntry(
+            entry_id=row['entry_id'],
+            name=row['name'],
+            description=row.get('description'),
+            content=row['content'],
+            created_at=row.get('created_at') or '',
+            updated_at=row.get('updated_at') or '',
+        )
+        heading = f"{entry.name}\n{entry.description or ''}"
+        for text in chunk_text(entry.content):
+            term_freqs = Counter(tokenize(f"{heading}\n{text}"))
+            entry.chunks.append(Chunk(entry.entry_id, entry.name, text, term_freqs, sum(term_freqs.values())))
+
+        for chunk in entry.chunks:
+            self._doc_freqs.update(chunk.term_freqs.keys())
+            self._total_length += chunk.length
+        self._chunk_count += len(entry.chunks)
+        entry.tokens = estimate_tokens(entry.content) + estimate_tokens(heading)
+        self.total_tokens += entry.tokens
+        self.entries[entry.entry_id] = entry
+
+    def _remove(self, entry_id: str) -> None:
+        entry = self.entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for chunk in entry.chunks:
+            self._doc_freqs.subtract(chunk.term_freqs.keys())
+            self._total_length -= chunk.length
+        self._doc_freqs += Counter()  # drop terms whose count reached zero
+        self._chunk_count -= len(entry.chunks)
+        self.total_tokens -= entry.tokens
+
+    async def _fetch(self, client, entry_ids: List[str]) -> None:
+        for i in range(0, len(entry_ids), FETCH_BATCH_SIZE):
+            batch = entry_ids[i:i + FETCH_BATCH_SIZE]
+            result = await client.table('agent_knowledge_base_entries').select(
+                'entry_id, name, description, content, created_at, updated_at'
+            ).in_('entry_id', batch).execute()
+            for row in result.data or []:
+                self._remove(row['entry_id'])
+                self._add(row)
+
+    async def refresh(self, client) -> None:
+        """Bring the index up to date, fetching only entries created or changed since the last refresh."""
+        listing = await client.table('agent_knowledge_base_entries').select('entry_id, updated_at').eq(
+            'agent_id', self.agent_id
+        ).eq('is_active', True).in_('usage_context', ['always', 'contextual']).execute()
+
+        current = {row['entry_id']: row['updated_at'] for row in listing.data or []}
+        for entry_id in [entry_id for entry_id in self.entries if entry_id not in current]:
+            self._remove(entry_id)
+
+        changed = [
+            entry_id for entry_id, updated_at in current.items()
+            if entry_id not in self.entries or self.entries[entry_id].updated_at != updated_at
+        ]
+        await self._fetch(client, changed)
+
+        if self.total_tokens > KB_CONTEXT_TOKEN_BUDGET:
+            for entry in self.entries.values():
+                entry.content = None
+        else:
+            # The knowledge base shrank back under the budget; full_context() needs the content again
+            await self._fetch(client, [entry.entry_id for entry in self.entries.values() if entry.content is None])
+
+        if changed:
+            logger.debug(f"Knowledge base index for agent {self.agent_id}: {len(changed)} entries (re)indexed, {len(self.entries)} entries, {self._chunk_count} chunks")
+
+    def _ordered_entries(self) -> List[IndexedEntry]:
+        return sorted(self.entries.values(), key=lambda entry: entry.created_at, reverse=True)
+
+    def full_context(self) -> Optional[str]:
+        """Every entry, formatted like the get_agent_knowledge_base_context RPC."""
+        if not self.entries:
+            return None
+        context = KB_HEADER
+        for entry in self._ordered_entries():
+            context += f"\n\n## {entry.name}\n"
+            if entry.description:
+                context += f"{entry.description}\n\n"
+            context += entry.content
+        return context
+
+    @staticmethod
+    def _rank(chunks: List[Chunk], terms: Set[str], idfs: Dict[str, float], avg_length: float) -> List[Chunk]:
+        scored = []
+        for chunk in chunks:
+            score = 0.0
+            for term in terms:
+                freq = chunk.term_freqs.get(term)
+                if not freq:
+                    continue
+                score += idfs[term] * freq * (BM25_K1 + 1) / (freq + BM25_K1 * (1 - BM25_B + BM25_B * chunk.length / avg_length))
+            if score > 0:
+                scored.append((score, chunk))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [chunk for _, chunk in scored]
+
+    async def search(self, query: str, top_k: int = TOP_K, token_budget: int = KB_CONTEXT_TOKEN_BUDGET) -> List[Chunk]:
+        """Best matching chunks for the query, at most top_k and within token_budget."""
+        terms = set(tokenize(query))
+        if terms and self._chunk_count:
+            avg_length = self._total_length / self._chunk_count or 1
+            idfs = {}
+            for term in terms:
+                doc_freq = self._doc_freqs[term]
+                idfs[term] = math.log(1 + (self._chunk_count - doc_freq + 0.5) / (doc_freq + 0.5))
+            # A snapshot, so a refresh on the loop can't change the index under the thread
+            chunks = [chunk for entry in self.entries.values() for chunk in entry.chunks]
+            if len(chunks) > SEARCH_THREAD_MIN_CHUNKS:
+                candidates = await asyncio.to_thread(self._rank, chunks, terms, idfs, avg_length)
+            else:
+                candidates = self._rank(chunks, terms, idfs, avg_length)
+        else:
+            candidates = []
+
+        if not candidates:
+            # Nothing to rank by: fall back to the beginning of the most recent entries
+            candidates = [chunk for entry in self._ordered_entries() for chunk in entry.chunks]
+
+        selected = []
+        used_tokens = 0
+        for chunk in candidates:
+            tokens = estimate_tokens(chunk.text) + estimate_tokens(chunk.name)
+            if used_tokens + tokens > token_budget:
+                continue
+            selected.append(chunk)
+            used_tokens += tokens
+            if len(selected) >= top_k:
+                break
+        return selected
+
+    async def retrieved_context(self, query: str, top_k: int = TOP_K, token_budget: int = KB_CONTEXT_TOKEN_BUDGET) -> Optional[str]:
+        chunks = await self.search(query, top_k, token_budget)
+        if not chunks:
+            return None
+        context = KB_RETRIEVAL_HEADER
+        for chunk in chunks:
+            context += f"\n\n## {chunk.name}\n{chunk.text}"
+        return context
+
+
+class KnowledgeBaseIndexRegistry:
+    def __init__(self, max_indexes: int = MAX_INDEXES, max_tokens: int = MAX_INDEXED_TOKENS):
+        self._max_indexes = max_indexes
+        self._max_tokens = max_tokens
+        self._indexes: "OrderedDict[str, KnowledgeBaseIndex]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def get(self, client, agent_id: str) -> KnowledgeBaseIndex:
+        """The agent's index, refreshed against the database."""
+        lock = self._locks.setdefault(agent_id, asyncio.Lock())
+        async with lock:
+            index = self._indexes.get(agent_id)
+            if index is None:
+                index = KnowledgeBaseIndex(agent_id)
+                self._indexes[agent_id] = index
+            self._indexes.move_to_end(agent_id)
+            await index.refresh(client)
+            self._evict(agent_id)
+            return index
+
+    def _evict(self, current_id: str) -> None:
+        """Drop least recently used indexes until both the count and the indexed tokens fit."""
+        total_tokens = sum(index.total_tokens for index in self._indexes.values())
+        for agent_id in list(self._indexes):
+            if len(self._indexes) <= self._max_indexes and total_tokens <= self._max_tokens:
+                return
+            if agent_id == current_id:
+                continue
+            total_tokens -= self._indexes.pop(agent_id).total_tokens
+            self._locks.pop(agent_id, None)
+
+        if total_tokens > self._max_tokens and current_id in self._indexes:
+            # Too large to keep on its own; the caller still gets it for this run
+            logger.debug(f"Knowledge base index for agent {current_id} holds {total_tokens} tokens, not keeping it")
+            del self._indexes[current_id]
+
+
+kb_indexes = KnowledgeBaseIndexRegistry()
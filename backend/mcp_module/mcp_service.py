@@ -14,6 +14,7 @@ from mcp.client.streamable_http import streamablehttp_client
 
 from utils.logger import logger
 from credentials import EncryptionService
+from .session_pool import mcp_session_pool, MCPServerSpec
 
 
 class MCPException(Exception):
@@ -51,6 +52,7 @@ class MCPConnection:
     external_user_id: Optional[str] = None
     session: Optional[ClientSession] = field(default=None, compare=False)
     tools: Optional[List[Any]] = field(default=None, compare=False)
+    server: Optional[MCPServerSpec] = field(default=None, compare=False)
 
 
 @dataclass(frozen=True)
@@ -125,32 +127,26 @@ class MCPService:
             # Add debugging
             self._logger.debug(f"MCP connection details - Provider: {request.provider}, URL: {server_url}, Headers: {headers}")
             
-            # Add timeout to prevent hanging
-            async with asyncio.timeout(30):
-                async with streamablehttp_client(server_url, headers=headers) as (
-                    read_stream, write_stream, _
-                ):
-                    session = ClientSession(read_stream, write_stream)
-                    await session.initialize()
-                    
-                    tool_result = await session.list_tools()
-                    tools = tool_result.tools if tool_result else []
-                    
-                    connection = MCPConnection(
-                        qualified_name=request.qualified_name,
-                        name=request.name,
-                        config=request.config,
-                        enabled_tools=request.enabled_tools,
-                        provider=request.provider,
-                        external_user_id=request.external_user_id,
-                        session=session,
-                        tools=tools
-                    )
-                    
-                    self._connections[request.qualified_name] = connection
-                    self._logger.debug(f"Connected to {request.qualified_name} ({len(tools)} tools available)")
-                    
-                    return connection
+            # The session stays open in the shared pool and is reused by execute_tool
+            server = MCPServerSpec.http(server_url, headers)
+            tool_result = await mcp_session_pool.list_tools(server, timeout=30)
+            tools = tool_result.tools if tool_result else []
+            
+            connection = MCPConnection(
+                qualified_name=request.qualified_name,
+                name=request.name,
+                config=request.config,
+                enabled_tools=request.enabled_tools,
+                provider=request.provider,
+                external_user_id=request.external_user_id,
+                tools=tools,
+                server=server
+            )
+            
+            self._connections[request.qualified_name] = connection
+            self._logger.debug(f"Connected to {request.qualified_name} ({len(tools)} tools available)")
+            
+            return connection
                     
         except asyncio.TimeoutError:
             error_msg = f"Connection timeout for {request.qualified_name} after 30 seconds"
@@ -184,15 +180,9 @@ class MCPService:
                 continue
     
     async def disconnect_server(self, qualified_name: str) -> None:
-        connection = self._connections.get(qualified_name)
-        if connection and connection.session:
-            try:
-                await connection.session.close()
-                self._logger.debug(f"Disconnected from {qualified_name}")
-            except Exception as e:
-                self._logger.warning(f"Error disconnecting from {qualified_name}: {str(e)}")
-        
-        self._connections.pop(qualified_name, None)
+        # Pooled sessions are shared across runs; idle ones are evicted by the pool
+        if self._connections.pop(qualified_name, None):
+            self._logger.debug(f"Disconnected from {qualified_name}")
     
     async def disconnect_all(self) -> None:
         for qualified_name in list(self._connections.keys()):
@@ -244,14 +234,14 @@ class MCPService:
         if not connection:
             raise MCPToolNotFoundError(f"Tool not found: {request.tool_name}")
         
-        if not connection.session:
+        if not connection.server:
             raise MCPToolExecutionError(f"No active session for tool: {request.tool_name}")
         
         if request.tool_name not in connection.enabled_tools:
             raise MCPToolExecutionError(f"Tool not enabled: {request.tool_name}")
         
         try:
-            result = await connection.session.call_tool(request.tool_name, request.arguments)
+            result = await mcp_session_pool.call_tool(connection.server, request.tool_name, request.arguments)
             
             self._logger.debug(f"Tool {request.tool_name} executed successfully")
             
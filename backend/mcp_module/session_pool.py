@@ -0,0 +1,301 @@
+import asyncio
+import hashlib
+import json
+import time
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+import anyio
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.sse import sse_client
+from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
+
+from utils.logger import logger
+
+
+T = TypeVar("T")
+
+# Sessions unused for this long are closed by the reaper
+IDLE_TTL_SECONDS = 300
+# Idle sessions are pinged before reuse if they have not been used for this long
+HEALTH_CHECK_INTERVAL_SECONDS = 30
+# Maximum in-flight calls per server session
+MAX_CONCURRENT_CALLS_PER_SERVER = 8
+CONNECT_TIMEOUT_SECONDS = 30
+PING_TIMEOUT_SECONDS = 5
+
+# Errors raised by the MCP transports when the underlying connection is gone
+_CONNECTION_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream, ConnectionError)
+
+
+def _hash_mapping(mapping: Optional[Dict[str, Any]]) -> str:
+    if not mapping:
+        return ""
+    return hashlib.sha256(json.dumps(mapping, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+@dataclass(frozen=True)
+class MCPServerSpec:
+    """Connection parameters identifying one MCP server endpoint.
+
+    Secrets in headers/env are kept out of the pool key, which only carries
+    their hash.
+    """
+    transport: str
+    url: Optional[str] = None
+    headers: Optional[Dict[str, str]] = field(default=None, compare=False, hash=False)
+    command: Optional[str] = None
+    args: Tuple[str, ...] = ()
+    env: Optional[Dict[str, str]] = field(default=None, compare=False, hash=False)
+
+    @classmethod
+    def http(cls, url: str, headers: Optional[Dict[str, str]] = None) -> "MCPServerSpec":
+        return cls(transport="http", url=url, headers=headers or None)
+
+    @classmethod
+    def sse(cls, url: str, headers: Optional[Dict[str, str]] = None) -> "MCPServerSpec":
+        return cls(transport="sse", url=url, headers=headers or None)
+
+    @classmethod
+    def stdio(cls, command: str, args: Optional[list] = None, env: Optional[Dict[str, str]] = None) -> "MCPServerSpec":
+        return cls(transport="stdio", command=command, args=tuple(args or ()), env=env or None)
+
+    @property
+    def key(self) -> Tuple[str, ...]:
+        if self.transport == "stdio":
+            return (self.transport, self.command or "", *self.args, _hash_mapping(self.env))
+        return (self.transport, self.url or "", _hash_mapping(self.headers))
+
+    @property
+    def label(self) -> str:
+        return self.url if self.transport != "stdio" else f"{self.command} {' '.join(self.args)}".strip()
+
+
+class _PooledSession:
+    """One live MCP session owned by a dedicated task.
+
+    The MCP transports are anyio task-group based and must be entered and
+    exited from the same task, so the transport context lives in ``_run``
+    and callers only share the resulting ClientSession.
+    """
+
+    def __init__(self, spec: MCPServerSpec, max_concurrency: int):
+        self.spec = spec
+        self.session: Optional[ClientSession] = None
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.last_used = time.monotonic()
+        self.in_flight = 0
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._error: Optional[BaseException] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def start(self, timeout: float) -> None:
+        self._task = asyncio.create_task(self._run(), name=f"mcp-session:{self.spec.transport}:{self.spec.label}")
+        try:
+            async with asyncio.timeout(timeout):
+                await self._ready.wait()
+        except asyncio.TimeoutError:
+            await self.close()
+            raise
+        if self._error:
+            raise self._error
+
+    async def _run(self) -> None:
+        try:
+            async with AsyncExitStack() as stack:
+                read, write = await self._open_transport(stack)
+                session = await stack.enter_async_context(ClientSession(read, write))
+                await session.initialize()
+                self.session = session
+                self._ready.set()
+                await self._closing.wait()
+        except BaseException as e:
+            if not self._ready.is_set():
+                self._error = e
+            else:
+                logger.debug(f"MCP session for {self.spec.label} ended: {e}")
+        finally:
+            self.session = None
+            self._ready.set()
+
+    async def _open_transport(self, stack: AsyncExitStack):
+        spec = self.spec
+        if spec.transport == "http":
+            read, write, _ = await stack.enter_async_context(
+                streamablehttp_client(spec.url, headers=spec.headers) if spec.headers
+                else streamablehttp_client(spec.url)
+            )
+            return read, write
+        if spec.transport == "sse":
+            if not spec.headers:
+                return await stack.enter_async_context(sse_client(spec.url))
+            try:
+                return await stack.enter_async_context(sse_client(spec.url, headers=spec.headers))
+            except TypeError as e:
+                if "unexpected keyword argument" not in str(e):
+                    raise
+                return await stack.enter_async_context(sse_client(spec.url))
+        if spec.transport == "stdio":
+            server_params = StdioServerParameters(
+                command=spec.command,
+                args=list(spec.args),
+                env=spec.env or {}
+            )
+            return await stack.enter_async_context(stdio_client(server_params))
+        raise ValueError(f"Unsupported MCP transport: {spec.transport}")
+
+    async def ping(self) -> bool:
+        if not self.alive:
+            return False
+        try:
+            async with asyncio.timeout(PING_TIMEOUT_SECONDS):
+                await self.session.send_ping()
+            return True
+        except Exception as e:
+            logger.debug(f"MCP health check failed for {self.spec.label}: {e}")
+            return False
+
+    async def close(self) -> None:
+        self._closing.set()
+        if self._task and not self._task.done():
+            try:
+                async with asyncio.timeout(PING_TIMEOUT_SECONDS):
+                    await asyncio.shield(self._task)
+            except (asyncio.TimeoutError, Exception):
+                self._task.cancel()
+
+
+class MCPSessionPool:
+    """Process-wide pool of initialized MCP client sessions.
+
+    Sessions are keyed by transport and endpoint (URL plus headers hash, or
+    command plus args/env hash), reused across tool calls, health-checked
+    after being idle, evicted after ``idle_ttl`` and transparently
+    re-established once when a call fails on a broken connection.
+    """
+
+    def __init__(
+        self,
+        idle_ttl: float = IDLE_TTL_SECONDS,
+        health_check_interval: float = HEALTH_CHECK_INTERVAL_SECONDS,
+        max_concurrency: int = MAX_CONCURRENT_CALLS_PER_SERVER,
+    ):
+        self._idle_ttl = idle_ttl
+        self._health_check_interval = health_check_interval
+        self._max_concurrency = max_concurrency
+        self._sessions: Dict[Tuple[str, ...], _PooledSession] = {}
+        self._connecting: Dict[Tuple[str, ...], asyncio.Future] = {}
+        self._reaper: Optional[asyncio.Task] = None
+
+    async def call_tool(self, spec: MCPServerSpec, tool_name: str, arguments: Dict[str, Any], timeout: float = 30):
+        return await self._run(spec, lambda session: session.call_tool(tool_name, arguments), timeout)
+
+    async def list_tools(self, spec: MCPServerSpec, timeout: float = 15):
+        return await self._run(spec, lambda session: session.list_tools(), timeout)
+
+    async def close(self, spec: MCPServerSpec) -> None:
+        pooled = self._sessions.pop(spec.key, None)
+        if pooled:
+            await pooled.close()
+
+    async def close_all(self) -> None:
+        if self._reaper:
+            self._reaper.cancel()
+            self._reaper = None
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        await asyncio.gather(*(pooled.close() for pooled in sessions), return_exceptions=True)
+        logger.debug(f"Closed {len(sessions)} pooled MCP sessions")
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "sessions": len(self._sessions),
+            "servers": [
+                {
+                    "transport": pooled.spec.transport,
+                    "endpoint": pooled.spec.label,
+                    "in_flight": pooled.in_flight,
+                    "idle_seconds": round(now - pooled.last_used, 1),
+                }
+                for pooled in self._sessions.values()
+            ],
+        }
+
+    async def _run(self, spec: MCPServerSpec, operation: Callable[[ClientSession], Awaitable[T]], timeout: float) -> T:
+        async with asyncio.timeout(timeout):
+            for attempt in range(2):
+                pooled = await self._acquire(spec)
+                async with pooled.semaphore:
+                    pooled.in_flight += 1
+                    try:
+                        return await operation(pooled.session)
+                    except Exception as e:
+                        if attempt == 0 and (not pooled.alive or isinstance(e, _CONNECTION_ERRORS)):
+                            logger.warning(f"MCP session for {spec.label} dropped ({e}), reconnecting")
+                            await self._evict(spec.key, pooled)
+                            continue
+                        raise
+                    finally:
+                        pooled.in_flight -= 1
+                        pooled.last_used = time.monotonic()
+
+    async def _acquire(self, spec: MCPServerSpec) -> _PooledSession:
+        key = spec.key
+        pooled = self._sessions.get(key)
+        if pooled:
+            idle_for = time.monotonic() - pooled.last_used
+            if pooled.alive and (pooled.in_flight or idle_for < self._health_check_interval or await pooled.ping()):
+                return pooled
+            await self._evict(key, pooled)
+
+        # Single-flight connect so concurrent callers share one handshake
+        pending = self._connecting.get(key)
+        if pending:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._connecting[key] = future
+        try:
+            pooled = _PooledSession(spec, self._max_concurrency)
+            await pooled.start(CONNECT_TIMEOUT_SECONDS)
+            self._sessions[key] = pooled
+            self._ensure_reaper()
+            logger.debug(f"Opened pooled MCP session ({spec.transport}) for {spec.label}")
+            future.set_result(pooled)
+            return pooled
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved so an unawaited failure does not log a warning
+            future.exception()
+            raise
+        finally:
+            self._connecting.pop(key, None)
+
+    async def _evict(self, key: Tuple[str, ...], pooled: _PooledSession) -> None:
+        if self._sessions.get(key) is pooled:
+            del self._sessions[key]
+        await pooled.close()
+
+    def _ensure_reaper(self) -> None:
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_idle_sessions())
+
+    async def _reap_idle_sessions(self) -> None:
+        while self._sessions:
+            await asyncio.sleep(min(self._idle_ttl, 60))
+            now = time.monotonic()
+            for key, pooled in list(self._sessions.items()):
+                if not pooled.alive or (not pooled.in_flight and now - pooled.last_used > self._idle_ttl):
+                    logger.debug(f"Evicting idle MCP session for {pooled.spec.label}")
+                    await self._evict(key, pooled)
+
+
+mcp_session_pool = MCPSessionPool()
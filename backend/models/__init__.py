@@ -1,6 +1,7 @@
 from .registry import ModelRegistry, registry
 from .models import Model, ModelProvider, ModelCapability
 from .manager import ModelManager, model_manager
+from .pricing import PricingTable, pricing_table
 
 __all__ = [
     'ModelRegistry',
@@ -10,4 +11,6 @@ __all__ = [
     'ModelCapability',
     'ModelManager',
     'model_manager',
+    'PricingTable',
+    'pricing_table',
 ] 
\ No newline at end of file
@@ -0,0 +1,132 @@
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from litellm import model_cost
+from litellm.cost_calculator import cost_per_token
+
+from utils.logger import logger
+from .registry import ModelRegistry, registry
+
+# Tokens used to probe litellm's per-token rates, below any tiered pricing threshold
+_PROBE_TOKENS = 1000
+
+
+@dataclass(frozen=True)
+class PriceEntry:
+    """Per-million-token prices for one model name.
+
+    ``litellm_model`` is set when the price comes from litellm; models with
+    tiered (context-length dependent) prices are priced through litellm on
+    every call instead of from the linear rates.
+    """
+    input_cost_per_million_tokens: float
+    output_cost_per_million_tokens: float
+    litellm_model: Optional[str] = None
+    tiered: bool = False
+
+    def cost(self, prompt_tokens: int, completion_tokens: int) -> float:
+        if self.tiered:
+            prompt_cost, completion_cost = cost_per_token(self.litellm_model, prompt_tokens, completion_tokens)
+            return prompt_cost + completion_cost
+        input_cost = (prompt_tokens / 1_000_000) * self.input_cost_per_million_tokens
+        output_cost = (completion_tokens / 1_000_000) * self.output_cost_per_million_tokens
+        return input_cost + output_cost
+
+
+class PricingTable:
+    """Model name -> price lookup, resolved once per name.
+
+    Registry ids and aliases with explicit pricing are loaded up front. Other
+    names are resolved on first use the way billing always has (registry
+    resolution, then litellm's price map under a few name variants) and the
+    result, including "no price", is memoized.
+    """
+
+    def __init__(self, model_registry: ModelRegistry = registry):
+        self._registry = model_registry
+        self._entries: Dict[str, Optional[PriceEntry]] = {}
+        self._load_registry()
+
+    def _load_registry(self) -> None:
+        for model in self._registry.get_all(enabled_only=False):
+            if not model.pricing:
+                continue
+            entry = PriceEntry(
+                model.pricing.input_cost_per_million_tokens,
+                model.pricing.output_cost_per_million_tokens,
+            )
+            for name in [model.id, *model.aliases]:
+                self._entries[name] = entry
+        logger.debug(f"Loaded {len(self._entries)} model prices from the registry")
+
+    def get(self, model: str) -> Optional[PriceEntry]:
+        if model not in self._entries:
+            self._entries[model] = self._resolve(model)
+        return self._entries[model]
+
+    def cost(self, prompt_tokens: int, completion_tokens: int, model: str) -> float:
+        """Cost in dollars, or 0.0 for models without a known price."""
+        entry = self.get(model)
+        if entry is None:
+            return 0.0
+        return entry.cost(prompt_tokens, completion_tokens)
+
+    def cost_batch(self, rows: Iterable[Tuple[int, int, str]]) -> List[float]:
+        """Costs of (prompt_tokens, completion_tokens, model) rows, resolving each distinct model once."""
+        rows = list(rows)
+        entries = {model: self.get(model) for model in {row[2] for row in rows}}
+        return [
+            entries[model].cost(prompt_tokens, completion_tokens) if entries[model] else 0.0
+            for prompt_tokens, completion_tokens, model in rows
+        ]
+
+    def _resolve(self, model: str) -> Optional[PriceEntry]:
+        resolved_model = self._registry.resolve_model_id(model) or model
+        if resolved_model in self._entries and self._entries[resolved_model]:
+            return self._entries[resolved_model]
+
+        for name in self._litellm_variants(model, resolved_model):
+            entry = self._litellm_entry(name)
+            if entry:
+                logger.debug(f"Priced model '{model}' via litellm as '{name}'")
+                return entry
+
+        logger.debug(f"No pricing found for model '{model}' (resolved: '{resolved_model}')")
+        return None
+
+    @staticmethod
+    def _litellm_variants(model: str, resolved_model: str) -> List[str]:
+        variants = [model]
+        if resolved_model != model:
+            variants.append(resolved_model)
+        # Try without provider prefix if it has one
+        if '/' in model:
+            variants.append(model.split('/', 1)[1])
+        if '/' in resolved_model and resolved_model != model:
+            variants.append(resolved_model.split('/', 1)[1])
+        # Google models accessed via OpenRouter
+        for name in (model, resolved_model):
+            if name.startswith('openrouter/google/'):
+                variants.append(name.replace('openrouter/', ''))
+        return list(dict.fromkeys(variants))
+
+    @staticmethod
+    def _litellm_entry(name: str) -> Optional[PriceEntry]:
+        try:
+            prompt_cost, _ = cost_per_token(name, _PROBE_TOKENS, 0)
+            _, completion_cost = cost_per_token(name, 0, _PROBE_TOKENS)
+        except Exception as e:
+            logger.debug(f"Failed to get pricing for model variation {name}: {str(e)}")
+            return None
+        if prompt_cost is None or completion_cost is None:
+            return None
+        tiered = any('above' in key for key in model_cost.get(name, {}))
+        return PriceEntry(
+            prompt_cost * 1_000_000 / _PROBE_TOKENS,
+            completion_cost * 1_000_000 / _PROBE_TOKENS,
+            litellm_model=name,
+            tiered=tiered,
+        )
+
+
+pricing_table = PricingTable()
@@ -8,6 +8,7 @@ from pydantic import BaseModel
 from daytona_sdk import AsyncSandbox
 
 from sandbox.sandbox import get_or_start_sandbox, delete_sandbox
+from sandbox.handles import sandbox_handles
 from utils.logger import logger
 from utils.auth_utils import get_optional_user_id, verify_and_get_user_id_from_jwt, verify_sandbox_access, verify_sandbox_access_optional
 from services.supabase import DBConnection
@@ -314,6 +315,7 @@ async def delete_sandbox_route(
     try:
         # Delete the sandbox using the sandbox module function
         await delete_sandbox(sandbox_id)
+        sandbox_handles.evict_sandbox(sandbox_id)
         
         return {"status": "success", "deleted": True, "sandbox_id": sandbox_id}
     except Exception as e:
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Shared Playwright Chromium pool for the presentation converters.
+
+The PDF and PPTX routers used to launch a fresh Chromium for every request,
+which costs 1-2 seconds per export. The pool keeps one browser running for the
+lifetime of the server (started from the server lifespan, or lazily on first
+use) and hands out pages from a bounded set of reusable browser contexts:
+
+- at most MAX_CONCURRENT_PAGES pages are open at once; further callers wait;
+- a context is closed after CONTEXT_MAX_USES pages, the browser is relaunched
+  after BROWSER_MAX_USES pages so long-lived Chromium memory growth is bounded;
+- a disconnected browser is detected before each lease and relaunched.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+try:
+    from playwright.async_api import async_playwright, Browser, BrowserContext, Page, Playwright
+except ImportError:
+    raise ImportError("Playwright is not installed. Please install it with: pip install playwright")
+
+
+MAX_CONCURRENT_PAGES = 6
+CONTEXT_MAX_USES = 50
+BROWSER_MAX_USES = 500
+
+VIEWPORT = {"width": 1920, "height": 1080}
+
+BROWSER_ARGS = [
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-gpu',
+    '--force-device-scale-factor=1',
+    '--disable-background-timer-throttling',
+    '--disable-backgrounding-occluded-windows',
+    '--disable-renderer-backgrounding',
+    '--disable-features=VizDisplayCompositor',
+    '--disable-extensions',
+    '--disable-plugins',
+    '--disable-web-security',
+    '--disable-features=TranslateUI',
+    '--disable-ipc-flooding-protection'
+]
+
+
+class _PooledBrowser:
+    """A launched browser with its idle contexts and usage counters."""
+
+    def __init__(self, browser: Browser):
+        self.browser = browser
+        self.idle_contexts: List[BrowserContext] = []
+        self.context_uses = {}
+        self.uses = 0
+        self.active = 0
+        self.retired = False
+
+    async def close(self) -> None:
+        try:
+            await self.browser.close()
+        except Exception as e:
+            print(f"⚠️ Error closing pooled browser: {e}")
+
+
+class BrowserPool:
+    def __init__(
+        self,
+        max_concurrent_pages: int = MAX_CONCURRENT_PAGES,
+        context_max_uses: int = CONTEXT_MAX_USES,
+        browser_max_uses: int = BROWSER_MAX_USES,
+    ):
+        self.context_max_uses = context_max_uses
+        self.browser_max_uses = browser_max_uses
+        self._semaphore = asyncio.Semaphore(max_concurrent_pages)
+        self._lock = asyncio.Lock()
+        self._playwright: Optional[Playwright] = None
+        self._current: Optional[_PooledBrowser] = None
+        self._launches = 0
+
+    async def start(self) -> None:
+        async with self._lock:
+            await self._ensure_browser()
+
+    async def stop(self) -> None:
+        async with self._lock:
+            if self._current:
+                await self._current.close()
+                self._current = None
+            if self._playwright:
+                await self._playwright.stop()
+                self._playwright = None
+
+    def stats(self) -> dict:
+        current = self._current
+        return {
+            "running": bool(current and current.browser.is_connected()),
+            "launches": self._launches,
+            "renders_on_current_browser": current.uses if current else 0,
+            "active_pages": current.active if current else 0,
+            "idle_contexts": len(current.idle_contexts) if current else 0,
+        }
+
+    @asynccontextmanager
+    async def page(self):
+        """Lease a fresh page with the presentation viewport from a pooled context."""
+        async with self._semaphore:
+            pooled, context = await self._acquire_context()
+            page: Optional[Page] = None
+            healthy = False
+            try:
+                page = await context.new_page()
+                yield page
+                healthy = True
+            finally:
+                if page is not None:
+                    try:
+                        await page.close()
+                    except Exception:
+                        healthy = False
+                await self._release_context(pooled, context, healthy)
+
+    async def _ensure_browser(self) -> _PooledBrowser:
+        if self._current and not self._current.retired and self._current.browser.is_connected():
+            return self._current
+
+        if self._current:
+            # Unhealthy or worn out: retire it and close once its last page is released
+            old = self._current
+            old.retired = True
+            self._current = None
+            if old.active == 0 or not old.browser.is_connected():
+                await old.close()
+
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        print("🌐 Launching pooled browser...")
+        browser = await self._playwright.chromium.launch(headless=True, args=BROWSER_ARGS)
+        self._launches += 1
+        self._current = _PooledBrowser(browser)
+        return self._current
+
+    async def _acquire_context(self) -> tuple:
+        async with self._lock:
+            pooled = await self._ensure_browser()
+            if pooled.idle_contexts:
+                context = pooled.idle_contexts.pop()
+            else:
+                context = await pooled.browser.new_context(viewport=VIEWPORT, device_scale_factor=1)
+                pooled.context_uses[id(context)] = 0
+            pooled.uses += 1
+            pooled.active += 1
+            pooled.context_uses[id(context)] += 1
+            if pooled.uses >= self.browser_max_uses:
+                pooled.retired = True
+            return pooled, context
+
+    async def _release_context(self, pooled: _PooledBrowser, context: BrowserContext, healthy: bool) -> None:
+        async with self._lock:
+            pooled.active -= 1
+            reusable = (
+                healthy
+                and not pooled.retired
+                and pooled.context_uses[id(context)] < self.context_max_uses
+            )
+            if reusable:
+                pooled.idle_contexts.append(context)
+                return
+
+            pooled.context_uses.pop(id(context), None)
+            try:
+                await context.close()
+            except Exception:
+                pass
+
+            if pooled.retired and pooled.active == 0 and pooled is not self._current:
+                await pooled.close()
+
+
+browser_pool = BrowserPool()
@@ -15,10 +15,8 @@ from fastapi import APIRouter, HTTPException
 from fastapi.responses import Response
 from pydantic import BaseModel, Field
 
-try:
-    from playwright.async_api import async_playwright
-except ImportError:
-    raise ImportError("Playwright is not installed. Please install it with: pip install playwright")
+from browser_pool import browser_pool
+from render_cache import render_cache, slide_cache_key
 
 try:
     from PyPDF2 import PdfWriter, PdfReader
@@ -34,6 +32,10 @@ output_dir = Path("generated_pdfs")
 output_dir.mkdir(exist_ok=True)
 
 
+# Part of every cache key; bump when rendering changes so cached pages are not reused
+PDF_RENDER_SETTINGS = {"kind": "pdf", "version": 1, "width": 1920, "height": 1080, "print_background": True}
+
+
 class ConvertRequest(BaseModel):
     presentation_path: str = Field(..., description="Path to the presentation folder containing metadata.json")
     download: bool = Field(False, description="If true, returns the PDF file directly. If false, returns JSON with download URL.")
@@ -106,78 +108,84 @@ class PresentationToPDFAPI:
         except Exception as e:
             raise ValueError(f"Error loading metadata: {e}")
     
-    async def render_slide_to_pdf(self, browser, slide_info: Dict, temp_dir: Path) -> Path:
-        """Render a single HTML slide to PDF using Playwright."""
+    async def render_slide_to_pdf(self, slide_info: Dict, temp_dir: Path) -> Path:
+        """Render a single HTML slide to PDF using a page from the shared browser pool."""
         html_path = slide_info['path']
         slide_num = slide_info['number']
         
-        print(f"Rendering slide {slide_num}: {slide_info['title']}")
+        # Reuse the page rendered by a previous export if the slide did not change
+        cache_key = await asyncio.to_thread(slide_cache_key, html_path, PDF_RENDER_SETTINGS)
+        cached = await asyncio.to_thread(render_cache.get, cache_key, temp_dir, prefix=f"slide_{slide_num:02d}_")
+        if cached:
+            print(f"  ✓ Slide {slide_num} reused from render cache")
+            return cached['files']['page.pdf']
         
-        # Create new page with exact presentation dimensions
-        page = await browser.new_page()
+        print(f"Rendering slide {slide_num}: {slide_info['title']}")
         
-        try:
-            # Set exact viewport to 1920x1080
-            await page.set_viewport_size({"width": 1920, "height": 1080})
-            await page.emulate_media(media='screen')
+        # Lease a page with exact presentation dimensions
+        async with browser_pool.page() as page:
+            try:
+                # Set exact viewport to 1920x1080
+                await page.set_viewport_size({"width": 1920, "height": 1080})
+                await page.emulate_media(media='screen')
             
-            # Override device pixel ratio for exact dimensions
-            await page.evaluate("""
-                () => {
-                    Object.defineProperty(window, 'devicePixelRatio', {
-                        get: () => 1
-                    });
-                }
-            """)
+                # Override device pixel ratio for exact dimensions
+                await page.evaluate("""
+                    () => {
+                        Object.defineProperty(window, 'devicePixelRatio', {
+                            get: () => 1
+                        });
+                    }
+                """)
             
-            # Navigate to the HTML file
-            file_url = f"file://{html_path.absolute()}"
-            await page.goto(file_url, wait_until="networkidle", timeout=30000)
+                # Navigate to the HTML file
+                file_url = f"file://{html_path.absolute()}"
+                await page.goto(file_url, wait_until="networkidle", timeout=30000)
             
-            # Wait for fonts and dynamic content to load
-            await page.wait_for_timeout(3000)
+                # Wait for fonts and dynamic content to load
+                await page.wait_for_timeout(3000)
             
-            # Ensure exact slide dimensions
-            await page.evaluate("""
-                () => {
-                    const slideContainer = document.querySelector('.slide-container');
-                    if (slideContainer) {
-                        slideContainer.style.width = '1920px';
-                        slideContainer.style.height = '1080px';
-                        slideContainer.style.transform = 'none';
-                        slideContainer.style.maxWidth = 'none';
-                        slideContainer.style.maxHeight = 'none';
-                    }
+                # Ensure exact slide dimensions
+                await page.evaluate("""
+                    () => {
+                        const slideContainer = document.querySelector('.slide-container');
+                        if (slideContainer) {
+                            slideContainer.style.width = '1920px';
+                            slideContainer.style.height = '1080px';
+                            slideContainer.style.transform = 'none';
+                            slideContainer.style.maxWidth = 'none';
+                            slideContainer.style.maxHeight = 'none';
+                        }
                     
-                    document.body.style.margin = '0';
-                    document.body.style.padding = '0';
-                    document.body.style.width = '1920px';
-                    document.body.style.height = '1080px';
-                    document.body.style.overflow = 'hidden';
-                }
-            """)
+                        document.body.style.margin = '0';
+                        document.body.style.padding = '0';
+                        document.body.style.width = '1920px';
+                        document.body.style.height = '1080px';
+                        document.body.style.overflow = 'hidden';
+                    }
+                """)
             
-            await page.wait_for_timeout(1000)
+                await page.wait_for_timeout(1000)
             
-            # Generate PDF for this slide
-            temp_pdf_path = temp_dir / f"slide_{slide_num:02d}.pdf"
+                # Generate PDF for this slide
+                temp_pdf_path = temp_dir / f"slide_{slide_num:02d}.pdf"
             
-            await page.pdf(
-                path=str(temp_pdf_path),
-                width="1920px",
-                height="1080px",
-                margin={"top": "0", "right": "0", "bottom": "0", "left": "0"},
-                print_background=True,
-                prefer_css_page_size=False
-            )
+                await page.pdf(
+                    path=str(temp_pdf_path),
+                    width="1920px",
+                    height="1080px",
+                    margin={"top": "0", "right": "0", "bottom": "0", "left": "0"},
+                    print_background=True,
+                    prefer_css_page_size=False
+                )
             
-            print(f"  ✓ Slide {slide_num} rendered")
-            return temp_pdf_path
+                await asyncio.to_thread(render_cache.put, cache_key, {'page.pdf': temp_pdf_path})
+                
+                print(f"  ✓ Slide {slide_num} rendered")
+                return temp_pdf_path
             
-        except Exception as e:
-            raise RuntimeError(f"Error rendering slide {slide_num}: {e}")
-        finally:
-            await page.close()
+            except Exception as e:
+                raise RuntimeError(f"Error rendering slide {slide_num}: {e}")
     
     def combine_pdfs(self, pdf_paths: List[Path], output_path: Path) -> None:
         """Combine multiple PDF files into a single PDF."""
@@ -213,43 +221,25 @@ class PresentationToPDFAPI:
         with tempfile.TemporaryDirectory() as temp_dir:
             temp_path = Path(temp_dir)
             
-            # Launch browser
-            async with async_playwright() as p:
-                print("🌐 Launching browser...")
-                browser = await p.chromium.launch(
-                    headless=True,
-                    args=[
-                        '--no-sandbox',
-                        '--disable-setuid-sandbox',
-                        '--disable-dev-shm-usage',
-                        '--disable-gpu',
-                        '--force-device-scale-factor=1',
-                        '--disable-background-timer-throttling'
-                    ]
-                )
-                
-                try:
-                    # Process all slides concurrently using asyncio.gather
-                    print(f"📄 Processing {len(self.slides_info)} slides concurrently...")
-                    
-                    tasks = [
-                        self.render_slide_to_pdf(browser, slide_info, temp_path)
-                        for slide_info in self.slides_info
-                    ]
-                    
-                    # Wait for all slides to be processed concurrently
-                    pdf_paths = await asyncio.gather(*tasks)
-                    
-                finally:
-                    await browser.close()
+            # Process all slides concurrently on the shared browser pool,
+            # which bounds how many pages are rendered at once
+            print(f"📄 Processing {len(self.slides_info)} slides concurrently...")
+            
+            tasks = [
+                self.render_slide_to_pdf(slide_info, temp_path)
+                for slide_info in self.slides_info
+            ]
+            
+            # Wait for all slides to be processed concurrently
+            pdf_paths = await asyncio.gather(*tasks)
             
             # Create output path
             presentation_name = self.metadata.get('presentation_name', 'presentation')
             temp_output_path = temp_path / f"{presentation_name}.pdf"
             
-            # Combine all PDFs (sort by slide number to maintain order)
-            sorted_pdf_paths = sorted(pdf_paths, key=lambda p: int(p.stem.split('_')[1]))
-            self.combine_pdfs(sorted_pdf_paths, temp_output_path)
+            # Combine all PDFs (gather keeps the slide number order of slides_info)
+            self.combine_pdfs(list(pdf_paths), temp_output_path)
+            await asyncio.to_thread(render_cache.evict)
             
             if store_locally:
                 # Store in the static files directory for URL serving
@@ -320,4 +310,4 @@ async def convert_presentation_to_pdf(request: ConvertRequest):
 @router.get("/health")
 async def pdf_health_check():
     """PDF service health check endpoint."""
-    return {"status": "healthy", "service": "HTML to PDF Converter"}
\ No newline at end of file
+    return {"status": "healthy", "service": "HTML to PDF Converter", "browser_pool": browser_pool.stats(), "render_cache": render_cache.stats()}
\ No newline at end of file
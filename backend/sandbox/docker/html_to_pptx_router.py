@@ -13,16 +13,14 @@ from pathlib import Path
 from typing import Dict, List, Optional
 import tempfile
 import shutil
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict
 
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import Response
 from pydantic import BaseModel, Field
 
-try:
-    from playwright.async_api import async_playwright
-except ImportError:
-    raise ImportError("Playwright is not installed. Please install it with: pip install playwright")
+from browser_pool import browser_pool
+from render_cache import render_cache, slide_cache_key
 
 try:
     from pptx import Presentation
@@ -41,6 +39,10 @@ output_dir = Path("generated_pptx")
 output_dir.mkdir(exist_ok=True)
 
 
+# Part of every cache key; bump when slide analysis changes so cached results are not reused
+PPTX_RENDER_SETTINGS = {"kind": "pptx_analysis", "version": 1, "width": 1920, "height": 1080}
+
+
 class ConvertRequest(BaseModel):
     presentation_path: str = Field(..., description="Path to the presentation folder containing metadata.json")
     download: bool = Field(False, description="If true, returns the PPTX file directly. If false, returns JSON with download URL.")
@@ -1100,6 +1102,53 @@ class OptimizedHTMLToPPTXConverter:
                 except Exception:
                     pass
     
+    def load_cached_analysis(self, cache_key: str, slide_info: Dict, temp_dir: Path) -> Optional[Dict]:
+        """Slide analysis from the render cache, with its images copied into temp_dir."""
+        cached = render_cache.get(cache_key, temp_dir, prefix=f"cached_{slide_info['number']:03d}_")
+        if not cached:
+            return None
+        
+        data = cached['data']
+        files = cached['files']
+        visual_elements = []
+        for element in data['visual_elements']:
+            element = dict(element)
+            element['image_path'] = files[element['image_path']]
+            visual_elements.append(element)
+        
+        return {
+            'slide_info': slide_info,
+            'visual_elements': visual_elements,
+            'background_path': files.get(data['background_path']) if data['background_path'] else None,
+            'text_elements': [TextElement(**element) for element in data['text_elements']]
+        }
+    
+    def store_cached_analysis(self, cache_key: str, slide_analysis: Dict) -> None:
+        """Store a successful slide analysis and its images in the render cache."""
+        files = {}
+        visual_elements = []
+        for i, element in enumerate(slide_analysis['visual_elements']):
+            element = dict(element)
+            image_path = Path(element['image_path'])
+            if not image_path.exists():
+                continue
+            name = f"visual_{i:03d}.png"
+            files[name] = image_path
+            element['image_path'] = name
+            visual_elements.append(element)
+        
+        background_name = None
+        background_path = slide_analysis['background_path']
+        if background_path and Path(background_path).exists():
+            background_name = "background.png"
+            files[background_name] = background_path
+        
+        render_cache.put(cache_key, files, {
+            'visual_elements': visual_elements,
+            'background_path': background_name,
+            'text_elements': [asdict(element) for element in slide_analysis['text_elements']]
+        })
+    
     async def convert_to_pptx(self, store_locally: bool = True) -> tuple:
         """Main conversion method - optimized and reliable."""
         # Load metadata
@@ -1109,124 +1158,101 @@ class OptimizedHTMLToPPTXConverter:
         with tempfile.TemporaryDirectory() as temp_dir:
             temp_path = Path(temp_dir)
             
-            # Launch browser for processing
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(
-                    headless=True,
-                    args=[
-                        '--no-sandbox',
-                        '--disable-setuid-sandbox',
-                        '--disable-dev-shm-usage',
-                        '--disable-gpu',
-                        '--force-device-scale-factor=1',
-                        '--disable-background-timer-throttling',
-                        '--disable-backgrounding-occluded-windows',
-                        '--disable-renderer-backgrounding',
-                        '--disable-features=VizDisplayCompositor',
-                        '--disable-extensions',
-                        '--disable-plugins',
-                        '--disable-web-security',
-                        '--disable-features=TranslateUI',
-                        '--disable-ipc-flooding-protection'
-                    ]
-                )
+            # Process all slides in parallel on pages from the shared browser pool
+            # Create semaphore to limit concurrent operations
+            semaphore = asyncio.Semaphore(2)  # Reduced to 2 for optimal performance
+            
+            async def process_single_slide(slide_info: Dict) -> Dict:
+                """Process a single slide with controlled concurrency."""
+                # Reuse the analysis from a previous export if the slide did not change
+                cache_key = await asyncio.to_thread(slide_cache_key, slide_info['path'], PPTX_RENDER_SETTINGS)
+                cached_analysis = await asyncio.to_thread(self.load_cached_analysis, cache_key, slide_info, temp_path)
+                if cached_analysis:
+                    return cached_analysis
                 
-                try:
-                    # Process all slides in parallel
-                    # Create semaphore to limit concurrent operations
-                    semaphore = asyncio.Semaphore(2)  # Reduced to 2 for optimal performance
+                async with semaphore:
+                    slide_num = slide_info['number']
                     
-                    async def process_single_slide(slide_info: Dict) -> Dict:
-                        """Process a single slide with controlled concurrency."""
-                        async with semaphore:
-                            slide_num = slide_info['number']
-                            
+                    try:
+                        # Lease a page for this slide from the shared browser pool
+                        async with browser_pool.page() as page:
+                            # Set exact viewport dimensions
+                            await page.set_viewport_size({"width": 1920, "height": 1080})
+                            await page.emulate_media(media='screen')
+                        
+                            # Force device pixel ratio to 1
+                            await page.evaluate(r"""
+                                () => {
+                                    Object.defineProperty(window, 'devicePixelRatio', {
+                                        get: () => 1
+                                    });
+                                }
+                            """)
+                        
                             try:
-                                # Create a new page for this slide
-                                page = await browser.new_page()
-                                
-                                # Set exact viewport dimensions
-                                await page.set_viewport_size({"width": 1920, "height": 1080})
-                                await page.emulate_media(media='screen')
-                                
-                                # Force device pixel ratio to 1
-                                await page.evaluate(r"""
-                                    () => {
-                                        Object.defineProperty(window, 'devicePixelRatio', {
-                                            get: () => 1
-                                        });
-                                    }
-                                """)
-                                
-                                try:
-                                    # Extract visual elements
-                                    visual_elements = await self.extract_visual_elements(page, slide_info['path'], temp_path)
-                                    
-                                    # Capture clean background
-                                    background_path = await self.capture_clean_background(page, slide_info['path'], temp_path, visual_elements)
-                                    
-                                    # Extract text elements
-                                    text_elements = await self.extract_text_elements(page, slide_info['path'])
-                                    
-                                    slide_analysis = {
-                                        'slide_info': slide_info,
-                                        'visual_elements': visual_elements,
-                                        'background_path': background_path,
-                                        'text_elements': text_elements
-                                    }
-                                    
-                                    return slide_analysis
-                                    
-                                except Exception as e:
-                                    return {
-                                        'slide_info': slide_info,
-                                        'visual_elements': [],
-                                        'background_path': None,
-                                        'text_elements': [],
-                                        'error': str(e)
-                                    }
-                                    
-                                finally:
-                                    # Always close the page to free memory
-                                    await page.close()
-                                    
+                                # Extract visual elements
+                                visual_elements = await self.extract_visual_elements(page, slide_info['path'], temp_path)
+                            
+                                # Capture clean background
+                                background_path = await self.capture_clean_background(page, slide_info['path'], temp_path, visual_elements)
+                            
+                                # Extract text elements
+                                text_elements = await self.extract_text_elements(page, slide_info['path'])
+                            
+                                slide_analysis = {
+                                    'slide_info': slide_info,
+                                    'visual_elements': visual_elements,
+                                    'background_path': background_path,
+                                    'text_elements': text_elements
+                                }
+                                await asyncio.to_thread(self.store_cached_analysis, cache_key, slide_analysis)
+                            
+                                return slide_analysis
+                            
                             except Exception as e:
                                 return {
                                     'slide_info': slide_info,
                                     'visual_elements': [],
                                     'background_path': None,
                                     'text_elements': [],
-                                    'error': f"Page creation failed: {str(e)}"
+                                    'error': str(e)
                                 }
-                    
-                    # Launch ALL slides in parallel
-                    parallel_tasks = [
-                        process_single_slide(slide_info) 
-                        for slide_info in self.slides_info
-                    ]
-                    
-                    # Wait for ALL slides to complete in parallel
-                    slide_analyses = await asyncio.gather(*parallel_tasks, return_exceptions=True)
-                    
-                    # Handle any top-level exceptions
-                    processed_analyses = []
-                    for i, result in enumerate(slide_analyses):
-                        if isinstance(result, Exception):
-                            error_analysis = {
-                                'slide_info': self.slides_info[i],
-                                'visual_elements': [],
-                                'background_path': None,
-                                'text_elements': [],
-                                'error': str(result)
-                            }
-                            processed_analyses.append(error_analysis)
-                        else:
-                            processed_analyses.append(result)
-                    
-                    all_slide_analyses = processed_analyses
-                    
-                finally:
-                    await browser.close()
+                            
+                    except Exception as e:
+                        return {
+                            'slide_info': slide_info,
+                            'visual_elements': [],
+                            'background_path': None,
+                            'text_elements': [],
+                            'error': f"Page creation failed: {str(e)}"
+                        }
+            
+            # Launch ALL slides in parallel
+            parallel_tasks = [
+                process_single_slide(slide_info) 
+                for slide_info in self.slides_info
+            ]
+            
+            # Wait for ALL slides to complete in parallel
+            slide_analyses = await asyncio.gather(*parallel_tasks, return_exceptions=True)
+            
+            # Handle any top-level exceptions
+            processed_analyses = []
+            for i, result in enumerate(slide_analyses):
+                if isinstance(result, Exception):
+                    error_analysis = {
+                        'slide_info': self.slides_info[i],
+                        'visual_elements': [],
+                        'background_path': None,
+                        'text_elements': [],
+                        'error': str(result)
+                    }
+                    processed_analyses.append(error_analysis)
+                else:
+                    processed_analyses.append(result)
+            
+            all_slide_analyses = processed_analyses
+            await asyncio.to_thread(render_cache.evict)
             
             # Build PPTX presentation
             # Create new PowerPoint presentation
@@ -1362,5 +1388,7 @@ async def pptx_health_check():
     """PPTX service health check endpoint."""
     return {
         "status": "healthy", 
-        "service": "HTML to PPTX Converter"
+        "service": "HTML to PPTX Converter",
+        "browser_pool": browser_pool.stats(),
+        "render_cache": render_cache.stats()
     }
\ No newline at end of file
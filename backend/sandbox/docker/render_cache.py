@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Content-addressed on-disk cache of per-slide render results.
+
+Exports used to re-render every slide of a deck each time. A slide's results
+(its PDF page, or the PPTX analysis with the captured images) are now stored
+under a key hashing the slide HTML, the local assets it references and the
+render settings, so re-exports only render slides whose inputs changed.
+
+Entries are directories of files. Reading an entry copies (or hard-links) its
+files into the caller's working directory, so eviction never pulls files out
+from under a conversion in progress. The least recently used entries are
+evicted once the cache grows beyond MAX_CACHE_BYTES.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import unquote, urlparse
+
+
+CACHE_DIR = Path(os.getenv("PRESENTATION_RENDER_CACHE_DIR", "/tmp/presentation_render_cache"))
+MAX_CACHE_BYTES = int(os.getenv("PRESENTATION_RENDER_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+_ASSET_REFERENCE = re.compile(r'''(?:src|href)\s*=\s*["']([^"']+)["']|url\(\s*["']?([^"')]+)["']?\s*\)''', re.IGNORECASE)
+
+
+def _referenced_assets(html: str) -> List[str]:
+    """Local files and remote URLs referenced by the HTML, in document order."""
+    references = []
+    for match in _ASSET_REFERENCE.finditer(html):
+        reference = (match.group(1) or match.group(2) or '').strip()
+        if reference and not reference.startswith(('#', 'data:', 'javascript:', 'mailto:')):
+            references.append(reference)
+    return list(dict.fromkeys(references))
+
+
+def _resolve_local(reference: str, base_dir: Path) -> Optional[Path]:
+    parsed = urlparse(reference)
+    if parsed.scheme and parsed.scheme != 'file':
+        return None
+    path = Path(unquote(parsed.path))
+    if not path.is_absolute():
+        path = base_dir / path
+    return path if path.is_file() else None
+
+
+def slide_cache_key(html_path: Path, settings: Dict) -> str:
+    """Hash of the slide HTML, the content of local assets it references and the render settings."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+
+    html_bytes = Path(html_path).read_bytes()
+    digest.update(html_bytes)
+
+    html = html_bytes.decode('utf-8', errors='replace')
+    for reference in _referenced_assets(html):
+        digest.update(reference.encode())
+        local_path = _resolve_local(reference, Path(html_path).parent)
+        if local_path:
+            with open(local_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _link_or_copy(src: Path, dest: Path) -> None:
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+class RenderCache:
+    def __init__(self, cache_dir: Path = CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key
+
+    def get(self, key: str, dest_dir: Path, prefix: str = "") -> Optional[Dict]:
+        """Copy the entry's files into dest_dir (names prefixed) and return its manifest, or None on a miss.
+
+        The manifest maps 'files' to {stored name: path in dest_dir} and 'data'
+        to the JSON data stored with the entry.
+        """
+        entry_dir = self._entry_dir(key)
+        manifest_path = entry_dir / "manifest.json"
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            files = {}
+            for name in manifest['files']:
+                dest = Path(dest_dir) / f"{prefix}{name}"
+                _link_or_copy(entry_dir / name, dest)
+                files[name] = dest
+            # Mark as recently used for LRU eviction
+            os.utime(entry_dir)
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return {'files': files, 'data': manifest.get('data')}
+
+    def put(self, key: str, files: Dict[str, Path], data: Optional[Dict] = None) -> None:
+        """Store files ({stored name: source path}) and JSON data under the key. Failures are ignored."""
+        entry_dir = self._entry_dir(key)
+        staging_dir = self.cache_dir / "staging" / uuid.uuid4().hex
+        try:
+            staging_dir.mkdir(parents=True)
+            for name, src in files.items():
+                shutil.copy2(src, staging_dir / name)
+            with open(staging_dir / "manifest.json", 'w', encoding='utf-8') as f:
+                json.dump({'files': list(files), 'data': data}, f)
+
+            entry_dir.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                # Atomic publish; a concurrent writer of the same key wins the race harmlessly
+                os.rename(staging_dir, entry_dir)
+            except OSError:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+        except Exception as e:
+            print(f"⚠️ Failed to store render cache entry {key[:12]}: {e}")
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def evict(self) -> None:
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for shard in self.cache_dir.glob("[0-9a-f][0-9a-f]"):
+            for entry_dir in shard.iterdir():
+                try:
+                    size = sum(f.stat().st_size for f in entry_dir.iterdir())
+                    entries.append((entry_dir.stat().st_mtime, size, entry_dir))
+                except OSError:
+                    continue
+                total += size
+
+        if total <= self.max_bytes:
+            return
+
+        entries.sort()
+        for _, size, entry_dir in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+        print(f"🧹 Render cache evicted down to {total / (1024 * 1024):.1f} MB")
+
+    def stats(self) -> Dict:
+        return {"hits": self.hits, "misses": self.misses, "dir": str(self.cache_dir)}
+
+
+render_cache = RenderCache()
@@ -1,6 +1,7 @@
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.base import BaseHTTPMiddleware
+from contextlib import asynccontextmanager
 import uvicorn
 import os
 from pathlib import Path
@@ -9,6 +10,7 @@ from pathlib import Path
 from html_to_pdf_router import router as pdf_router
 from visual_html_editor_router import router as editor_router
 from html_to_pptx_router import router as pptx_router
+from browser_pool import browser_pool
 
 # Ensure we're serving from the /workspace directory
 workspace_dir = "/workspace"
@@ -21,7 +23,17 @@ class WorkspaceDirMiddleware(BaseHTTPMiddleware):
             os.makedirs(workspace_dir, exist_ok=True)
         return await call_next(request)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Keep one Chromium warm for presentation exports; it is relaunched on demand if this fails
+    try:
+        await browser_pool.start()
+    except Exception as e:
+        print(f"⚠️ Could not start browser pool: {e}")
+    yield
+    await browser_pool.stop()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(WorkspaceDirMiddleware)
 
 # Include routers
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Smoke test for the sandbox server modules, run in CI (sandbox-checks workflow).
+
+Undefined names inside endpoint bodies only fail when a request reaches them,
+so the modules are checked with pyflakes for undefined names and the routers
+are imported the way server.py imports them (server.py itself is not
+imported, it creates the workspace directories).
+"""
+
+import importlib
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    "browser_pool",
+    "render_cache",
+    "html_to_pdf_router",
+    "html_to_pptx_router",
+    "visual_html_editor_router",
+    "server",
+]
+
+
+def test_no_undefined_names():
+    from pyflakes import api, messages, reporter
+
+    class UndefinedNames(reporter.Reporter):
+        def __init__(self):
+            super().__init__(sys.stdout, sys.stderr)
+            self.found = []
+
+        def flake(self, message):
+            if isinstance(message, (messages.UndefinedName, messages.UndefinedLocal, messages.UndefinedExport)):
+                self.found.append(str(message))
+
+    found = UndefinedNames()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for module in MODULES:
+        api.checkPath(os.path.join(directory, f"{module}.py"), found)
+    assert not found.found, "Undefined names:\n" + "\n".join(found.found)
+
+
+def test_routers_import():
+    for module in MODULES:
+        if module != "server":
+            importlib.import_module(module)
+
+
+if __name__ == "__main__":
+    test_no_undefined_names()
+    test_routers_import()
+    print("Sandbox server modules OK")
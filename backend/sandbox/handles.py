@@ -0,0 +1,151 @@
+"""
+Process-wide registry of resolved sandbox handles, keyed by project.
+
+Every sandbox tool used to resolve its own sandbox: read the project row, then
+`get_or_start_sandbox` (a Daytona round-trip, possibly a start). A run
+registers a dozen such tools, and concurrent runs on the same project repeat
+the work. The registry resolves each project's sandbox once and shares the
+handle:
+
+- resolution (lazy creation included) is single-flight per project, so
+  concurrent callers wait on the same lookup;
+- a handle older than REVALIDATE_AFTER_SECONDS is re-checked through
+  `get_or_start_sandbox`, which restarts it if it was stopped or archived in
+  the meantime;
+- handles whose revalidation fails, deleted sandboxes and the least recently
+  used projects beyond MAX_HANDLES are evicted.
+"""
+
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from daytona_sdk import AsyncSandbox
+from sandbox.sandbox import get_or_start_sandbox, create_sandbox, delete_sandbox
+from utils.logger import logger
+
+REVALIDATE_AFTER_SECONDS = 60
+MAX_HANDLES = 512
+
+
+@dataclass
+class SandboxHandle:
+    sandbox: AsyncSandbox
+    sandbox_id: str
+    sandbox_pass: Optional[str]
+    validated_at: float
+
+
+class SandboxHandleRegistry:
+    def __init__(self, revalidate_after: float = REVALIDATE_AFTER_SECONDS, max_handles: int = MAX_HANDLES):
+        self._revalidate_after = revalidate_after
+        self._max_handles = max_handles
+        self._handles: "OrderedDict[str, SandboxHandle]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Task] = {}
+
+    async def get(self, client, project_id: str) -> SandboxHandle:
+        """Return the project's sandbox handle, resolving or revalidating it if needed."""
+        handle = self._handles.get(project_id)
+        if handle and time.monotonic() - handle.validated_at < self._revalidate_after:
+            self._handles.move_to_end(project_id)
+            return handle
+
+        task = self._pending.get(project_id)
+        if task is None:
+            task = asyncio.create_task(self._load(client, project_id, handle))
+            self._pending[project_id] = task
+            task.add_done_callback(lambda _: self._pending.pop(project_id, None))
+        # Shield so that one cancelled caller does not cancel the lookup for the others
+        return await asyncio.shield(task)
+
+    def invalidate(self, project_id: str) -> None:
+        """Forget the project's handle; the next get() resolves it again."""
+        if self._handles.pop(project_id, None):
+            logger.debug(f"Evicted sandbox handle for project {project_id}")
+
+    def evict_sandbox(self, sandbox_id: str) -> None:
+        """Forget every handle pointing at the sandbox, e.g. after it was deleted."""
+        for project_id in [pid for pid, handle in self._handles.items() if handle.sandbox_id == sandbox_id]:
+            self.invalidate(project_id)
+
+    async def _load(self, client, project_id: str, handle: Optional[SandboxHandle]) -> SandboxHandle:
+        if handle:
+            try:
+                sandbox = await get_or_start_sandbox(handle.sandbox_id)
+                return self._store(project_id, SandboxHandle(sandbox, handle.sandbox_id, handle.sandbox_pass, time.monotonic()))
+            except Exception as e:
+                logger.warning(f"Revalidating sandbox {handle.sandbox_id} for project {project_id} failed, resolving again: {str(e)}")
+                self.invalidate(project_id)
+
+        project = await client.table('projects').select('sandbox').eq('project_id', project_id).execute()
+        if not project.data or len(project.data) == 0:
+            raise ValueError(f"Project {project_id} not found")
+
+        sandbox_info = project.data[0].get('sandbox') or {}
+        if sandbox_info.get('id'):
+            sandbox_id = sandbox_info['id']
+            sandbox_pass = sandbox_info.get('pass')
+        else:
+            # If there is no sandbox recorded for this project, create one lazily
+            logger.debug(f"No sandbox recorded for project {project_id}; creating lazily")
+            sandbox_id, sandbox_pass = await self._create(client, project_id)
+
+        sandbox = await get_or_start_sandbox(sandbox_id)
+        return self._store(project_id, SandboxHandle(sandbox, sandbox_id, sandbox_pass, time.monotonic()))
+
+    async def _create(self, client, project_id: str) -> tuple[str, str]:
+        sandbox_pass = str(uuid.uuid4())
+        sandbox_obj = await create_sandbox(sandbox_pass, project_id)
+        sandbox_id = sandbox_obj.id
+
+        # Wait 5 seconds for services to start up
+        logger.info(f"Waiting 5 seconds for sandbox {sandbox_id} services to initialize...")
+        await asyncio.sleep(5)
+
+        # Gather preview links and token (best-effort parsing)
+        try:
+            vnc_link = await sandbox_obj.get_preview_link(6080)
+            website_link = await sandbox_obj.get_preview_link(8080)
+            vnc_url = vnc_link.url if hasattr(vnc_link, 'url') else str(vnc_link).split("url='")[1].split("'")[0]
+            website_url = website_link.url if hasattr(website_link, 'url') else str(website_link).split("url='")[1].split("'")[0]
+            token = vnc_link.token if hasattr(vnc_link, 'token') else (str(vnc_link).split("token='")[1].split("'")[0] if "token='" in str(vnc_link) else None)
+        except Exception:
+            # If preview link extraction fails, still proceed but leave fields None
+            logger.warning(f"Failed to extract preview links for sandbox {sandbox_id}", exc_info=True)
+            vnc_url = None
+            website_url = None
+            token = None
+
+        # Persist sandbox metadata to project record
+        update_result = await client.table('projects').update({
+            'sandbox': {
+                'id': sandbox_id,
+                'pass': sandbox_pass,
+                'vnc_preview': vnc_url,
+                'sandbox_url': website_url,
+                'token': token
+            }
+        }).eq('project_id', project_id).execute()
+
+        if not update_result.data:
+            # Cleanup created sandbox if DB update failed
+            try:
+                await delete_sandbox(sandbox_id)
+            except Exception:
+                logger.error(f"Failed to delete sandbox {sandbox_id} after DB update failure", exc_info=True)
+            raise Exception("Database update failed when storing sandbox metadata")
+
+        return sandbox_id, sandbox_pass
+
+    def _store(self, project_id: str, handle: SandboxHandle) -> SandboxHandle:
+        self._handles[project_id] = handle
+        self._handles.move_to_end(project_id)
+        while len(self._handles) > self._max_handles:
+            self._handles.popitem(last=False)
+        return handle
+
+
+sandbox_handles = SandboxHandleRegistry()
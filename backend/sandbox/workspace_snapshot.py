@@ -0,0 +1,193 @@
+"""
+Bulk snapshots of a sandbox workspace.
+
+Reading the workspace used to mean listing it and downloading every file one
+at a time, whatever its size. A snapshot instead:
+
+- lists every file with its size and mtime in one `find` call;
+- keeps a manifest per sandbox of (path, size, mtime, sha256, content), so
+  only files whose size or mtime changed since the previous snapshot are read;
+- fetches changed files as a single tar archive when there are many of them,
+  or as concurrent downloads (at most DOWNLOAD_CONCURRENCY) otherwise;
+- skips excluded paths, files above MAX_FILE_BYTES and binary files.
+
+Manifests are kept for at most MAX_MANIFESTS sandboxes and
+MAX_CACHED_CONTENT_BYTES of file content in total, least recently used first
+out. A manifest that doesn't fit on its own is not kept, so the next snapshot
+of that sandbox reads every file again.
+"""
+
+import asyncio
+import hashlib
+import io
+import shlex
+import tarfile
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from daytona_sdk import AsyncSandbox
+from utils.files_utils import EXCLUDED_DIRS, should_exclude_file
+from utils.logger import logger
+
+MAX_FILE_BYTES = 1024 * 1024
+DOWNLOAD_CONCURRENCY = 8
+# Fetch changed files as one tar archive from this many files on
+TAR_MIN_FILES = 8
+MAX_MANIFESTS = 256
+MAX_CACHED_CONTENT_BYTES = 256 * 1024 * 1024
+
+
+@dataclass
+class ManifestEntry:
+    path: str
+    size: int
+    mtime: float
+    sha256: Optional[str] = None
+    # None for files that were skipped (too large or binary)
+    content: Optional[str] = None
+
+
+class WorkspaceSnapshotter:
+    def __init__(self, sandbox: AsyncSandbox, root: str = "/workspace"):
+        self.sandbox = sandbox
+        self.root = root.rstrip('/')
+        self.manifest: Dict[str, ManifestEntry] = {}
+        self.content_bytes = 0
+
+    async def snapshot(self) -> Dict[str, ManifestEntry]:
+        """Refresh the manifest from the sandbox and return it, keyed by path relative to the root."""
+        listing = await self._list_files()
+
+        manifest: Dict[str, ManifestEntry] = {}
+        changed: List[ManifestEntry] = []
+        for entry in listing:
+            previous = self.manifest.get(entry.path)
+            if previous and previous.size == entry.size and previous.mtime == entry.mtime:
+                manifest[entry.path] = previous
+                continue
+            manifest[entry.path] = entry
+            if entry.size <= MAX_FILE_BYTES:
+                changed.append(entry)
+
+        if changed:
+            if len(changed) >= TAR_MIN_FILES:
+                contents = await self._fetch_tar([entry.path for entry in changed])
+            else:
+                contents = await self._fetch_each([entry.path for entry in changed])
+            for entry in changed:
+                self._set_content(entry, contents.get(entry.path))
+
+        logger.debug(f"Workspace snapshot of {self.root}: {len(manifest)} files, {len(changed)} fetched")
+        self.manifest = manifest
+        self.content_bytes = sum(entry.size for entry in manifest.values() if entry.content is not None)
+        _trim_cached_content(self)
+        return manifest
+
+    async def _list_files(self) -> List[ManifestEntry]:
+        prune = " -o ".join(f"-name {shlex.quote(name)}" for name in sorted(EXCLUDED_DIRS))
+        command = f"find {shlex.quote(self.root)} \\( {prune} \\) -prune -o -type f -printf '%P\\t%s\\t%T@\\n'"
+        response = await self.sandbox.process.exec(command, timeout=60)
+        if response.exit_code != 0:
+            raise RuntimeError(f"Failed to list {self.root}: {response.result}")
+
+        entries = []
+        for line in (response.result or "").splitlines():
+            parts = line.rsplit('\t', 2)
+            if len(parts) != 3 or should_exclude_file(parts[0]):
+                continue
+            path, size, mtime = parts
+            entries.append(ManifestEntry(path=path, size=int(size), mtime=float(mtime)))
+        return entries
+
+    async def _fetch_each(self, paths: List[str]) -> Dict[str, bytes]:
+        semaphore = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+
+        async def fetch(path: str) -> Optional[bytes]:
+            async with semaphore:
+                try:
+                    return await self.sandbox.fs.download_file(f"{self.root}/{path}")
+                except Exception as e:
+                    logger.debug(f"Error reading file {path}: {e}")
+                    return None
+
+        results = await asyncio.gather(*(fetch(path) for path in paths))
+        return {path: content for path, content in zip(paths, results) if content is not None}
+
+    async def _fetch_tar(self, paths: List[str]) -> Dict[str, bytes]:
+        """Fetch files as one tar archive built in the sandbox; falls back to per-file downloads."""
+        token = uuid.uuid4().hex
+        list_path = f"/tmp/workspace_snapshot_{token}.list"
+        tar_path = f"/tmp/workspace_snapshot_{token}.tar"
+        try:
+            await self.sandbox.fs.upload_file("\n".join(paths).encode(), list_path)
+            response = await self.sandbox.process.exec(
+                f"tar -cf {tar_path} -C {shlex.quote(self.root)} --ignore-failed-read -T {list_path}",
+                timeout=120
+            )
+            if response.exit_code not in (0, 1):
+                raise RuntimeError(response.result)
+            archive = await self.sandbox.fs.download_file(tar_path)
+        except Exception as e:
+            logger.warning(f"Tar snapshot of {self.root} failed, downloading files individually: {e}")
+            return await self._fetch_each(paths)
+        finally:
+            try:
+                await self.sandbox.process.exec(f"rm -f {list_path} {tar_path}", timeout=10)
+            except Exception:
+                pass
+
+        contents = {}
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            for member in tar:
+                if member.isfile():
+                    contents[member.name] = tar.extractfile(member).read()
+        return contents
+
+    @staticmethod
+    def _set_content(entry: ManifestEntry, data: Optional[bytes]) -> None:
+        if data is None:
+            return
+        entry.sha256 = hashlib.sha256(data).hexdigest()
+        try:
+            entry.content = data.decode()
+        except UnicodeDecodeError:
+            logger.debug(f"Skipping binary file: {entry.path}")
+
+
+_snapshotters: "OrderedDict[str, WorkspaceSnapshotter]" = OrderedDict()
+
+
+def _trim_cached_content(current: WorkspaceSnapshotter) -> None:
+    """Evict least recently used manifests until their content fits in MAX_CACHED_CONTENT_BYTES."""
+    total = sum(snapshotter.content_bytes for snapshotter in _snapshotters.values())
+    for key in list(_snapshotters):
+        if total <= MAX_CACHED_CONTENT_BYTES:
+            return
+        snapshotter = _snapshotters[key]
+        if snapshotter is current:
+            continue
+        del _snapshotters[key]
+        total -= snapshotter.content_bytes
+
+    if total > MAX_CACHED_CONTENT_BYTES and current.content_bytes:
+        logger.debug(f"Workspace snapshot of {current.root} holds {current.content_bytes} bytes, not keeping it")
+        current.manifest = {}
+        current.content_bytes = 0
+
+
+def get_workspace_snapshotter(sandbox: AsyncSandbox, root: str = "/workspace") -> WorkspaceSnapshotter:
+    """Snapshotter for the sandbox, reusing its manifest across calls in this process."""
+    key = f"{sandbox.id}:{root}"
+    snapshotter = _snapshotters.get(key)
+    if snapshotter is None:
+        snapshotter = WorkspaceSnapshotter(sandbox, root)
+        _snapshotters[key] = snapshotter
+        while len(_snapshotters) > MAX_MANIFESTS:
+            _snapshotters.popitem(last=False)
+    else:
+        # The sandbox handle may have been refreshed since the manifest was built
+        snapshotter.sandbox = sandbox
+    _snapshotters.move_to_end(key)
+    return snapshotter
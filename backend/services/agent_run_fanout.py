@@ -0,0 +1,266 @@
+"""
+In-process fan-out of agent run responses to SSE clients.
+
+Every SSE connection used to read the run's response transport on its own: a
+pub/sub connection (or blocking XREAD) per browser tab, a full replay of the
+stored responses on connect and a JSON decode and encode of every response per
+client. Shared threads and users with several tabs multiplied all of it.
+
+AgentRunFanoutHub keeps one RunChannel per run being watched in this process:
+
+- the channel's pump is the only reader of the run's transport and turns each
+  response into a ready-to-send SSE frame once;
+- the most recent RING_BUFFER_SIZE frames are kept in memory, so clients that
+  connect or reconnect with a Last-Event-ID inside that window catch up
+  without touching Redis; older history is read from the transport once for
+  that client;
+- each client gets a queue of SUBSCRIBER_QUEUE_SIZE frames. A client that
+  falls that far behind is dropped after its queued frames are sent; its
+  EventSource reconnects with its Last-Event-ID and resumes from the buffer;
+- a channel without clients is stopped after IDLE_CHANNEL_TIMEOUT_SECONDS, and
+  a finished run's channel is kept for CLOSED_CHANNEL_LINGER_SECONDS so late
+  reconnects get its tail and final status from memory.
+"""
+
+import asyncio
+import json
+from collections import deque
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+
+from services.agent_run_stream import AgentRunResponseTransport, ResponseEvent
+from utils.logger import logger
+
+RING_BUFFER_SIZE = 1000
+SUBSCRIBER_QUEUE_SIZE = 1000
+IDLE_CHANNEL_TIMEOUT_SECONDS = 30
+CLOSED_CHANNEL_LINGER_SECONDS = 30
+
+TERMINAL_STATUSES = ("completed", "failed", "stopped")
+
+
+@dataclass
+class Frame:
+    """One serialized SSE event. Control frames have no key and always end the stream."""
+    key: Optional[Tuple[int, ...]]
+    data: str
+    terminal: bool = False
+
+
+def _status_frame(status: str, message: Optional[str] = None) -> Frame:
+    payload = {'type': 'status', 'status': status}
+    if message is not None:
+        payload['message'] = message
+    return Frame(key=None, data=f"data: {json.dumps(payload)}\n\n", terminal=True)
+
+
+def _response_frame(transport: AgentRunResponseTransport, event: ResponseEvent) -> Frame:
+    response = event.response
+    return Frame(
+        key=transport.event_key(event.id),
+        data=f"id: {event.id}\ndata: {json.dumps(response)}\n\n",
+        terminal=response.get('type') == 'status' and response.get('status') in TERMINAL_STATUSES,
+    )
+
+
+class Subscriber:
+    def __init__(self, after_key: Optional[Tuple[int, ...]], queue_size: int):
+        # Frames up to after_key were already sent, e.g. by a process whose pump is ahead of this one
+        self.after_key = after_key
+        self.queue: "asyncio.Queue[Optional[Frame]]" = asyncio.Queue(maxsize=queue_size)
+        self.evicted = False
+
+
+class RunChannel:
+    def __init__(self, hub: "AgentRunFanoutHub", transport: AgentRunResponseTransport):
+        self.hub = hub
+        self.transport = transport
+        self.agent_run_id = transport.agent_run_id
+        self.buffer: Deque[Frame] = deque()
+        # Key of the newest frame not in the buffer; None while the buffer holds the run from its start
+        self.floor_key: Optional[Tuple[int, ...]] = None
+        self.subscribers: Set[Subscriber] = set()
+        self.started = False
+        self.closed = False
+        self._task: Optional[asyncio.Task] = None
+        self._idle_handle: Optional[asyncio.TimerHandle] = None
+
+    def covers(self, last_id: Optional[str]) -> bool:
+        """Whether every frame after last_id is in the buffer or still to come."""
+        if not self.started:
+            return False
+        if self.floor_key is None:
+            return True
+        return last_id is not None and self.transport.event_key(last_id) >= self.floor_key
+
+    def frames_after(self, after_key: Optional[Tuple[int, ...]]) -> List[Frame]:
+        return [
+            frame for frame in self.buffer
+            if after_key is None or frame.key is None or frame.key > after_key
+        ]
+
+    def start(self, last_id: Optional[str]) -> None:
+        """Start following the transport after last_id (from the start of the run if None)."""
+        self.started = True
+        if last_id is not None:
+            self.floor_key = self.transport.event_key(last_id)
+        self._task = asyncio.create_task(self._pump(last_id), name=f"agent-run-fanout:{self.agent_run_id}")
+
+    def subscribe(self, after_key: Optional[Tuple[int, ...]]) -> Subscriber:
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+        subscriber = Subscriber(after_key, self.hub.queue_size)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self.subscribers.discard(subscriber)
+        if not self.subscribers and not self.closed and self._idle_handle is None:
+            self._idle_handle = asyncio.get_running_loop().call_later(IDLE_CHANNEL_TIMEOUT_SECONDS, self._stop_if_idle)
+
+    def _stop_if_idle(self) -> None:
+        self._idle_handle = None
+        if self.subscribers or self.closed:
+            return
+        logger.debug(f"Stopping idle fan-out channel for {self.agent_run_id}")
+        self.hub._remove(self)
+        if self._task is not None:
+            self._task.cancel()
+
+    def _publish(self, frame: Frame) -> None:
+        self.buffer.append(frame)
+        while len(self.buffer) > self.hub.buffer_size:
+            evicted = self.buffer.popleft()
+            if evicted.key is not None:
+                self.floor_key = evicted.key
+
+        for subscriber in list(self.subscribers):
+            if frame.key is not None and subscriber.after_key is not None and frame.key <= subscriber.after_key:
+                continue
+            try:
+                subscriber.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                self._evict(subscriber)
+
+    def _evict(self, subscriber: Subscriber) -> None:
+        # The client still gets the queued frames, then its stream ends and it reconnects
+        logger.debug(f"Dropping slow stream client of {self.agent_run_id} ({subscriber.queue.qsize()} frames behind)")
+        subscriber.evicted = True
+        self.subscribers.discard(subscriber)
+
+    def _close(self) -> None:
+        self.closed = True
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.queue.put_nowait(None)
+            except asyncio.QueueFull:
+                self._evict(subscriber)
+        self.subscribers.clear()
+
+    async def _pump(self, last_id: Optional[str]) -> None:
+        linger = CLOSED_CHANNEL_LINGER_SECONDS
+        try:
+            async with aclosing(self.transport.listen(last_id)) as events:
+                async for event in events:
+                    if event.control:
+                        logger.debug(f"Fan-out channel for {self.agent_run_id} received control signal '{event.control}'")
+                        self._publish(_status_frame(event.control))
+                        break
+                    frame = _response_frame(self.transport, event)
+                    self._publish(frame)
+                    if frame.terminal:
+                        logger.debug(f"Detected run completion via status message in stream: {event.response.get('status')}")
+                        break
+        except asyncio.CancelledError:
+            linger = 0
+            raise
+        except Exception as e:
+            logger.error(f"Error streaming agent run {self.agent_run_id}: {e}", exc_info=True)
+            self._publish(_status_frame('error', f'Stream failed: {e}'))
+            # Let the next client start over instead of replaying the error
+            linger = 0
+        finally:
+            self._close()
+            if linger:
+                asyncio.get_running_loop().call_later(linger, self.hub._remove, self)
+            else:
+                self.hub._remove(self)
+
+
+class AgentRunFanoutHub:
+    def __init__(self, buffer_size: int = RING_BUFFER_SIZE, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.buffer_size = buffer_size
+        self.queue_size = queue_size
+        self._channels: Dict[str, RunChannel] = {}
+
+    def _get_channel(self, transport: AgentRunResponseTransport) -> RunChannel:
+        channel = self._channels.get(transport.agent_run_id)
+        if channel is None:
+            channel = RunChannel(self, transport)
+            self._channels[transport.agent_run_id] = channel
+        return channel
+
+    def _remove(self, channel: RunChannel) -> None:
+        if self._channels.get(channel.agent_run_id) is channel:
+            del self._channels[channel.agent_run_id]
+
+    async def _subscribe(
+        self, transport: AgentRunResponseTransport, last_id: Optional[str]
+    ) -> Tuple[Optional[RunChannel], Optional[Subscriber], List[Frame]]:
+        backlog: List[Frame] = []
+        while True:
+            channel = self._get_channel(transport)
+            if channel.covers(last_id):
+                break
+
+            # Read what the channel can't serve, then join it where the read ended
+            events = await transport.read_after(last_id)
+            backlog.extend(_response_frame(transport, event) for event in events)
+            if events:
+                last_id = events[-1].id
+            if backlog and backlog[-1].terminal:
+                return None, None, backlog
+
+            channel = self._get_channel(transport)
+            if not channel.started:
+                channel.start(last_id)
+                break
+            # Otherwise the pump got ahead and evicted frames during the read; read the gap too
+
+        after_key = transport.event_key(last_id) if last_id is not None else None
+        frames = backlog + channel.frames_after(after_key)
+        subscriber = None if channel.closed else channel.subscribe(after_key)
+        return channel, subscriber, frames
+
+    async def stream(self, transport: AgentRunResponseTransport, last_id: Optional[str] = None) -> AsyncIterator[str]:
+        """SSE frames of the run after last_id, ending after its final status.
+
+        Also ends, without a final status, when the client falls too far
+        behind; clients are expected to reconnect with their Last-Event-ID.
+        """
+        channel, subscriber, frames = await self._subscribe(transport, last_id)
+        try:
+            for frame in frames:
+                yield frame.data
+                if frame.terminal:
+                    return
+            if subscriber is None:
+                return
+
+            while True:
+                if subscriber.evicted and subscriber.queue.empty():
+                    return
+                frame = await subscriber.queue.get()
+                if frame is None:
+                    return
+                yield frame.data
+                if frame.terminal:
+                    return
+        finally:
+            if subscriber is not None:
+                channel.unsubscribe(subscriber)
+
+
+agent_run_hub = AgentRunFanoutHub()
@@ -0,0 +1,377 @@
+"""
+Transport for agent run responses between the background worker and SSE clients.
+
+Two implementations share one interface:
+
+- ``RedisStreamResponseTransport`` stores responses in a Redis Stream. The
+  worker does one XADD per response and listeners block on XREAD from their
+  last seen id, so each response costs one round-trip on either side and
+  reconnecting clients can resume from a Last-Event-ID.
+- ``RedisListResponseTransport`` is the original list + pub/sub scheme
+  (RPUSH + PUBLISH "new", then LRANGE from the last index), kept as a fallback.
+
+Terminal control signals (STOP, END_STREAM, ERROR) are always published on the
+run's global control channel, which the worker listens to for STOP. The stream
+transport also appends them to the stream so listeners need no second
+connection.
+
+The worker writes through ``BatchedResponsePublisher``, which coalesces
+streamed chunks into one pipelined write per batch.
+"""
+
+import asyncio
+import json
+import re
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from services import redis
+from utils.config import config
+from utils.logger import logger
+
+TRANSPORT_STREAM = "stream"
+TRANSPORT_LIST = "list"
+
+TERMINAL_SIGNALS = ("STOP", "END_STREAM", "ERROR")
+
+# XREAD BLOCK timeout, kept below the Redis socket timeout
+STREAM_BLOCK_MS = 5000
+STREAM_READ_COUNT = 500
+# How long a stopped run's stream is kept so listeners can still read the STOP entry
+STOPPED_STREAM_TTL = 60
+
+_STREAM_ID_RE = re.compile(r"^\d+-\d+$")
+
+# Worker-side coalescing of responses into one write
+PUBLISH_MAX_BATCH = 16
+PUBLISH_MAX_DELAY_SECONDS = 0.02
+PUBLISH_MAX_PENDING = 1024
+PUBLISH_CLOSE_TIMEOUT_SECONDS = 30.0
+# Response types written out immediately instead of waiting for the window
+FLUSH_IMMEDIATELY_TYPES = ("status", "tool")
+
+
+@dataclass
+class ResponseEvent:
+    """One entry of an agent run's response transport.
+
+    Either ``response`` is set (a message yielded by the agent) or ``control``
+    is (a terminal control signal).
+    """
+    id: Optional[str]
+    response: Optional[Dict[str, Any]] = None
+    control: Optional[str] = None
+
+
+class AgentRunResponseTransport(ABC):
+    """Interface shared by the worker (writer) and the SSE endpoint (reader)."""
+
+    name: str
+
+    def __init__(self, agent_run_id: str):
+        self.agent_run_id = agent_run_id
+        self.control_channel = f"agent_run:{agent_run_id}:control"
+
+    async def append(self, response: Dict[str, Any]) -> None:
+        """Append a response and notify listeners."""
+        await self.append_many([response])
+
+    @abstractmethod
+    async def append_many(self, responses: List[Dict[str, Any]]) -> None:
+        """Append responses in order, in one round-trip, and notify listeners once."""
+
+    @abstractmethod
+    def is_event_id(self, value: str) -> bool:
+        """Whether ``value`` is a well-formed event id of this transport (e.g. a client's Last-Event-ID)."""
+
+    @abstractmethod
+    def event_key(self, event_id: str) -> Tuple[int, ...]:
+        """Sort key of an event id; later events have greater keys."""
+
+    async def read_all(self) -> List[Dict[str, Any]]:
+        """All responses stored for the run."""
+        return [event.response for event in await self.read_after(None)]
+
+    @abstractmethod
+    async def read_after(self, last_id: Optional[str]) -> List[ResponseEvent]:
+        """Stored responses after ``last_id`` (all of them if None), without blocking."""
+
+    @abstractmethod
+    def listen(self, last_id: Optional[str] = None) -> AsyncIterator[ResponseEvent]:
+        """Yield stored responses after ``last_id`` and then new ones as they arrive.
+
+        Ends after yielding a control event.
+        """
+
+    async def signal(self, control: str) -> None:
+        """Send a terminal control signal to the worker and to listeners."""
+        await redis.publish(self.control_channel, control)
+
+    @abstractmethod
+    async def expire(self, seconds: int) -> None:
+        """Expire the stored responses after ``seconds``."""
+
+    @abstractmethod
+    async def discard(self) -> None:
+        """Drop stored responses of a run that was stopped or failed."""
+
+
+class RedisListResponseTransport(AgentRunResponseTransport):
+    name = TRANSPORT_LIST
+
+    def __init__(self, agent_run_id: str):
+        super().__init__(agent_run_id)
+        self.key = f"agent_run:{agent_run_id}:responses"
+        self.response_channel = f"agent_run:{agent_run_id}:new_response"
+
+    async def append_many(self, responses: List[Dict[str, Any]]) -> None:
+        if not responses:
+            return
+        redis_client = await redis.get_client()
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.rpush(self.key, *(json.dumps(response) for response in responses))
+            pipe.publish(self.response_channel, "new")
+            await pipe.execute()
+
+    def is_event_id(self, value: str) -> bool:
+        return value.isdigit()
+
+    def event_key(self, event_id: str) -> Tuple[int, ...]:
+        return (int(event_id),)
+
+    async def read_after(self, last_id: Optional[str]) -> List[ResponseEvent]:
+        start = int(last_id) + 1 if last_id is not None else 0
+        return await self._read_from(start)
+
+    async def _read_from(self, start: int) -> List[ResponseEvent]:
+        responses_json = await redis.lrange(self.key, start, -1)
+        return [
+            ResponseEvent(id=str(start + offset), response=json.loads(r))
+            for offset, r in enumerate(responses_json)
+        ]
+
+    async def listen(self, last_id: Optional[str] = None) -> AsyncIterator[ResponseEvent]:
+        pubsub = await redis.create_pubsub()
+        try:
+            # Subscribe before catching up so no notification is missed in between
+            await pubsub.subscribe(self.response_channel, self.control_channel)
+            next_index = int(last_id) + 1 if last_id is not None else 0
+
+            for event in await self._read_from(next_index):
+                next_index += 1
+                yield event
+
+            async for message in pubsub.listen():
+                if not message or message.get("type") != "message":
+                    continue
+                channel = message.get("channel")
+                data = message.get("data")
+                if isinstance(data, bytes):
+                    data = data.decode('utf-8')
+
+                if channel == self.response_channel and data == "new":
+                    for event in await self._read_from(next_index):
+                        next_index += 1
+                        yield event
+                elif channel == self.control_channel and data in TERMINAL_SIGNALS:
+                    logger.debug(f"Received control signal '{data}' for {self.agent_run_id}")
+                    yield ResponseEvent(id=None, control=data)
+                    return
+        finally:
+            try:
+                await pubsub.unsubscribe(self.response_channel, self.control_channel)
+                await pubsub.close()
+            except Exception as e:
+                logger.debug(f"Error during pubsub cleanup for {self.agent_run_id}: {e}")
+
+    async def expire(self, seconds: int) -> None:
+        await redis.expire(self.key, seconds)
+
+    async def discard(self) -> None:
+        await redis.delete(self.key)
+
+
+class RedisStreamResponseTransport(AgentRunResponseTransport):
+    name = TRANSPORT_STREAM
+
+    def __init__(self, agent_run_id: str):
+        super().__init__(agent_run_id)
+        self.key = f"agent_run:{agent_run_id}:stream"
+
+    async def append_many(self, responses: List[Dict[str, Any]]) -> None:
+        if not responses:
+            return
+        if len(responses) == 1:
+            await redis.xadd(self.key, {"data": json.dumps(responses[0])}, maxlen=config.AGENT_RESPONSE_STREAM_MAXLEN)
+            return
+        redis_client = await redis.get_client()
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for response in responses:
+                pipe.xadd(self.key, {"data": json.dumps(response)}, maxlen=config.AGENT_RESPONSE_STREAM_MAXLEN, approximate=True)
+            await pipe.execute()
+
+    def is_event_id(self, value: str) -> bool:
+        return bool(_STREAM_ID_RE.match(value))
+
+    def event_key(self, event_id: str) -> Tuple[int, ...]:
+        milliseconds, sequence = event_id.split("-")
+        return (int(milliseconds), int(sequence))
+
+    async def read_after(self, last_id: Optional[str]) -> List[ResponseEvent]:
+        if last_id is None:
+            entries = await redis.xrange(self.key)
+        else:
+            # XREAD without BLOCK returns the entries strictly after last_id
+            result = await redis.xread({self.key: last_id})
+            entries = result[0][1] if result else []
+        return [event for event in (self._to_event(entry_id, fields) for entry_id, fields in entries) if event.response is not None]
+
+    async def listen(self, last_id: Optional[str] = None) -> AsyncIterator[ResponseEvent]:
+        last_id = last_id or "0-0"
+        while True:
+            result = await redis.xread({self.key: last_id}, count=STREAM_READ_COUNT, block=STREAM_BLOCK_MS)
+            for _, entries in result or []:
+                for entry_id, fields in entries:
+                    last_id = entry_id
+                    event = self._to_event(entry_id, fields)
+                    yield event
+                    if event.control:
+                        logger.debug(f"Received control signal '{event.control}' for {self.agent_run_id}")
+                        return
+
+    async def signal(self, control: str) -> None:
+        await redis.xadd(self.key, {"control": control}, maxlen=config.AGENT_RESPONSE_STREAM_MAXLEN)
+        await super().signal(control)
+
+    async def expire(self, seconds: int) -> None:
+        await redis.expire(self.key, seconds)
+
+    async def discard(self) -> None:
+        # Keep the stream briefly so blocked listeners still read the STOP entry
+        await redis.expire(self.key, STOPPED_STREAM_TTL)
+
+    @staticmethod
+    def _to_event(entry_id: str, fields: Dict[str, str]) -> ResponseEvent:
+        if "control" in fields:
+            return ResponseEvent(id=entry_id, control=fields["control"])
+        return ResponseEvent(id=entry_id, response=json.loads(fields["data"]))
+
+
+class BatchedResponsePublisher:
+    """Coalesces a run's responses into batched transport writes.
+
+    Responses are buffered and written by a single flusher task, so they
+    reach Redis in the order they were published. A batch is written when it
+    reaches ``max_batch`` responses, when ``max_delay`` has passed since the
+    first buffered response, or right away for status and tool messages.
+    ``publish`` waits while ``max_pending`` responses are buffered, which
+    slows the agent down instead of growing the buffer without bound when
+    Redis falls behind.
+    """
+
+    def __init__(
+        self,
+        transport: AgentRunResponseTransport,
+        max_batch: int = PUBLISH_MAX_BATCH,
+        max_delay: float = PUBLISH_MAX_DELAY_SECONDS,
+        max_pending: int = PUBLISH_MAX_PENDING,
+    ):
+        self.transport = transport
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.published = 0
+        self.batches = 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._has_data = asyncio.Event()
+        self._flush_now = asyncio.Event()
+        self._has_space = asyncio.Event()
+        self._has_space.set()
+        self._closed = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def publish(self, response: Dict[str, Any]) -> None:
+        if self._closed:
+            raise RuntimeError(f"Publisher for {self.transport.agent_run_id} is closed")
+        while len(self._buffer) >= self.max_pending:
+            self._has_space.clear()
+            await self._has_space.wait()
+
+        self._buffer.append(response)
+        self.published += 1
+        self._has_data.set()
+        if len(self._buffer) >= self.max_batch or response.get('type') in FLUSH_IMMEDIATELY_TYPES:
+            self._flush_now.set()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name=f"response-publisher:{self.transport.agent_run_id}")
+
+    async def close(self, timeout: float = PUBLISH_CLOSE_TIMEOUT_SECONDS) -> None:
+        """Write out buffered responses and stop the flusher."""
+        self._closed = True
+        if self._task is None:
+            return
+        self._flush_now.set()
+        self._has_data.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Timeout flushing {len(self._buffer)} responses for {self.transport.agent_run_id}")
+            self._task.cancel()
+
+    async def _run(self) -> None:
+        while True:
+            await self._has_data.wait()
+            if not self._flush_now.is_set():
+                try:
+                    await asyncio.wait_for(self._flush_now.wait(), timeout=self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch, self._buffer = self._buffer, []
+            self._has_data.clear()
+            self._flush_now.clear()
+            if batch:
+                try:
+                    await self.transport.append_many(batch)
+                    self.batches += 1
+                except Exception as e:
+                    logger.error(f"Failed to write {len(batch)} responses for {self.transport.agent_run_id}: {e}")
+            self._has_space.set()
+
+            if self._closed and not self._buffer:
+                logger.debug(f"Published {self.published} responses in {self.batches} batches for {self.transport.agent_run_id}")
+                return
+
+
+_TRANSPORTS = {
+    TRANSPORT_STREAM: RedisStreamResponseTransport,
+    TRANSPORT_LIST: RedisListResponseTransport,
+}
+
+
+def get_response_transport(agent_run_id: str) -> AgentRunResponseTransport:
+    """Transport the worker writes a run's responses to, as configured."""
+    transport_cls = _TRANSPORTS.get(config.AGENT_RESPONSE_TRANSPORT)
+    if transport_cls is None:
+        logger.warning(f"Unknown AGENT_RESPONSE_TRANSPORT '{config.AGENT_RESPONSE_TRANSPORT}', using {TRANSPORT_LIST}")
+        transport_cls = RedisListResponseTransport
+    return transport_cls(agent_run_id)
+
+
+async def open_response_transport(agent_run_id: str) -> AgentRunResponseTransport:
+    """Transport to read a run's responses from.
+
+    Uses the configured transport unless the run was written with the other
+    one, e.g. by a worker deployed before the setting changed.
+    """
+    transport = get_response_transport(agent_run_id)
+    other_cls = RedisListResponseTransport if transport.name == TRANSPORT_STREAM else RedisStreamResponseTransport
+    other = other_cls(agent_run_id)
+    try:
+        if not await redis.exists(transport.key) and await redis.exists(other.key):
+            return other
+    except Exception as e:
+        logger.warning(f"Failed to detect response transport for {agent_run_id}: {e}")
+    return transport
+
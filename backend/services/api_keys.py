@@ -315,6 +315,8 @@ class APIKeyService:
             if not result.data:
                 raise HTTPException(status_code=404, detail="API key not found")
 
+            await self._invalidate_cached_validations(result.data[0].get("public_key"))
+
             logger.debug(
                 "API key revoked successfully",
                 account_id=str(account_id),
@@ -453,6 +455,19 @@ class APIKeyService:
                 is_valid=False, error_message="Internal server error"
             )
 
+    async def _invalidate_cached_validations(self, public_key: Optional[str]):
+        """Forget cached validations of a revoked or deleted key, in Redis and in every process"""
+        if not public_key:
+            return
+        try:
+            for cache_key in await redis.keys(f"api_key:{public_key}:*"):
+                await redis.delete(cache_key)
+        except Exception as e:
+            logger.warning(f"Failed to clear cached validations for {public_key}: {e}")
+
+        from utils.auth_cache import publish_api_key_revocation
+        await publish_api_key_revocation(public_key)
+
     async def _cache_validation_result(
         self, cache_key: str, result: APIKeyValidationResult, ttl: int = 120
     ):
@@ -564,6 +579,8 @@ class APIKeyService:
             if not result.data:
                 raise HTTPException(status_code=404, detail="API key not found")
 
+            await self._invalidate_cached_validations(result.data[0].get("public_key"))
+
             logger.debug(
                 "API key deleted successfully",
                 account_id=str(account_id),
@@ -5,7 +5,7 @@ stripe listen --forward-to localhost:8000/api/billing/webhook
 """
 
 from fastapi import APIRouter, HTTPException, Depends, Request
-from typing import Optional, Dict, Tuple
+from typing import Optional, Dict, List, Tuple
 import stripe
 from datetime import datetime, timezone, timedelta
 from dateutil import parser as dateutil_parser
@@ -15,10 +15,10 @@ from utils.cache import Cache
 from utils.logger import logger
 from utils.config import config, EnvMode
 from services.supabase import DBConnection
+from services import redis
 from utils.auth_utils import verify_and_get_user_id_from_jwt
 from pydantic import BaseModel
-from models import model_manager
-from litellm.cost_calculator import cost_per_token
+from models import model_manager, pricing_table
 import time
 import json
 
@@ -375,58 +375,93 @@ async def get_user_subscription(user_id: str) -> Optional[Dict]:
         logger.error(f"Error getting subscription from Stripe: {str(e)}")
         return None
 
-async def calculate_monthly_usage(client, user_id: str) -> float:
-    """Calculate total agent run minutes for the current month for a user."""
-    result = await Cache.get(f"monthly_usage:{user_id}")
-    if result:
-        return result
+# Monthly usage is kept as a running total per account in Redis, incremented as
+# assistant responses are recorded and rebuilt from the messages table on a miss
+MONTHLY_USAGE_TTL = 6 * 3600
+# Increment only if the total exists, so a missing key is rebuilt instead of restarting at zero
+_INCR_USAGE_IF_EXISTS = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCRBYFLOAT', KEYS[1], ARGV[1])
+end
+return false
+"""
+
+
+def _usage_period_start(now: Optional[datetime] = None) -> datetime:
+    """Start of the current billing month, not earlier than the usage cutoff date."""
+    now = now or datetime.now(timezone.utc)
+    start_of_month = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
+    # Ignore all token counts before this date
+    cutoff_date = datetime(2025, 6, 30, 9, 0, 0, tzinfo=timezone.utc)
+    return max(start_of_month, cutoff_date)
+
+
+def _monthly_usage_key(user_id: str, now: Optional[datetime] = None) -> str:
+    now = now or datetime.now(timezone.utc)
+    return f"monthly_usage_total:{user_id}:{now.strftime('%Y-%m')}"
+
 
+async def rebuild_monthly_usage(client, user_id: str) -> float:
+    """Recompute the account's usage for the current month from its assistant_response_end messages."""
     start_time = time.time()
-    
-    # Use get_usage_logs to fetch all usage data (it already handles the date filtering and batching)
+    now = datetime.now(timezone.utc)
+    period_start = _usage_period_start(now)
+
     total_cost = 0.0
-    page = 0
-    items_per_page = 1000
-    
+    offset = 0
+    batch_size = 1000
     while True:
-        # Get usage logs for this page
-        usage_result = await get_usage_logs(client, user_id, page, items_per_page)
-        
-        if not usage_result['logs']:
-            break
-        
-        # Sum up the estimated costs from this page
-        for log_entry in usage_result['logs']:
-            total_cost += log_entry['estimated_cost']
-        
-        # If there are no more pages, break
-        if not usage_result['has_more']:
+        messages_result = await client.table('messages') \
+            .select('message_id, content, threads!inner(account_id)') \
+            .eq('threads.account_id', user_id) \
+            .eq('type', 'assistant_response_end') \
+            .gte('created_at', period_start.isoformat()) \
+            .order('created_at') \
+            .range(offset, offset + batch_size - 1) \
+            .execute()
+        rows = messages_result.data or []
+        total_cost += sum(calculate_token_costs([_usage_cost_row(message) for message in rows]))
+        if len(rows) < batch_size:
             break
-            
-        page += 1
-    
-    end_time = time.time()
-    execution_time = end_time - start_time
-    logger.debug(f"Calculate monthly usage took {execution_time:.3f} seconds, total cost: {total_cost}")
-    
-    await Cache.set(f"monthly_usage:{user_id}", total_cost, ttl=5)
+        offset += batch_size
+
+    await redis.set(_monthly_usage_key(user_id, now), str(total_cost), ex=MONTHLY_USAGE_TTL)
+    logger.debug(f"Rebuilt monthly usage for {user_id} in {time.time() - start_time:.3f} seconds, total cost: {total_cost}")
     return total_cost
 
 
+async def record_monthly_usage(client, user_id: str, token_cost: float) -> float:
+    """Add a recorded response's cost to the account's monthly total and return the new total.
+
+    Call after the assistant_response_end message is stored: if the total has
+    to be rebuilt, the rebuild already includes that message.
+    """
+    redis_client = await redis.get_client()
+    new_total = await redis_client.eval(_INCR_USAGE_IF_EXISTS, 1, _monthly_usage_key(user_id), str(token_cost))
+    if new_total is None:
+        return await rebuild_monthly_usage(client, user_id)
+    return float(new_total)
+
+
+async def calculate_monthly_usage(client, user_id: str) -> float:
+    """Calculate total usage cost for the current month for a user."""
+    try:
+        total = await redis.get(_monthly_usage_key(user_id))
+        if total is not None:
+            return float(total)
+    except Exception as e:
+        logger.warning(f"Failed to read monthly usage total for {user_id}: {str(e)}")
+
+    return await rebuild_monthly_usage(client, user_id)
+
+
 async def get_usage_logs(client, user_id: str, page: int = 0, items_per_page: int = 1000) -> Dict:
     """Get detailed usage logs for a user with pagination, including credit usage info."""
     logger.debug(f"[USAGE_LOGS] Starting get_usage_logs for user_id={user_id}, page={page}, items_per_page={items_per_page}")
     
     try:
-        # Get start of current month in UTC
-        now = datetime.now(timezone.utc)
-        start_of_month = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
-        
-        # Use fixed cutoff date: June 26, 2025 midnight UTC
-        # Ignore all token counts before this date
-        cutoff_date = datetime(2025, 6, 30, 9, 0, 0, tzinfo=timezone.utc)
-        
-        start_of_month = max(start_of_month, cutoff_date)
+        # Start of current month in UTC, not earlier than the usage cutoff date
+        start_of_month = _usage_period_start()
         logger.debug(f"[USAGE_LOGS] user_id={user_id} - Using start_of_month: {start_of_month.isoformat()}")
         
         # First get all threads for this user in batches
@@ -597,6 +632,13 @@ async def get_usage_logs(client, user_id: str, page: int = 0, items_per_page: in
         # Process messages into usage log entries
         processed_logs = []
         logger.debug(f"[USAGE_LOGS] user_id={user_id} - Starting to process {len(messages_result.data)} messages")
+
+        # Price the whole page at once; each model is resolved a single time
+        try:
+            estimated_costs = calculate_token_costs([_usage_cost_row(message) for message in messages_result.data])
+        except Exception as cost_error:
+            logger.warning(f"[USAGE_LOGS] user_id={user_id} - Error calculating costs: {str(cost_error)}")
+            estimated_costs = [0.0] * len(messages_result.data)
         
         for i, message in enumerate(messages_result.data):
             try:
@@ -623,16 +665,8 @@ async def get_usage_logs(client, user_id: str, page: int = 0, items_per_page: in
                 # Safely calculate total tokens
                 total_tokens = int(prompt_tokens or 0) + int(completion_tokens or 0)
                 
-                # Calculate estimated cost using the same logic as calculate_monthly_usage
-                try:
-                    estimated_cost = calculate_token_cost(
-                        prompt_tokens,
-                        completion_tokens,
-                        model
-                    )
-                except Exception as cost_error:
-                    logger.warning(f"[USAGE_LOGS] user_id={user_id} - Error calculating cost for message {message_id}: {str(cost_error)}")
-                    estimated_cost = 0.0
+                # Estimated cost uses the same logic as calculate_monthly_usage
+                estimated_cost = estimated_costs[i]
                 
                 cumulative_cost += estimated_cost
                 
@@ -728,80 +762,49 @@ async def get_usage_logs(client, user_id: str, page: int = 0, items_per_page: in
         raise
 
 
+def _normalize_tokens(tokens) -> int:
+    return int(tokens) if tokens is not None else 0
+
+
+def _usage_cost_row(message: Dict) -> Tuple[int, int, str]:
+    """(prompt_tokens, completion_tokens, model) of an assistant_response_end message; invalid token counts count as 0."""
+    content = message.get('content') or {}
+    usage = content.get('usage') or {}
+    prompt_tokens = usage.get('prompt_tokens', 0)
+    completion_tokens = usage.get('completion_tokens', 0)
+    if not isinstance(prompt_tokens, (int, float)):
+        prompt_tokens = 0
+    if not isinstance(completion_tokens, (int, float)):
+        completion_tokens = 0
+    return prompt_tokens, completion_tokens, content.get('model', 'unknown')
+
+
 def calculate_token_cost(prompt_tokens: int, completion_tokens: int, model: str) -> float:
     """Calculate the cost for tokens using the same logic as the monthly usage calculation."""
     try:
-        # Ensure tokens are valid integers
-        prompt_tokens = int(prompt_tokens) if prompt_tokens is not None else 0
-        completion_tokens = int(completion_tokens) if completion_tokens is not None else 0
-        
-        logger.debug(f"Calculating token cost for model '{model}' with {prompt_tokens} input tokens and {completion_tokens} output tokens")
-        
-        # Try to resolve the model name using new model manager first
-        from models import model_manager
-        try:
-            resolved_model = model_manager.resolve_model_id(model)
-            logger.debug(f"Model '{model}' resolved to '{resolved_model}'")
-        except Exception as resolve_error:
-            logger.warning(f"Could not resolve model ID '{model}': {str(resolve_error)}, returning 0 cost")
-            return 0.0
-
-        # Check if we have hardcoded pricing for this model (try both original and resolved)
-        hardcoded_pricing = get_model_pricing(model) or get_model_pricing(resolved_model)
-        if hardcoded_pricing:
-            input_cost_per_million, output_cost_per_million = hardcoded_pricing
-            input_cost = (prompt_tokens / 1_000_000) * input_cost_per_million
-            output_cost = (completion_tokens / 1_000_000) * output_cost_per_million
-            message_cost = input_cost + output_cost
-        else:
-            # Use litellm pricing as fallback - try multiple variations
-            try:
-                models_to_try = [model]
-                
-                # Add resolved model if different
-                if resolved_model != model:
-                    models_to_try.append(resolved_model)
-                
-                # Try without provider prefix if it has one
-                if '/' in model:
-                    models_to_try.append(model.split('/', 1)[1])
-                if '/' in resolved_model and resolved_model != model:
-                    models_to_try.append(resolved_model.split('/', 1)[1])
-                    
-                # Special handling for Google models accessed via OpenRouter
-                if model.startswith('openrouter/google/'):
-                    google_model_name = model.replace('openrouter/', '')
-                    models_to_try.append(google_model_name)
-                if resolved_model.startswith('openrouter/google/'):
-                    google_model_name = resolved_model.replace('openrouter/', '')
-                    models_to_try.append(google_model_name)
-                
-                # Try each model name variation until we find one that works
-                message_cost = None
-                for model_name in models_to_try:
-                    try:
-                        prompt_token_cost, completion_token_cost = cost_per_token(model_name, prompt_tokens, completion_tokens)
-                        if prompt_token_cost is not None and completion_token_cost is not None:
-                            message_cost = prompt_token_cost + completion_token_cost
-                            break
-                    except Exception as e:
-                        logger.debug(f"Failed to get pricing for model variation {model_name}: {str(e)}")
-                        continue
-                
-                if message_cost is None:
-                    logger.debug(f"Could not get pricing for model {model} (resolved: {resolved_model}), returning 0 cost")
-                    return 0.0
-                    
-            except Exception as e:
-                logger.debug(f"Could not get pricing for model {model} (resolved: {resolved_model}): {str(e)}, returning 0 cost")
-                return 0.0
-        
+        message_cost = pricing_table.cost(_normalize_tokens(prompt_tokens), _normalize_tokens(completion_tokens), model)
         # Apply the TOKEN_PRICE_MULTIPLIER
         return message_cost * TOKEN_PRICE_MULTIPLIER
     except Exception as e:
         logger.error(f"Error calculating token cost for model {model}: {str(e)}")
         return 0.0
 
+
+def calculate_token_costs(rows: List[Tuple[int, int, str]]) -> List[float]:
+    """Costs of (prompt_tokens, completion_tokens, model) rows, priced like calculate_token_cost.
+
+    Each distinct model is resolved once for the whole batch.
+    """
+    try:
+        normalized = [
+            (_normalize_tokens(prompt_tokens), _normalize_tokens(completion_tokens), model)
+            for prompt_tokens, completion_tokens, model in rows
+        ]
+        return [cost * TOKEN_PRICE_MULTIPLIER for cost in pricing_table.cost_batch(normalized)]
+    except Exception as e:
+        logger.error(f"Error calculating token costs for {len(rows)} rows: {str(e)}")
+        return [calculate_token_cost(*row) for row in rows]
+
 async def get_allowed_models_for_user(client, user_id: str):
     """
     Get the list of models allowed for a user based on their subscription tier.
@@ -1162,11 +1165,13 @@ async def handle_usage_with_credits(
     token_cost: float,
     thread_id: str = None,
     message_id: str = None,
-    model: str = None
+    model: str = None,
+    current_usage: Optional[float] = None
 ) -> Tuple[bool, str]:
     """
     Handle token usage that may require credits if subscription limit is exceeded.
     This should be called after each agent response to track and deduct from credits if needed.
+    Pass current_usage (the month's usage before this cost) when it is already known.
     
     Returns:
         Tuple[bool, str]: (success, message)
@@ -1185,7 +1190,8 @@ async def handle_usage_with_credits(
         tier_info = SUBSCRIPTION_TIERS.get(price_id, SUBSCRIPTION_TIERS[config.STRIPE_FREE_TIER_ID])
         
         # Get current month's usage
-        current_usage = await calculate_monthly_usage(client, user_id)
+        if current_usage is None:
+            current_usage = await calculate_monthly_usage(client, user_id)
         
         # Check if this usage would exceed the subscription limit
         new_total_usage = current_usage + token_cost
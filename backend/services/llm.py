@@ -10,13 +10,17 @@ This module provides a unified interface for making API calls to different LLM p
 - Comprehensive error handling and logging
 """
 
-from typing import Union, Dict, Any, Optional, AsyncGenerator, List
+from typing import Union, Dict, Any, Optional, AsyncGenerator, Callable, List
+import asyncio
 import os
+import time
 import litellm
 from litellm.router import Router
 from litellm.files.main import ModelResponse
 from utils.logger import logger
 from utils.config import config
+from services.prompt_caching import plan_cache_breakpoints, apply_cache_breakpoints
+from services.llm_routing import llm_router
 
 # litellm.set_verbose=True
 # Let LiteLLM auto-adjust params and drop unsupported ones (e.g., GPT-5 temperature!=1)
@@ -140,33 +144,15 @@ def _configure_token_limits(params: Dict[str, Any], model_name: str, max_tokens:
     param_name = "max_completion_tokens" if (is_openai_o_series or is_openai_gpt5) else "max_tokens"
     params[param_name] = max_tokens
 
-def _apply_anthropic_caching(messages: List[Dict[str, Any]]) -> None:
-    """Apply Anthropic caching to the messages."""
+def _apply_anthropic_caching(params: Dict[str, Any], model_name: str) -> None:
+    """Mark prompt-cache breakpoints on copies of the messages and tools (see services.prompt_caching)."""
+    plan = plan_cache_breakpoints(model_name, params["messages"], params.get("tools"))
+    params["messages"], tools = apply_cache_breakpoints(params["messages"], params.get("tools"), plan)
+    if tools is not None:
+        params["tools"] = tools
+    logger.debug(f"Placed {plan.count} prompt cache breakpoints (tools: {plan.tools}, messages: {plan.messages})")
 
-    # Apply cache control to the first 4 text blocks across all messages
-    cache_control_count = 0
-    max_cache_control_blocks = 3
-    
-    for message in messages:
-        if cache_control_count >= max_cache_control_blocks:
-            break
-            
-        content = message.get("content")
-        
-        if isinstance(content, str):
-            message["content"] = [
-                {"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}
-            ]
-            cache_control_count += 1
-        elif isinstance(content, list):
-            for item in content:
-                if cache_control_count >= max_cache_control_blocks:
-                    break
-                if isinstance(item, dict) and item.get("type") == "text" and "cache_control" not in item:
-                    item["cache_control"] = {"type": "ephemeral"}
-                    cache_control_count += 1
-
-def _configure_anthopic(params: Dict[str, Any], model_name: str, messages: List[Dict[str, Any]]) -> None:
+def _configure_anthopic(params: Dict[str, Any], model_name: str) -> None:
     """Configure Anthropic-specific parameters."""
     if not ("claude" in model_name.lower() or "anthropic" in model_name.lower()):
         return
@@ -175,7 +161,7 @@ def _configure_anthopic(params: Dict[str, Any], model_name: str, messages: List[
         "anthropic-beta": "output-128k-2025-02-19"
     }
     logger.debug("Added Anthropic-specific headers")
-    _apply_anthropic_caching(messages)
+    _apply_anthropic_caching(params, model_name)
 
 def _configure_openrouter(params: Dict[str, Any], model_name: str) -> None:
     """Configure OpenRouter-specific parameters."""
@@ -292,10 +278,14 @@ def prepare_params(
     model_id: Optional[str] = None,
     enable_thinking: Optional[bool] = False,
     reasoning_effort: Optional[str] = "low",
+    resolve_model: bool = True,
 ) -> Dict[str, Any]:
-    from models import model_manager
-    resolved_model_name = model_manager.resolve_model_id(model_name)
-    logger.debug(f"Model resolution: '{model_name}' -> '{resolved_model_name}'")
+    if resolve_model:
+        from models import model_manager
+        resolved_model_name = model_manager.resolve_model_id(model_name)
+        logger.debug(f"Model resolution: '{model_name}' -> '{resolved_model_name}'")
+    else:
+        resolved_model_name = model_name
     
     params = {
         "model": resolved_model_name,
@@ -330,13 +320,13 @@ def prepare_params(
     # Add tools if provided
     _add_tools_config(params, tools, tool_choice)
     # Add Anthropic-specific parameters
-    _configure_anthopic(params, resolved_model_name, params["messages"])
+    _configure_anthopic(params, resolved_model_name)
     # Add OpenRouter-specific parameters
     _configure_openrouter(params, resolved_model_name)
     # Add Bedrock-specific parameters
     _configure_bedrock(params, resolved_model_name, model_id)
     
-    _add_fallback_model(params, resolved_model_name, messages)
+    _add_fallback_model(params, resolved_model_name, params["messages"])
     # Add OpenAI GPT-5 specific parameters
     _configure_openai_gpt5(params, resolved_model_name)
     # Add Kimi K2-specific parameters
@@ -390,32 +380,238 @@ async def make_llm_api_call(
     # debug <timestamp>.json messages
     logger.debug(f"Making LLM API call to model: {model_name} (Thinking: {enable_thinking}, Effort: {reasoning_effort})")
     logger.debug(f"📡 API Call: Using model {model_name}")
-    params = prepare_params(
-        messages=messages,
-        model_name=model_name,
-        temperature=temperature,
-        max_tokens=max_tokens,
-        response_format=response_format,
-        tools=tools,
-        tool_choice=tool_choice,
-        api_key=api_key,
-        api_base=api_base,
-        stream=stream,
-        top_p=top_p,
-        model_id=model_id,
-        enable_thinking=enable_thinking,
-        reasoning_effort=reasoning_effort,
-    )
+
+    def params_for(deployment: str, resolve_model: bool = False) -> Dict[str, Any]:
+        return prepare_params(
+            messages=messages,
+            model_name=deployment,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            response_format=response_format,
+            tools=tools,
+            tool_choice=tool_choice,
+            api_key=api_key,
+            api_base=api_base,
+            stream=stream,
+            top_p=top_p,
+            model_id=model_id,
+            enable_thinking=enable_thinking,
+            reasoning_effort=reasoning_effort,
+            resolve_model=resolve_model,
+        )
+
+    if not config.LLM_LATENCY_ROUTING:
+        params = params_for(model_name, resolve_model=True)
+        try:
+            response = await provider_router.acompletion(**params)
+            logger.debug(f"Successfully received API response from {model_name}")
+            return response
+        except Exception as e:
+            logger.error(f"Unexpected error during API call: {str(e)}", exc_info=True)
+            raise LLMError(f"API call failed: {str(e)}")
+
+    from models import model_manager
+    resolved_model_name = model_manager.resolve_model_id(model_name)
+    deployments = llm_router.order(_equivalent_deployments(resolved_model_name))
+    if deployments[0] != resolved_model_name:
+        logger.info(f"Routing {resolved_model_name} to {deployments[0]} (faster or healthier)")
+
+    def routed_params_for(deployment: str) -> Dict[str, Any]:
+        params = params_for(deployment)
+        # Failover between deployments happens here, where it is measured, instead of inside LiteLLM
+        params.pop("fallbacks", None)
+        if len(deployments) > 1:
+            params["num_retries"] = 1
+        return params
+
     try:
-        response = await provider_router.acompletion(**params)
+        if config.LLM_HEDGING and len(deployments) > 1:
+            response = await _hedged_call(deployments[0], deployments[1], routed_params_for)
+        else:
+            response = await _call_with_failover(deployments, routed_params_for)
         logger.debug(f"Successfully received API response from {model_name}")
-        # logger.debug(f"Response: {response}")
         return response
 
+    except LLMError:
+        raise
     except Exception as e:
         logger.error(f"Unexpected error during API call: {str(e)}", exc_info=True)
         raise LLMError(f"API call failed: {str(e)}")
 
+def _equivalent_deployments(model_name: str) -> List[str]:
+    """The model followed by the deployments serving the same model elsewhere."""
+    fallback_model = get_openrouter_fallback(model_name)
+    if fallback_model and fallback_model != model_name:
+        return [model_name, fallback_model]
+    return [model_name]
+
+def _is_transient_error(error: Exception) -> bool:
+    """Whether another deployment might succeed: timeouts, rate limits, connection and 5xx errors.
+
+    Bad requests (including context window overflows) and authentication
+    errors would fail the same way everywhere, so they are neither failed over
+    nor counted against the deployment.
+    """
+    if isinstance(error, (litellm.BadRequestError, litellm.AuthenticationError)):
+        return False
+    if isinstance(error, (
+        litellm.Timeout,
+        litellm.RateLimitError,
+        litellm.APIConnectionError,
+        litellm.InternalServerError,
+        litellm.ServiceUnavailableError,
+        asyncio.TimeoutError,
+        ConnectionError,
+    )):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return isinstance(status_code, int) and status_code >= 500
+
+def _chunk_chars(chunk: Any) -> int:
+    try:
+        delta = chunk.choices[0].delta
+        return len(getattr(delta, "content", None) or "") + len(getattr(delta, "reasoning_content", None) or "")
+    except (AttributeError, IndexError, TypeError):
+        return 0
+
+async def _close_response(response: Any) -> None:
+    """Close a provider response that won't be read, releasing its connection."""
+    try:
+        if hasattr(response, "aclose"):
+            await response.aclose()
+        elif hasattr(response, "close"):
+            result = response.close()
+            if asyncio.iscoroutine(result):
+                await result
+    except Exception as e:
+        logger.debug(f"Error closing abandoned LLM response: {str(e)}")
+
+async def _measured_stream(deployment: str, response: Any, first_chunk: Any) -> AsyncGenerator:
+    """Pass the deployment's stream through, recording its output rate."""
+    first_token_at = time.monotonic()
+    chars = 0
+    finished = first_chunk is None
+    try:
+        if first_chunk is None:
+            return
+        chars += _chunk_chars(first_chunk)
+        yield first_chunk
+        async for chunk in response:
+            chars += _chunk_chars(chunk)
+            yield chunk
+        finished = True
+    except Exception as e:
+        if _is_transient_error(e):
+            llm_router.stats(deployment).record_error()
+        raise
+    finally:
+        if not finished:
+            # Closed before the end, e.g. a discarded hedge or a consumer that stopped early
+            await _close_response(response)
+        elapsed = time.monotonic() - first_token_at
+        if chars and elapsed > 0:
+            # Same 4 characters per token estimate as elsewhere; only used to compare deployments
+            llm_router.stats(deployment).record_throughput(chars / 4 / elapsed)
+
+async def _call_deployment(deployment: str, params: Dict[str, Any]) -> Union[ModelResponse, AsyncGenerator]:
+    """Call one deployment and wait for its first token (for the whole response when not streaming)."""
+    stats = llm_router.stats(deployment)
+    started = time.monotonic()
+    response = None
+    try:
+        response = await provider_router.acompletion(**params)
+        if not params.get("stream"):
+            stats.record_first_token(time.monotonic() - started)
+            return response
+        try:
+            first_chunk = await response.__anext__()
+        except StopAsyncIteration:
+            first_chunk = None
+        stats.record_first_token(time.monotonic() - started)
+        return _measured_stream(deployment, response, first_chunk)
+    except asyncio.CancelledError:
+        # Cancelled while waiting for the first token, e.g. after losing a hedged race
+        if response is not None:
+            await _close_response(response)
+        raise
+    except Exception as e:
+        if _is_transient_error(e):
+            stats.record_error()
+        raise
+
+async def _call_with_failover(deployments: List[str], params_for: Callable[[str], Dict[str, Any]]) -> Union[ModelResponse, AsyncGenerator]:
+    last_error = None
+    for deployment in deployments:
+        try:
+            return await _call_deployment(deployment, params_for(deployment))
+        except LLMError:
+            raise
+        except Exception as e:
+            if not _is_transient_error(e):
+                raise
+            last_error = e
+            logger.warning(f"LLM call to {deployment} failed: {str(e)}")
+    raise last_error
+
+async def _discard(task: asyncio.Task) -> None:
+    """Cancel a losing request, closing its stream if it already has one."""
+    if not task.done():
+        task.cancel()
+        return
+    if task.cancelled() or task.exception() is not None:
+        return
+    result = task.result()
+    if hasattr(result, "aclose"):
+        try:
+            await result.aclose()
+        except Exception:
+            pass
+
+async def _hedged_call(primary: str, alternate: str, params_for: Callable[[str], Dict[str, Any]]) -> Union[ModelResponse, AsyncGenerator]:
+    """Call primary; if it has no first token after its hedge delay, race it against alternate."""
+    started = time.monotonic()
+    primary_task = asyncio.create_task(_call_deployment(primary, params_for(primary)))
+    tasks = [primary_task]
+    winner = None
+    try:
+        delay = llm_router.hedge_delay(primary)
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            if primary_task.exception() is None:
+                winner = primary_task
+                return primary_task.result()
+            if not _is_transient_error(primary_task.exception()):
+                raise primary_task.exception()
+            logger.warning(f"LLM call to {primary} failed: {str(primary_task.exception())}")
+            return await _call_deployment(alternate, params_for(alternate))
+
+        logger.info(f"No first token from {primary} after {delay:.1f}s, hedging with {alternate}")
+        tasks.append(asyncio.create_task(_call_deployment(alternate, params_for(alternate))))
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = task
+                    break
+                error = task.exception()
+                if not _is_transient_error(error):
+                    # The other deployment would reject the request too
+                    raise error
+                logger.warning(f"Hedged LLM call failed: {str(error)}")
+            if winner:
+                if winner is not primary_task:
+                    # Time to first token of the abandoned primary is at least this long
+                    llm_router.stats(primary).record_slow(time.monotonic() - started)
+                logger.debug(f"Hedged LLM call won by {primary if winner is primary_task else alternate}")
+                return winner.result()
+        raise error
+    finally:
+        for task in tasks:
+            if task is not winner:
+                await _discard(task)
+
 # Initialize API keys on module import
 setup_api_keys()
 setup_provider_router()
@@ -0,0 +1,134 @@
+"""
+Latency-aware routing between equivalent LLM deployments.
+
+make_llm_api_call used to send every request to the requested model and only
+move to its OpenRouter equivalent through LiteLLM's fallbacks, after the
+primary had exhausted its retries. During a provider brownout that meant every
+agent run stalled for tens of seconds on every call.
+
+DeploymentRouter keeps rolling statistics per deployment (the model string
+sent to LiteLLM, e.g. "anthropic/claude-sonnet-4-20250514" and
+"openrouter/anthropic/claude-sonnet-4"): time to first token, output tokens
+per second and the outcome of the last WINDOW_SIZE calls.
+
+- order() puts healthy deployments first. The requested model stays first
+  unless an equivalent has been measurably faster (FASTER_MARGIN) or the
+  requested one is unhealthy: its error rate is above UNHEALTHY_ERROR_RATE,
+  or it is cooling down after CONSECUTIVE_ERRORS_COOLDOWN errors in a row.
+- hedge_delay() is the deployment's HEDGE_PERCENTILE time to first token,
+  clamped to [HEDGE_MIN_DELAY_SECONDS, HEDGE_MAX_DELAY_SECONDS]. When
+  LLM_HEDGING is enabled, a request still waiting for its first token after
+  that long is raced against the next deployment and the loser is cancelled.
+
+A request that loses a race records its elapsed time as a time-to-first-token
+sample. That is a lower bound, so a stalled deployment falls behind without
+waiting for it to finish or fail. Statistics are per process.
+"""
+
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+WINDOW_SIZE = 50
+MIN_SAMPLES = 5
+FASTER_MARGIN = 0.75
+UNHEALTHY_ERROR_RATE = 0.5
+CONSECUTIVE_ERRORS_COOLDOWN = 3
+COOLDOWN_SECONDS = 60
+
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_DELAY_SECONDS = 2.0
+HEDGE_MAX_DELAY_SECONDS = 15.0
+
+
+class DeploymentStats:
+    def __init__(self, window_size: int = WINDOW_SIZE):
+        self.ttfts: Deque[float] = deque(maxlen=window_size)
+        self.tokens_per_second: Deque[float] = deque(maxlen=window_size)
+        self.outcomes: Deque[bool] = deque(maxlen=window_size)
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+
+    def record_first_token(self, ttft: float) -> None:
+        self.ttfts.append(ttft)
+        self.outcomes.append(True)
+        self.consecutive_errors = 0
+
+    def record_throughput(self, tokens_per_second: float) -> None:
+        self.tokens_per_second.append(tokens_per_second)
+
+    def record_slow(self, elapsed: float) -> None:
+        """The request was abandoned after elapsed seconds without a first token."""
+        self.ttfts.append(elapsed)
+
+    def record_error(self) -> None:
+        self.outcomes.append(False)
+        self.consecutive_errors += 1
+        if self.consecutive_errors >= CONSECUTIVE_ERRORS_COOLDOWN:
+            self.cooldown_until = time.monotonic() + COOLDOWN_SECONDS
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def healthy(self) -> bool:
+        if time.monotonic() < self.cooldown_until:
+            return False
+        return len(self.outcomes) < MIN_SAMPLES or self.error_rate <= UNHEALTHY_ERROR_RATE
+
+    def ttft_percentile(self, percentile: float) -> Optional[float]:
+        if len(self.ttfts) < MIN_SAMPLES:
+            return None
+        ordered = sorted(self.ttfts)
+        return ordered[min(len(ordered) - 1, int(percentile * len(ordered)))]
+
+
+class DeploymentRouter:
+    def __init__(self):
+        self._stats: Dict[str, DeploymentStats] = {}
+
+    def stats(self, deployment: str) -> DeploymentStats:
+        stats = self._stats.get(deployment)
+        if stats is None:
+            stats = DeploymentStats()
+            self._stats[deployment] = stats
+        return stats
+
+    def order(self, candidates: List[str]) -> List[str]:
+        """Candidates in the order to try them; candidates[0] is the requested deployment."""
+        if len(candidates) < 2:
+            return list(candidates)
+
+        healthy = [c for c in candidates if self.stats(c).healthy()]
+        unhealthy = sorted(
+            (c for c in candidates if c not in healthy),
+            key=lambda c: (self.stats(c).cooldown_until, self.stats(c).error_rate),
+        )
+        if not healthy:
+            return unhealthy
+
+        requested = candidates[0]
+        medians = {c: self.stats(c).ttft_percentile(0.5) for c in healthy}
+        measured = [c for c in healthy if medians[c] is not None]
+        first = requested if requested in healthy else healthy[0]
+        if measured:
+            fastest = min(measured, key=lambda c: medians[c])
+            if medians[first] is not None:
+                if medians[fastest] < medians[first] * FASTER_MARGIN:
+                    first = fastest
+            elif first != requested:
+                first = fastest
+            # A healthy requested deployment without enough samples stays first until it can be compared
+
+        return [first] + [c for c in healthy if c != first] + unhealthy
+
+    def hedge_delay(self, deployment: str) -> float:
+        ttft = self.stats(deployment).ttft_percentile(HEDGE_PERCENTILE)
+        if ttft is None:
+            return HEDGE_MAX_DELAY_SECONDS
+        return min(max(ttft, HEDGE_MIN_DELAY_SECONDS), HEDGE_MAX_DELAY_SECONDS)
+
+
+llm_router = DeploymentRouter()
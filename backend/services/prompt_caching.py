@@ -0,0 +1,191 @@
+"""
+Placement of prompt-cache breakpoints for Anthropic models.
+
+Only the first three text blocks of a request used to be marked with
+cache_control, which in an agent thread means the system prompt and the first
+couple of messages. Everything after them was never cached, so each iteration
+and auto-continue of a run paid full price and full prefill latency for a
+prefix that only grows at the end.
+
+plan_cache_breakpoints spends the provider's MAX_CACHE_BREAKPOINTS on:
+
+- the last tool definition (direct Anthropic calls only), so the tool schemas
+  stay cached when the system prompt changes, e.g. when its knowledge base
+  section was retrieved for a different query;
+- the end of the system prompt;
+- the last user messages that end a turn, newest first: the newest writes the
+  prefix the next call of the agent loop will extend, the one before it is
+  where the previous call ended and reads the prefix that call wrote.
+
+A breakpoint is only placed where the prefix up to it reaches the model's
+minimum cacheable length, since shorter prefixes are never cached. Messages
+are counted with agentpress.token_cache, which already holds the counts of
+the thread's messages. Breakpoints are applied to copies; the caller's
+messages and tools are left untouched.
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from agentpress.token_cache import token_count_cache
+
+MAX_CACHE_BREAKPOINTS = 4
+MIN_CACHEABLE_TOKENS = 1024
+MIN_CACHEABLE_TOKENS_HAIKU = 2048
+
+EPHEMERAL = {"type": "ephemeral"}
+
+_last_tools: Tuple[Optional[list], int] = (None, 0)
+
+
+@dataclass
+class CacheBreakpointPlan:
+    tools: bool = False
+    # Indexes into the message list, in ascending order
+    messages: List[int] = field(default_factory=list)
+
+    @property
+    def count(self) -> int:
+        return len(self.messages) + (1 if self.tools else 0)
+
+
+def min_cacheable_tokens(model_name: str) -> int:
+    return MIN_CACHEABLE_TOKENS_HAIKU if "haiku" in model_name.lower() else MIN_CACHEABLE_TOKENS
+
+
+def _tools_tokens(tools: list) -> int:
+    # The registry hands out the same list for as long as the tool set doesn't change
+    global _last_tools
+    cached_tools, tokens = _last_tools
+    if cached_tools is not tools:
+        tokens = len(json.dumps(tools, default=str)) // 4
+        _last_tools = (tools, tokens)
+    return tokens
+
+
+def _has_text(message: Dict[str, Any]) -> bool:
+    content = message.get("content")
+    if isinstance(content, str):
+        return bool(content)
+    if isinstance(content, list):
+        return any(isinstance(item, dict) and item.get("type") == "text" and item.get("text") for item in content)
+    return False
+
+
+def _turn_boundaries(messages: List[Dict[str, Any]]) -> List[int]:
+    """Indexes of user messages followed by a non-user message or by nothing, newest first."""
+    boundaries = []
+    for i in range(len(messages) - 1, 0, -1):
+        if messages[i].get("role") != "user":
+            continue
+        if i + 1 < len(messages) and messages[i + 1].get("role") == "user":
+            continue
+        if _has_text(messages[i]):
+            boundaries.append(i)
+    return boundaries
+
+
+def plan_cache_breakpoints(
+    model_name: str,
+    messages: List[Dict[str, Any]],
+    tools: Optional[List[Dict[str, Any]]] = None,
+) -> CacheBreakpointPlan:
+    plan = CacheBreakpointPlan()
+    if not messages:
+        return plan
+    min_tokens = min_cacheable_tokens(model_name)
+
+    prefix_tokens = 0
+    if tools:
+        prefix_tokens = _tools_tokens(tools)
+        if model_name.startswith("anthropic/") and prefix_tokens >= min_tokens:
+            plan.tools = True
+
+    cumulative = []
+    for message in messages:
+        prefix_tokens += token_count_cache.count_message(model_name, message)
+        cumulative.append(prefix_tokens)
+
+    if messages[0].get("role") == "system" and _has_text(messages[0]) and cumulative[0] >= min_tokens:
+        plan.messages.append(0)
+
+    for index in _turn_boundaries(messages):
+        if plan.count >= MAX_CACHE_BREAKPOINTS or cumulative[index] < min_tokens:
+            break
+        plan.messages.append(index)
+
+    plan.messages.sort()
+    return plan
+
+
+def _without_cache_control(message: Dict[str, Any]) -> Dict[str, Any]:
+    content = message.get("content")
+    if not isinstance(content, list) or not any(isinstance(item, dict) and "cache_control" in item for item in content):
+        return message
+    copied = dict(message)
+    copied["content"] = [
+        {k: v for k, v in item.items() if k != "cache_control"} if isinstance(item, dict) else item
+        for item in content
+    ]
+    return copied
+
+
+def _with_cache_control(message: Dict[str, Any]) -> Dict[str, Any]:
+    copied = dict(message)
+    content = message.get("content")
+    if isinstance(content, str):
+        copied["content"] = [{"type": "text", "text": content, "cache_control": EPHEMERAL}]
+        return copied
+
+    blocks = list(content)
+    for i in range(len(blocks) - 1, -1, -1):
+        item = blocks[i]
+        if isinstance(item, dict) and item.get("type") == "text" and item.get("text"):
+            blocks[i] = {**item, "cache_control": EPHEMERAL}
+            break
+    copied["content"] = blocks
+    return copied
+
+
+def apply_cache_breakpoints(
+    messages: List[Dict[str, Any]],
+    tools: Optional[List[Dict[str, Any]]],
+    plan: CacheBreakpointPlan,
+) -> Tuple[List[Dict[str, Any]], Optional[List[Dict[str, Any]]]]:
+    """Copies of messages and tools with the plan's breakpoints, replacing any already present."""
+    marked = set(plan.messages)
+    new_messages = [
+        _with_cache_control(_without_cache_control(message)) if i in marked else _without_cache_control(message)
+        for i, message in enumerate(messages)
+    ]
+
+    new_tools = tools
+    if tools:
+        new_tools = [{k: v for k, v in tool.items() if k != "cache_control"} if "cache_control" in tool else tool for tool in tools]
+        if plan.tools:
+            new_tools[-1] = {**new_tools[-1], "cache_control": EPHEMERAL}
+    return new_messages, new_tools
+
+
+def cache_usage(usage: Any) -> Dict[str, int]:
+    """Prompt cache read/write token counts reported in a usage object or dict ({} if none)."""
+    if usage is None:
+        return {}
+
+    def read(obj, name):
+        value = obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+        return value if isinstance(value, int) else None
+
+    result = {}
+    cache_read = read(usage, "cache_read_input_tokens")
+    if cache_read is None:
+        details = usage.get("prompt_tokens_details") if isinstance(usage, dict) else getattr(usage, "prompt_tokens_details", None)
+        if details is not None:
+            cache_read = read(details, "cached_tokens")
+    if cache_read is not None:
+        result["cache_read_input_tokens"] = cache_read
+    cache_write = read(usage, "cache_creation_input_tokens")
+    if cache_write is not None:
+        result["cache_creation_input_tokens"] = cache_write
+    return result
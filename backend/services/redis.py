@@ -195,6 +195,25 @@ async def lrange(key: str, start: int, end: int) -> List[str]:
     return await redis_client.lrange(key, start, end)
 
 
+# Stream operations
+async def xadd(key: str, fields: dict, maxlen: int = None, approximate: bool = True) -> str:
+    """Append an entry to a stream, optionally capping its length."""
+    redis_client = await get_client()
+    return await redis_client.xadd(key, fields, maxlen=maxlen, approximate=approximate)
+
+
+async def xrange(key: str, min: str = "-", max: str = "+", count: int = None) -> List[Any]:
+    """Get a range of entries from a stream."""
+    redis_client = await get_client()
+    return await redis_client.xrange(key, min=min, max=max, count=count)
+
+
+async def xread(streams: dict, count: int = None, block: int = None) -> List[Any]:
+    """Read entries after the given ids from one or more streams."""
+    redis_client = await get_client()
+    return await redis_client.xread(streams, count=count, block=block)
+
+
 # Key management
 
 
@@ -203,6 +222,11 @@ async def keys(pattern: str) -> List[str]:
     return await redis_client.keys(pattern)
 
 
+async def exists(key: str) -> bool:
+    redis_client = await get_client()
+    return bool(await redis_client.exists(key))
+
+
 async def expire(key: str, seconds: int):
     redis_client = await get_client()
     return await redis_client.expire(key, seconds)
@@ -0,0 +1,162 @@
+"""
+Control plane for the agent runs executing in a worker process.
+
+Every run used to open its own pub/sub connection, subscribe to its instance
+and global control channels and poll them in a loop (get_message with a 0.5 s
+timeout plus a 0.1 s sleep), refreshing its `active_run:*` key from the same
+loop. A worker running dozens of runs held as many Redis connections and
+woke up several times a second per run doing nothing.
+
+RunControlDispatcher replaces that with one pattern subscription per process:
+
+- runs register on start and get a RunControl whose event is set as soon as a
+  terminal signal (STOP, END_STREAM, ERROR) arrives on any of their control
+  channels; the subscription is in place before register returns, so a STOP
+  sent right after the run starts is not missed;
+- the `active_run:*` keys of all registered runs are refreshed together in one
+  pipeline every ACTIVE_KEY_REFRESH_SECONDS;
+- if the subscription drops it is re-established with a back-off; signals
+  published in between are lost, as they were with per-run connections.
+
+The listener and refresher are started on first use in the event loop that
+runs the actors.
+"""
+
+import asyncio
+from typing import Dict, Optional
+
+from services import redis
+from services.agent_run_stream import TERMINAL_SIGNALS
+from utils.logger import logger
+
+CONTROL_CHANNEL_PATTERNS = ("agent_run:*:control", "agent_run:*:control:*")
+ACTIVE_KEY_REFRESH_SECONDS = 60
+SUBSCRIBE_TIMEOUT_SECONDS = 10
+RESUBSCRIBE_DELAY_SECONDS = 1
+MAX_RESUBSCRIBE_DELAY_SECONDS = 30
+
+
+def _run_id_from_channel(channel: str) -> Optional[str]:
+    # agent_run:{agent_run_id}:control[:{instance_id}]
+    parts = channel.split(':')
+    if len(parts) >= 3 and parts[0] == 'agent_run' and parts[2] == 'control':
+        return parts[1]
+    return None
+
+
+class RunControl:
+    """Control state of one registered run."""
+
+    def __init__(self, agent_run_id: str, active_key: str):
+        self.agent_run_id = agent_run_id
+        self.active_key = active_key
+        self.signal: Optional[str] = None
+        self.event = asyncio.Event()
+
+    @property
+    def stopped(self) -> bool:
+        return self.event.is_set()
+
+    def deliver(self, signal: str) -> None:
+        if self.signal is None:
+            self.signal = signal
+        self.event.set()
+
+
+class RunControlDispatcher:
+    def __init__(self, refresh_interval: float = ACTIVE_KEY_REFRESH_SECONDS):
+        self.refresh_interval = refresh_interval
+        self._runs: Dict[str, RunControl] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self._refresher: Optional[asyncio.Task] = None
+        self._subscribed: Optional[asyncio.Event] = None
+
+    def _ensure_started(self) -> None:
+        if self._subscribed is None:
+            self._subscribed = asyncio.Event()
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_active_keys())
+
+    async def register(self, agent_run_id: str, active_key: str) -> RunControl:
+        """Start receiving control signals for the run and keep its active key alive.
+
+        Raises asyncio.TimeoutError if the control channels can't be subscribed to.
+        """
+        self._ensure_started()
+        control = RunControl(agent_run_id, active_key)
+        self._runs[agent_run_id] = control
+        try:
+            await asyncio.wait_for(self._subscribed.wait(), timeout=SUBSCRIBE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            self.unregister(agent_run_id, control)
+            logger.error(f"Timed out subscribing to control channels for agent run {agent_run_id}")
+            raise
+        return control
+
+    def unregister(self, agent_run_id: str, control: Optional[RunControl] = None) -> None:
+        if control is None or self._runs.get(agent_run_id) is control:
+            self._runs.pop(agent_run_id, None)
+
+    def dispatch(self, channel: str, data) -> None:
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        if data not in TERMINAL_SIGNALS:
+            return
+        agent_run_id = _run_id_from_channel(channel)
+        control = self._runs.get(agent_run_id) if agent_run_id else None
+        if control is not None and not control.stopped:
+            logger.debug(f"Received {data} signal for agent run {agent_run_id}")
+            control.deliver(data)
+
+    async def _listen(self) -> None:
+        delay = RESUBSCRIBE_DELAY_SECONDS
+        while True:
+            pubsub = None
+            try:
+                pubsub = await redis.create_pubsub()
+                await pubsub.psubscribe(*CONTROL_CHANNEL_PATTERNS)
+                self._subscribed.set()
+                delay = RESUBSCRIBE_DELAY_SECONDS
+                logger.debug(f"Subscribed to control channels: {', '.join(CONTROL_CHANNEL_PATTERNS)}")
+                async for message in pubsub.listen():
+                    if message and message.get("type") == "pmessage":
+                        channel = message.get("channel")
+                        if isinstance(channel, bytes):
+                            channel = channel.decode('utf-8')
+                        self.dispatch(channel, message.get("data"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Run control listener failed, resubscribing in {delay}s: {e}")
+            finally:
+                self._subscribed.clear()
+                if pubsub:
+                    try:
+                        await pubsub.punsubscribe()
+                        await pubsub.close()
+                    except Exception:
+                        pass
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RESUBSCRIBE_DELAY_SECONDS)
+
+    async def _refresh_active_keys(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            keys = [control.active_key for control in self._runs.values()]
+            if not keys:
+                continue
+            try:
+                redis_client = await redis.get_client()
+                async with redis_client.pipeline(transaction=False) as pipe:
+                    for key in keys:
+                        pipe.expire(key, redis.REDIS_KEY_TTL)
+                    await pipe.execute()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Failed to refresh TTL of {len(keys)} active run keys: {e}")
+
+
+run_control = RunControlDispatcher()
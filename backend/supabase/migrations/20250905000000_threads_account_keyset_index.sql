@@ -0,0 +1,7 @@
+BEGIN;
+
+-- Supports keyset pagination of a user's threads (newest first)
+CREATE INDEX IF NOT EXISTS idx_threads_account_created_at_thread_id
+    ON threads(account_id, created_at DESC, thread_id DESC);
+
+COMMIT;
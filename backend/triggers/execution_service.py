@@ -8,6 +8,7 @@ from services import redis
 from utils.logger import logger, structlog
 from utils.config import config
 from run_agent_background import run_agent_background
+from agent.running_runs import register_running_run
 from .trigger_service import TriggerEvent, TriggerResult
 from .utils import format_workflow_for_llm
 
@@ -224,82 +225,18 @@ class AgentExecutor:
             logger.debug(f"Getting agent config for agent_id: {agent_id}")
             
             client = await self._db.client
-            agent_result = await client.table('agents').select('account_id, name, current_version_id').eq('agent_id', agent_id).execute()
+            agent_result = await client.table('agents').select('*').eq('agent_id', agent_id).execute()
             
             if not agent_result.data:
                 logger.error(f"Agent not found in database: {agent_id}")
                 return None
             
             agent_data = agent_result.data[0]
-            account_id = agent_data.get('account_id')
-            current_version_id = agent_data.get('current_version_id')
-            logger.debug(f"Found agent in database: {agent_data.get('name')}, account_id: {account_id}, current_version_id: {current_version_id}")
+            if not agent_data.get('current_version_id'):
+                logger.warning(f"Agent {agent_id} has no current_version_id set, using agent row only")
             
-            if not current_version_id:
-                logger.error(f"Agent {agent_id} has no current_version_id set. This is likely the cause of the fallback to default prompt.")
-                return {
-                    'agent_id': agent_id,
-                    'account_id': agent_data.get('account_id'),
-                    'name': agent_data.get('name', 'Unknown Agent'),
-                    'system_prompt': 'You are a helpful AI assistant.',
-                    'configured_mcps': [],
-                    'custom_mcps': [],
-                    'agentpress_tools': {},
-                }
-            
-            from agent.versioning.version_service import get_version_service
-            version_service = await get_version_service()
-            
-            user_id_for_version = account_id if account_id else "system"
-            
-            try:
-                version = await version_service.get_version(agent_id, current_version_id, user_id_for_version)
-                logger.debug(f"Successfully retrieved version {current_version_id} for agent {agent_id}: {version.version_name}")
-                
-                return {
-                    'agent_id': agent_id,
-                    'account_id': agent_data.get('account_id'),
-                    'name': agent_data.get('name', 'Unknown Agent'),
-                    'system_prompt': version.system_prompt,
-                    'model': version.model,
-                    'configured_mcps': version.configured_mcps,
-                    'custom_mcps': version.custom_mcps,
-                    'agentpress_tools': version.agentpress_tools if isinstance(version.agentpress_tools, dict) else {},
-                    'current_version_id': version.version_id,
-                    'version_name': version.version_name
-                }
-                
-            except Exception as version_error:
-                logger.error(f"Failed to get version {current_version_id} for agent {agent_id}: {type(version_error).__name__}: {version_error}")
-                if user_id_for_version != "system":
-                    try:
-                        version = await version_service.get_version(agent_id, current_version_id, "system")
-                        return {
-                            'agent_id': agent_id,
-                            'account_id': agent_data.get('account_id'),
-                            'name': agent_data.get('name', 'Unknown Agent'),
-                            'system_prompt': version.system_prompt,
-                            'model': version.model,
-                            'configured_mcps': version.configured_mcps,
-                            'custom_mcps': version.custom_mcps,
-                            'agentpress_tools': version.agentpress_tools if isinstance(version.agentpress_tools, dict) else {},
-                            'current_version_id': version.version_id,
-                            'version_name': version.version_name
-                        }
-                        
-                    except Exception as system_version_error:
-                        logger.error(f"Failed to get version {current_version_id} with system user for agent {agent_id}: {type(system_version_error).__name__}: {system_version_error}")
-                
-                logger.error(f"Unable to retrieve version {current_version_id} for agent {agent_id}. Using fallback configuration.")
-                return {
-                    'agent_id': agent_id,
-                    'account_id': agent_data.get('account_id'),
-                    'name': agent_data.get('name', 'Unknown Agent'),
-                    'system_prompt': 'You are a helpful AI assistant.',
-                    'configured_mcps': [],
-                    'custom_mcps': [],
-                    'agentpress_tools': {},
-                }
+            from agent.config_cache import get_agent_config
+            return await get_agent_config(agent_data, agent_data.get('account_id') or "system")
             
         except Exception as e:
             logger.error(f"Failed to get agent config using versioning system for agent {agent_id}: {e}", exc_info=True)
@@ -408,6 +345,7 @@ class AgentExecutor:
         agent_run_id = agent_run.data[0]['id']
         
         await self._register_agent_run(agent_run_id)
+        await register_running_run(account_id, agent_run_id, thread_id)
         
         run_agent_background.send(
             agent_run_id=agent_run_id,
@@ -714,6 +652,7 @@ class WorkflowExecutor:
         agent_run_id = agent_run.data[0]['id']
         
         await self._register_workflow_run(agent_run_id)
+        await register_running_run(account_id, agent_run_id, thread_id)
         
         run_agent_background.send(
             agent_run_id=agent_run_id,
@@ -0,0 +1,145 @@
+"""
+In-process caches for request authentication.
+
+The frontend polls several endpoints per second per user and the SSE endpoint
+re-authenticates on every reconnect, so the same credentials are checked over
+and over:
+
+- VerifiedTokenCache maps the digest of a JWT whose signature was verified to
+  (user_id, exp). Entries are dropped once the token expires, so a cached
+  token is accepted exactly as long as verifying it again would succeed.
+- ApiKeyCache keeps successful API key authentications for a few seconds in
+  front of the Redis validation cache. Revoking or deleting a key publishes
+  its public key on API_KEY_REVOCATION_CHANNEL and every process drops its
+  entries; the short TTL bounds staleness if a message is missed.
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from services import redis
+from utils.logger import logger
+
+API_KEY_REVOCATION_CHANNEL = "api_key_revocations"
+
+TOKEN_CACHE_SIZE = 10000
+# Tokens without an exp claim are re-verified after this long
+TOKEN_MAX_TTL_SECONDS = 300
+API_KEY_CACHE_SIZE = 2000
+API_KEY_TTL_SECONDS = 30
+
+
+def _digest(credential: str) -> str:
+    return hashlib.sha256(credential.encode()).hexdigest()
+
+
+class VerifiedTokenCache:
+    """Bounded LRU of verified JWT digests -> (user_id, expiry)."""
+
+    def __init__(self, maxsize: int = TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+    def get(self, token: str) -> Optional[str]:
+        key = _digest(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        user_id, expires_at = entry
+        if time.time() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return user_id
+
+    def put(self, token: str, payload: dict) -> None:
+        user_id = payload.get('sub')
+        if not user_id:
+            return
+        exp = payload.get('exp')
+        expires_at = float(exp) if isinstance(exp, (int, float)) else time.time() + TOKEN_MAX_TTL_SECONDS
+        key = _digest(token)
+        self._entries[key] = (user_id, expires_at)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+class ApiKeyCache:
+    """Short-lived LRU of authenticated API keys -> (user_id, key_id), invalidated on revocation."""
+
+    def __init__(self, maxsize: int = API_KEY_CACHE_SIZE, ttl: float = API_KEY_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[str, str, str, float]]" = OrderedDict()
+
+    def get(self, api_key: str) -> Optional[Tuple[str, str]]:
+        key = _digest(api_key)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        _, user_id, key_id, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return user_id, key_id
+
+    def put(self, api_key: str, public_key: str, user_id: str, key_id: str) -> None:
+        key = _digest(api_key)
+        self._entries[key] = (public_key, user_id, key_id, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def invalidate(self, public_key: str) -> None:
+        stale = [key for key, entry in self._entries.items() if entry[0] == public_key]
+        for key in stale:
+            del self._entries[key]
+        if stale:
+            logger.debug(f"Dropped {len(stale)} cached API key authentications for {public_key}")
+
+
+verified_token_cache = VerifiedTokenCache()
+api_key_cache = ApiKeyCache()
+
+
+async def publish_api_key_revocation(public_key: str) -> None:
+    """Drop the key from every process's cache, this one included."""
+    api_key_cache.invalidate(public_key)
+    try:
+        await redis.publish(API_KEY_REVOCATION_CHANNEL, public_key)
+    except Exception as e:
+        logger.warning(f"Failed to publish API key revocation for {public_key}: {e}")
+
+
+async def listen_for_api_key_revocations() -> None:
+    """Apply revocations published by other processes. Runs until cancelled."""
+    while True:
+        pubsub = None
+        try:
+            pubsub = await redis.create_pubsub()
+            await pubsub.subscribe(API_KEY_REVOCATION_CHANNEL)
+            # Revocations may have been missed while not subscribed
+            api_key_cache.clear()
+            async for message in pubsub.listen():
+                if message and message.get("type") == "message":
+                    api_key_cache.invalidate(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"API key revocation listener failed, resubscribing: {e}")
+            await asyncio.sleep(5)
+        finally:
+            if pubsub:
+                try:
+                    await pubsub.unsubscribe(API_KEY_REVOCATION_CHANNEL)
+                    await pubsub.close()
+                except Exception:
+                    pass
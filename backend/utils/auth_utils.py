@@ -11,6 +11,7 @@ import hashlib
 import hmac
 from services.supabase import DBConnection
 from services import redis
+from utils.auth_cache import verified_token_cache, api_key_cache
 
 async def verify_admin_api_key(x_admin_api_key: Optional[str] = Header(None)):
     if not config.KORTIX_ADMIN_API_KEY:
@@ -93,6 +94,22 @@ def _decode_jwt_safely(token: str) -> dict:
         )
         return jwt.decode(token, options={"verify_signature": False})
 
+def _get_user_id_from_token_cached(token: str) -> Optional[str]:
+    """
+    Verify a JWT and return its user ID (the 'sub' claim), skipping verification
+    for tokens that were already verified and have not expired.
+    
+    Raises:
+        PyJWTError: If token is invalid or signature verification fails
+    """
+    user_id = verified_token_cache.get(token)
+    if user_id:
+        return user_id
+    
+    payload = _decode_jwt_safely(token)
+    verified_token_cache.put(token, payload)
+    return payload.get('sub')
+
 async def _get_user_id_from_account_cached(account_id: str) -> Optional[str]:
     """
     Get user_id from account_id with Redis caching for performance
@@ -177,6 +194,18 @@ async def verify_and_get_user_id_from_jwt(request: Request) -> str:
             
             public_key, secret_key = x_api_key.split(':', 1)
             
+            cached = api_key_cache.get(x_api_key)
+            if cached:
+                user_id, key_id = cached
+                sentry.sentry.set_user({ "id": user_id })
+                structlog.contextvars.bind_contextvars(
+                    user_id=user_id,
+                    auth_method="api_key",
+                    api_key_id=key_id,
+                    public_key=public_key
+                )
+                return user_id
+            
             from services.api_keys import APIKeyService
             db = DBConnection()
             await db.initialize()
@@ -189,6 +218,7 @@ async def verify_and_get_user_id_from_jwt(request: Request) -> str:
                 user_id = await _get_user_id_from_account_cached(str(validation_result.account_id))
                 
                 if user_id:
+                    api_key_cache.put(x_api_key, public_key, user_id, str(validation_result.key_id))
                     sentry.sentry.set_user({ "id": user_id })
                     structlog.contextvars.bind_contextvars(
                         user_id=user_id,
@@ -232,8 +262,7 @@ async def verify_and_get_user_id_from_jwt(request: Request) -> str:
     token = auth_header.split(' ')[1]
     
     try:
-        payload = _decode_jwt_safely(token)
-        user_id = payload.get('sub')
+        user_id = _get_user_id_from_token_cached(token)
         
         if not user_id:
             raise HTTPException(
@@ -293,8 +322,7 @@ async def get_user_id_from_stream_auth(
         if token:
             try:
                 # For Supabase JWT, verify signature and extract the user ID
-                payload = _decode_jwt_safely(token)
-                user_id = payload.get('sub')
+                user_id = _get_user_id_from_token_cached(token)
                 if user_id:
                     sentry.sentry.set_user({ "id": user_id })
                     structlog.contextvars.bind_contextvars(
@@ -350,10 +378,8 @@ async def get_optional_user_id(request: Request) -> Optional[str]:
     
     try:
         # For Supabase JWT, verify signature and extract the user ID
-        payload = _decode_jwt_safely(token)
-        
         # Supabase stores the user ID in the 'sub' claim
-        user_id = payload.get('sub')
+        user_id = _get_user_id_from_token_cached(token)
         if user_id:
             sentry.sentry.set_user({ "id": user_id })
             structlog.contextvars.bind_contextvars(
@@ -285,6 +285,10 @@ class Configuration:
     REDIS_PORT: int = 6379
     REDIS_PASSWORD: Optional[str] = None
     REDIS_SSL: bool = True
+
+    # Agent run response transport: "stream" (Redis Streams) or "list" (list + pub/sub)
+    AGENT_RESPONSE_TRANSPORT: str = "stream"
+    AGENT_RESPONSE_STREAM_MAXLEN: int = 50000
     
     # Daytona sandbox configuration
     DAYTONA_API_KEY: str
@@ -324,6 +328,14 @@ class Configuration:
     # API Keys system configuration
     API_KEY_SECRET: str = "default-secret-key-change-in-production"
     API_KEY_LAST_USED_THROTTLE_SECONDS: int = 900
+
+    # Share parsed thread message snapshots between workers through Redis
+    THREAD_MESSAGE_CACHE_REDIS: bool = False
+
+    # Route LLM calls to the fastest healthy equivalent deployment (services.llm_routing)
+    LLM_LATENCY_ROUTING: bool = True
+    # Race a second deployment when the first token is late
+    LLM_HEDGING: bool = False
     
     # Agent execution limits (can be overridden via environment variable)
     _MAX_PARALLEL_AGENT_RUNS_ENV: Optional[str] = None
@@ -25,10 +25,11 @@ class PaginationParams:
     page: int = 1
     page_size: int = 20
     cursor: Optional[str] = None
+    max_page_size: int = 100
     
     def __post_init__(self):
         self.page = max(1, self.page)
-        self.page_size = min(max(1, self.page_size), 100)
+        self.page_size = min(max(1, self.page_size), self.max_page_size)
 
 class PaginationService:
     @staticmethod
@@ -159,6 +160,84 @@ class PaginationService:
             pagination=pagination_meta
         )
 
+    @staticmethod
+    async def paginate_keyset_query(
+        base_query: Any,
+        params: PaginationParams,
+        sort_field: str,
+        id_field: str,
+        desc: bool = True,
+        count_query: Optional[Any] = None
+    ) -> PaginatedResponse[Dict[str, Any]]:
+        """
+        Paginate by (sort_field, id_field) instead of OFFSET.
+        With params.cursor set, the page starts right after the cursor row, so
+        the database seeks on the sort index instead of skipping rows; without
+        it, params.page is used as an offset. next_cursor points at the last
+        row of the page. base_query must not be ordered or ranged yet.
+        """
+        try:
+            cursor = PaginationService.parse_cursor(params.cursor) if params.cursor else None
+            if params.cursor and (not cursor or cursor.get('sort_field') != sort_field):
+                raise ValueError("Invalid pagination cursor")
+
+            total_count = None
+            if count_query:
+                count_result = await count_query.execute()
+                total_count = count_result.count if count_result.count else 0
+
+            query = base_query
+            if cursor:
+                op = 'lt' if desc else 'gt'
+                sort_value = PaginationService._quote_filter_value(cursor['sort_value'])
+                item_id = PaginationService._quote_filter_value(cursor['id'])
+                query = query.or_(
+                    f"{sort_field}.{op}.{sort_value},"
+                    f"and({sort_field}.eq.{sort_value},{id_field}.{op}.{item_id})"
+                )
+            query = query.order(sort_field, desc=desc).order(id_field, desc=desc)
+
+            # Fetch one extra row to know whether there is a next page
+            offset = 0 if cursor else (params.page - 1) * params.page_size
+            data_result = await query.range(offset, offset + params.page_size).execute()
+            rows = data_result.data or []
+            has_next = len(rows) > params.page_size
+            items = rows[:params.page_size]
+
+            next_cursor = None
+            if has_next and items:
+                last = items[-1]
+                next_cursor = PaginationService.create_cursor(last[id_field], sort_field, last[sort_field])
+
+            if total_count is None:
+                total_count = offset + len(items) + (1 if has_next else 0)
+            total_pages = max(1, math.ceil(total_count / params.page_size)) if total_count else 0
+
+            pagination_meta = PaginationMeta(
+                current_page=params.page,
+                page_size=params.page_size,
+                total_items=total_count,
+                total_pages=total_pages,
+                has_next=has_next,
+                has_previous=bool(cursor) or params.page > 1,
+                next_cursor=next_cursor
+            )
+
+            return PaginatedResponse(
+                data=items,
+                pagination=pagination_meta
+            )
+
+        except Exception as e:
+            logger.error(f"Keyset pagination error: {e}", exc_info=True)
+            raise
+
+    @staticmethod
+    def _quote_filter_value(value: Any) -> str:
+        # Double quotes keep PostgREST from splitting values on reserved characters
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"')
+        return f'"{escaped}"'
+
     @staticmethod
     def create_cursor(item_id: str, sort_field: str, sort_value: Any) -> str:
         import base64
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Rebuild the monthly usage totals used for billing checks.
+
+Each account's usage for the current month is kept as a running total in
+Redis and incremented as assistant responses are recorded. This script
+recomputes totals from the messages table, e.g. after a pricing change or a
+Redis flush.
+
+Usage:
+    python rebuild_usage_aggregates.py <account_id> [<account_id> ...]
+    python rebuild_usage_aggregates.py --all    # Rebuild every total that exists for this month
+"""
+
+import asyncio
+import argparse
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Add the backend directory to the path so we can import modules
+backend_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from services import redis
+from services.billing import rebuild_monthly_usage
+from services.supabase import DBConnection
+from utils.logger import logger
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Rebuild monthly usage totals from the messages table",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__
+    )
+    parser.add_argument('account_ids', nargs='*', help='Account IDs to rebuild')
+    parser.add_argument('--all', action='store_true', help='Rebuild all existing totals for the current month')
+    args = parser.parse_args()
+
+    if not args.account_ids and not args.all:
+        parser.print_help()
+        return
+
+    account_ids = list(args.account_ids)
+    try:
+        await redis.initialize_async()
+        db = DBConnection()
+        await db.initialize()
+        client = await db.client
+
+        if args.all:
+            month = datetime.now(timezone.utc).strftime('%Y-%m')
+            keys = await redis.keys(f"monthly_usage_total:*:{month}")
+            account_ids.extend(key.split(':')[1] for key in keys)
+
+        print(f"Rebuilding monthly usage for {len(account_ids)} accounts")
+        for account_id in dict.fromkeys(account_ids):
+            total = await rebuild_monthly_usage(client, account_id)
+            print(f"✓ {account_id}: ${total:.4f}")
+
+    except KeyboardInterrupt:
+        print("\n⚠️  Operation cancelled by user")
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+        logger.error(f"Script error: {str(e)}")
+    finally:
+        await redis.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())